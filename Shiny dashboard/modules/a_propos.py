@@ -1,9 +1,10 @@
 # modules/a_propos.py
 
 import os
-import pandas as pd
 from shiny import ui, render
 
+from .ingest import read_excel_cached
+
 def a_propos_ui(cycle_options):
     """
     Layout/UI for the 'À Propos' page.
@@ -155,7 +156,7 @@ def a_propos_server(input, output, session, data_dir):
     We do NOT call set_choices here; the cycles are already set in the UI from main.py.
     """
     # 1) Load the cycle data to get the "Période de collecte" column and so on
-    df_cycle = pd.read_excel(os.path.join(data_dir, "cycle_data.xlsx"))
+    df_cycle = read_excel_cached(os.path.join(data_dir, "cycle_data.xlsx"))
 
     # 2) Helper: retrieve row for the currently selected cycle
     def get_selected_cycle_info():
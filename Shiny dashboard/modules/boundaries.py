@@ -0,0 +1,231 @@
+# modules/boundaries.py
+
+import os
+import json
+import hashlib
+import logging
+
+SHAPEFILE_DIR = os.path.join(os.path.dirname(__file__), 'data', 'Shapefiles', 'hti_adm_cnigs_20181129')
+
+# Static files of the app (served at the root of its URL)
+WWW_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'www')
+BOUNDARIES_DIR = os.path.join(WWW_DIR, 'boundaries')
+BOUNDARIES_URL = 'boundaries'
+
+# Admin level -> shapefile (country, departments, communes, communal sections)
+SHAPEFILES = {
+    'adm0': 'hti_admbnda_adm0_cnigs_20181129.shp',
+    'adm1': 'hti_admbnda_adm1_cnigs_20181129.shp',
+    'adm2': 'hti_admbnda_adm2_cnigs_20181129.shp',
+    'adm3': 'hti_admbnda_adm3_cnigs_20181129.shp',
+}
+
+# Admin level -> simplification tolerance in degrees of its outlines. The tolerances are
+# about half a screen pixel at the zoom from which each level is looked at: zoom 9 for
+# the country and departments (1 px ~ 0.0027°), zoom 11 for the communes (1 px ~ 0.0007°).
+BOUNDARY_LEVELS = {
+    'adm0': 0.0013,
+    'adm1': 0.0013,
+    'adm2': 0.0003,
+}
+
+# Admin level -> simplification tolerance of its polygons, shaded by the choropleth of the map.
+# Fills are looked at from further away than outlines: about a screen pixel at zoom 8 for the
+# departments (1 px ~ 0.0055°) and at zoom 9 for the communes and communal sections.
+AREA_LEVELS = {
+    'adm1': 0.004,
+    'adm2': 0.002,
+    'adm3': 0.002,
+}
+
+# Decimals kept of the coordinates (4 decimals ~ 11 m)
+COORDINATE_DECIMALS = 4
+
+
+def read_boundaries(level, shapefile_dir=SHAPEFILE_DIR):
+    """Read the polygons of an admin level of SHAPEFILES (e.g. 'adm2') as a GeoDataFrame in WGS 84."""
+    # Imported here, so that importing the modules does not load geopandas
+    import geopandas as gpd
+
+    gdf = gpd.read_file(os.path.join(shapefile_dir, SHAPEFILES[level]))
+    return gdf.to_crs("EPSG:4326") if gdf.crs is not None else gdf
+
+
+def unit_columns(level):
+    """Return the code and French name columns of the units of an admin level (e.g. 'ADM2_PCODE', 'ADM2_FR')."""
+    prefix = level.upper()
+    return f"{prefix}_PCODE", f"{prefix}_FR"
+
+
+def assign_admin_units(longitudes, latitudes, shapefile_dir=SHAPEFILE_DIR):
+    """
+    Find the communal section, commune and department of points, with a spatial index.
+
+    The points are looked up in an STRtree of the communal sections (adm3), which
+    also carry the codes and names of their commune and department. Points in no
+    section (e.g. markets on the coast, outside the simplified shoreline of the
+    shapefile) get the nearest section.
+
+    Parameters:
+    - longitudes, latitudes (array-like): Coordinates of the points in WGS 84.
+    - shapefile_dir (str): Folder of the shapefiles.
+
+    Returns:
+    - units (pd.DataFrame): One row per point with the columns '<level>_pcode' and
+      '<level>_name' of 'adm1', 'adm2' and 'adm3'.
+    """
+    import numpy as np
+    import pandas as pd
+    from shapely import STRtree, points
+
+    sections = read_boundaries('adm3', shapefile_dir)
+    tree = STRtree(sections.geometry.to_numpy())
+    locations = points(np.asarray(longitudes, dtype=float), np.asarray(latitudes, dtype=float))
+
+    # Index of the section of each point; a point on a border gets the first section found
+    section = np.full(len(locations), -1)
+    point_index, section_index = tree.query(locations, predicate='within')
+    section[point_index[::-1]] = section_index[::-1]
+    outside = np.flatnonzero(section < 0)
+    if len(outside):
+        nearest_point, nearest_section = tree.query_nearest(locations[outside], all_matches=False)
+        section[outside[nearest_point]] = nearest_section
+        logging.info(f"{len(outside)} points outside the communal sections were given the nearest one")
+
+    units = {}
+    for level in ('adm1', 'adm2', 'adm3'):
+        pcode_column, name_column = unit_columns(level)
+        units[f"{level}_pcode"] = sections[pcode_column].to_numpy()[section]
+        units[f"{level}_name"] = sections[name_column].to_numpy()[section]
+    return pd.DataFrame(units)
+
+
+def boundary_lines(gdf, tolerance):
+    """
+    Return the outlines of the polygons of `gdf` as simplified lines.
+
+    Borders shared by two polygons are kept once and simplified once, so that
+    neighbouring units still meet exactly after simplification (the ends of
+    each border, where three units meet, are never moved).
+
+    Parameters:
+    - gdf (gpd.GeoDataFrame): The polygons of an admin level.
+    - tolerance (float): Maximum distance in degrees between a line and its simplification.
+
+    Returns:
+    - lines (shapely geometry): A (Multi)LineString.
+    """
+    from shapely import line_merge, unary_union
+
+    lines = line_merge(unary_union(gdf.geometry.boundary.to_numpy()))
+    return lines.simplify(tolerance, preserve_topology=True)
+
+
+def _quantise(coordinates, decimals):
+    if isinstance(coordinates[0], (int, float)):
+        return [round(c, decimals) for c in coordinates]
+    return [_quantise(c, decimals) for c in coordinates]
+
+
+def boundary_geojson(lines, decimals=COORDINATE_DECIMALS):
+    """
+    Serialise boundary lines as a compact GeoJSON FeatureCollection.
+
+    Coordinates are rounded to `decimals` and the JSON has no whitespace.
+
+    Returns:
+    - geojson (str)
+    """
+    from shapely.geometry import mapping
+
+    geometry = mapping(lines)
+    geometry = {'type': geometry['type'], 'coordinates': _quantise(geometry['coordinates'], decimals)}
+    collection = {'type': 'FeatureCollection',
+                  'features': [{'type': 'Feature', 'properties': {}, 'geometry': geometry}]}
+    return json.dumps(collection, separators=(',', ':'))
+
+
+def area_geojson(gdf, level, tolerance, decimals=COORDINATE_DECIMALS):
+    """
+    Serialise the polygons of an admin level, simplified, as a compact GeoJSON FeatureCollection.
+
+    The polygons are simplified together (shapely.coverage_simplify), so that
+    neighbouring units keep sharing their borders, without gaps or overlaps.
+    Each feature has the code ('pcode') and French name ('name') of its unit.
+
+    Returns:
+    - geojson (str)
+    """
+    from shapely import coverage_simplify
+    from shapely.geometry import mapping
+
+    pcode_column, name_column = unit_columns(level)
+    polygons = coverage_simplify(gdf.geometry.to_numpy(), tolerance)
+    features = []
+    for polygon, pcode, name in zip(polygons, gdf[pcode_column], gdf[name_column]):
+        geometry = mapping(polygon)
+        features.append({
+            'type': 'Feature',
+            'properties': {'pcode': pcode, 'name': name},
+            'geometry': {'type': geometry['type'], 'coordinates': _quantise(geometry['coordinates'], decimals)},
+        })
+    return json.dumps({'type': 'FeatureCollection', 'features': features}, separators=(',', ':'))
+
+
+def _asset_names():
+    """Return the name of every static file of boundaries: the outlines, then the polygons of the choropleth."""
+    return list(BOUNDARY_LEVELS) + [f"{level}_areas" for level in AREA_LEVELS]
+
+
+def build_boundary_assets(shapefile_dir=SHAPEFILE_DIR, out_dir=BOUNDARIES_DIR):
+    """
+    Simplify the outlines of every level of BOUNDARY_LEVELS, and the polygons of every
+    level of AREA_LEVELS, and write them as static files.
+
+    Run once offline (`python -m modules.boundaries`), or by boundary_urls when a file is missing.
+
+    Returns:
+    - sizes (dict): {file name: size of the written file in bytes}, e.g. {'adm2': ..., 'adm2_areas': ...}.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    geojsons = {}
+    for level, tolerance in BOUNDARY_LEVELS.items():
+        geojsons[level] = boundary_geojson(boundary_lines(read_boundaries(level, shapefile_dir), tolerance))
+    for level, tolerance in AREA_LEVELS.items():
+        geojsons[f"{level}_areas"] = area_geojson(read_boundaries(level, shapefile_dir), level, tolerance)
+
+    sizes = {}
+    for name, geojson in geojsons.items():
+        path = os.path.join(out_dir, f"{name}.geojson")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(geojson)
+        sizes[name] = len(geojson)
+        logging.info(f"Boundaries {name}: {len(geojson) / 1000:.0f} kB written to {path}")
+    return sizes
+
+
+def boundary_urls(out_dir=BOUNDARIES_DIR):
+    """
+    Return the URL of every static file of boundaries, building the files if needed.
+
+    Each URL carries a hash of its file, so that browsers can keep the file until it changes.
+
+    Returns:
+    - urls (dict): {file name: URL relative to the page of the app}, e.g.
+      {'adm2': 'boundaries/adm2.geojson?v=1a2b3c4d', 'adm2_areas': ...}.
+    """
+    paths = {name: os.path.join(out_dir, f"{name}.geojson") for name in _asset_names()}
+    if not all(os.path.exists(path) for path in paths.values()):
+        build_boundary_assets(out_dir=out_dir)
+
+    urls = {}
+    for name, path in paths.items():
+        with open(path, 'rb') as f:
+            digest = hashlib.sha1(f.read()).hexdigest()[:8]
+        urls[name] = f"{BOUNDARIES_URL}/{name}.geojson?v={digest}"
+    return urls
+
+
+if __name__ == "__main__":
+    for name, size in build_boundary_assets().items():
+        print(f"{name}: {size / 1000:.0f} kB")
@@ -0,0 +1,61 @@
+# modules/build.py
+
+import os
+import sys
+import time
+import logging
+
+from .data_registry import published_views
+from .bundle import use_bundles, write_bundle, bundle_dir
+from .boundaries import build_boundary_assets
+from .prix_median import load_prix_median_data, get_prix_median_choices
+from .meb import load_meb_data, get_meb_choices
+from .indicateurs_non_tarifaire import load_indicateurs_data, indicateurs_index, get_cycle_choices
+from .map import DATA_DIR, start_map_data
+
+
+def build_bundle(DATA_DIR=DATA_DIR):
+    """
+    Run every loader of the dashboard once and write the result as the bundle of DATA_DIR.
+
+    The bundle holds the views of every tab, with their pivot cubes, filter
+    index, choices, and the markets of the map with their GeoJSON, colour bins
+    and legends (see bundle.write_bundle). The simplified boundaries of the
+    map are written to www/boundaries at the same time. When the server
+    starts, the views are read from the bundle as long as the workbooks and
+    the code are unchanged, instead of being built again.
+
+    Parameters:
+    - DATA_DIR (str): The directory where the Excel data files are located.
+
+    Returns:
+    - manifest (dict): The manifest of the bundle (see bundle.write_bundle).
+    """
+    # The views are built from the workbooks, never read back from the current bundle
+    use_bundles(False)
+    build_boundary_assets()
+
+    _, df_filtered = load_prix_median_data(DATA_DIR)
+    get_prix_median_choices(df_filtered)
+
+    get_meb_choices(load_meb_data(DATA_DIR))
+
+    df_indicateurs = load_indicateurs_data(DATA_DIR)
+    get_cycle_choices(df_indicateurs)
+    indicateurs_index(df_indicateurs)
+
+    # Markets, colour bins, GeoJSON of every cycle and scores of the admin units
+    start_map_data(DATA_DIR).result()
+
+    return write_bundle(DATA_DIR, published_views(DATA_DIR))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    data_dir = sys.argv[1] if len(sys.argv) > 1 else DATA_DIR
+    start = time.perf_counter()
+    manifest = build_bundle(data_dir)
+    out_dir = bundle_dir(data_dir)
+    size = sum(os.path.getsize(os.path.join(out_dir, f)) for f in os.listdir(out_dir))
+    print(f"Bundle of {len(manifest['views'])} views ({', '.join(manifest['views'])}) written to {out_dir}: "
+          f"{size / 1e6:.1f} MB in {time.perf_counter() - start:.1f} s")
@@ -0,0 +1,344 @@
+# modules/bundle.py
+
+import os
+import json
+import glob
+import pickle
+import shutil
+import hashlib
+import logging
+import threading
+from datetime import datetime, timezone
+
+import pandas as pd
+import pyarrow as pa
+
+from .ingest import CACHE_DIR_NAME, LOADER_VERSION, file_hash
+from .boundaries import SHAPEFILE_DIR, SHAPEFILES
+from .data_registry import directory_signature, derived, derived_structures
+
+# Bump this whenever the layout of the bundle changes, so that older bundles are ignored
+BUNDLE_VERSION = 1
+
+# The bundle of a data directory lives in its '.cache' directory, e.g. 'data/.cache/bundle-v1'
+BUNDLE_DIR_NAME = f"bundle-v{BUNDLE_VERSION}"
+MANIFEST_NAME = 'manifest.json'
+
+MODULES_DIR = os.path.dirname(__file__)
+
+_state = {'enabled': True}
+
+# Data directory -> opened bundle (see open_bundle), or None when it has no usable bundle
+_bundles = {}
+_lock = threading.RLock()
+
+
+def bundle_dir(DATA_DIR):
+    """Return the folder of the bundle of DATA_DIR (see build.build_bundle)."""
+    return os.path.join(DATA_DIR, CACHE_DIR_NAME, BUNDLE_DIR_NAME)
+
+
+def use_bundles(enabled):
+    """Read the views from the bundles (the default), or always build them from the workbooks."""
+    _state['enabled'] = enabled
+
+
+def source_hashes(DATA_DIR):
+    """
+    Return the content hash of everything the views of DATA_DIR are built from.
+
+    These are the workbooks of DATA_DIR, the shapefile of the communal sections
+    (which the markets are located in) and the code of the modules: a bundle
+    is only read while all of them are unchanged.
+
+    Returns:
+    - hashes (dict): {source: hash}, e.g. {'cycle_1_ICSM_analyse.xlsx': '3f2a...', ..., 'modules': '...'}.
+    """
+    hashes = {f: file_hash(os.path.join(DATA_DIR, f)) for f in sorted(directory_signature(DATA_DIR))}
+    hashes[SHAPEFILES['adm3']] = file_hash(os.path.join(SHAPEFILE_DIR, SHAPEFILES['adm3']))
+    code = hashlib.blake2b(digest_size=16)
+    for path in sorted(glob.glob(os.path.join(MODULES_DIR, '*.py'))):
+        code.update(os.path.basename(path).encode('utf-8'))
+        code.update(file_hash(path).encode('ascii'))
+    hashes['modules'] = code.hexdigest()
+    return hashes
+
+
+# --- Writing ---
+
+def _column_buffer(series):
+    """Return the array holding the values of a column (the codes of a categorical)."""
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return series.cat.codes.to_numpy()
+    return series.to_numpy()
+
+
+def _same_column(a, b):
+    """Return whether two columns hold the very same memory (e.g. a view derived with data_registry.derive_view)."""
+    if a.dtype != b.dtype:
+        return False
+    if isinstance(a.dtype, pd.CategoricalDtype) and not a.cat.categories.equals(b.cat.categories):
+        return False
+    x, y = _column_buffer(a), _column_buffer(b)
+    return (x.shape == y.shape and x.strides == y.strides
+            and x.__array_interface__['data'][0] == y.__array_interface__['data'][0])
+
+
+def _write_table(path, frame):
+    table = pa.Table.from_pandas(frame, preserve_index=True)
+    with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+
+
+def _write_frame(out_dir, part_name, frame, written):
+    """
+    Write a view as an Arrow file, without the columns it shares with a frame written before.
+
+    Parameters:
+    - out_dir (str): Folder of the bundle being written.
+    - part_name (str): Name of the view, and of its position in a tuple view (e.g. 'prix_median.1').
+    - frame (pd.DataFrame): The view.
+    - written (dict): {part name: frame} of the frames written before, updated.
+
+    Returns:
+    - entry (dict): The entry of the manifest: {'table': file, 'columns': names in order,
+      'shared': {part name: names of the columns taken from it}}.
+    """
+    shared = {}
+    own = []
+    for column in frame.columns:
+        source = next((name for name, other in written.items()
+                       if column in other.columns and other.index.equals(frame.index)
+                       and _same_column(frame[column], other[column])), None)
+        if source is None:
+            own.append(column)
+        else:
+            shared.setdefault(source, []).append(column)
+
+    table = f"{part_name}.arrow"
+    _write_table(os.path.join(out_dir, table), frame[own])
+    written[part_name] = frame
+    return {'table': table, 'columns': [str(c) for c in frame.columns], 'shared': shared}
+
+
+class _Pickler(pickle.Pickler):
+    """Pickle the derived structures, writing the views they refer to as references to their Arrow files."""
+
+    def __init__(self, file, parts):
+        super().__init__(file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.parts = parts
+
+    def persistent_id(self, obj):
+        part = self.parts.get(id(obj))
+        return part[0] if part is not None and part[1] is obj else None
+
+
+def write_bundle(DATA_DIR, views):
+    """
+    Write views of DATA_DIR, and the structures derived from them, as the bundle of DATA_DIR.
+
+    Each DataFrame of a view is written as an Arrow file. Columns shared by two
+    views (e.g. those of the ICSM base frame, see data_registry.derive_view)
+    are written once and shared again when the bundle is read. The structures
+    derived from each view (pivot cubes, filter indexes, choices, map
+    legends...; see data_registry.derived) are pickled. The manifest records
+    the files of each view and the hashes of the sources (see source_hashes).
+
+    The bundle is written aside and then moved into place, replacing the previous one.
+
+    Parameters:
+    - DATA_DIR (str): The directory where the Excel data files are located.
+    - views (dict): {view name: view}, as returned by data_registry.published_views.
+
+    Returns:
+    - manifest (dict): The manifest of the bundle.
+    """
+    out_dir = bundle_dir(DATA_DIR)
+    tmp_dir = f"{out_dir}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    # id() of every DataFrame of a view -> (part name, frame)
+    parts = {}
+    for name, view in views.items():
+        for position, part in enumerate(view if isinstance(view, tuple) else (view,)):
+            if isinstance(part, pd.DataFrame):
+                parts[id(part)] = (f"{name}.{position}", part)
+
+    written = {}
+    manifest_views = {}
+    for name, view in views.items():
+        view_parts = view if isinstance(view, tuple) else (view,)
+        entries = []
+        for position, part in enumerate(view_parts):
+            if not isinstance(part, pd.DataFrame):
+                raise TypeError(f"View '{name}' holds a {type(part).__name__}: only DataFrames can be bundled")
+            entries.append(_write_frame(tmp_dir, f"{name}.{position}", part, written))
+
+        structures = {position: derived_structures(part) for position, part in enumerate(view_parts)}
+        structures_file = None
+        if any(structures.values()):
+            structures_file = f"{name}.pickle"
+            with open(os.path.join(tmp_dir, structures_file), 'wb') as f:
+                _Pickler(f, parts).dump(structures)
+        manifest_views[name] = {'tuple': isinstance(view, tuple), 'parts': entries,
+                                'structures': {str(p): sorted(s) for p, s in structures.items() if s},
+                                'structures_file': structures_file}
+
+    manifest = {
+        'bundle_version': BUNDLE_VERSION,
+        'loader_version': LOADER_VERSION,
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'sources': source_hashes(DATA_DIR),
+        'views': manifest_views,
+    }
+    with open(os.path.join(tmp_dir, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=1)
+
+    old_dir = f"{out_dir}.{os.getpid()}.old"
+    if os.path.exists(out_dir):
+        os.replace(out_dir, old_dir)
+    os.replace(tmp_dir, out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+    with _lock:
+        _bundles.pop(os.path.abspath(DATA_DIR), None)
+    return manifest
+
+
+# --- Reading ---
+
+def open_bundle(DATA_DIR):
+    """
+    Return the bundle of DATA_DIR if it is up to date, checked once per process.
+
+    A bundle written by an older version of its layout, or from other
+    workbooks, shapefiles or code, is ignored: the views are then built from
+    the workbooks as usual.
+
+    Returns:
+    - bundle (dict): {'dir', 'manifest', 'parts': {part name: frame}, 'views': {view name: view}},
+      or None.
+    """
+    key = os.path.abspath(DATA_DIR)
+    with _lock:
+        if key not in _bundles:
+            _bundles[key] = _open_bundle(key)
+        return _bundles[key]
+
+
+def _open_bundle(DATA_DIR):
+    path = os.path.join(bundle_dir(DATA_DIR), MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable bundle manifest {path}: {e}")
+        return None
+
+    if manifest.get('bundle_version') != BUNDLE_VERSION:
+        logging.info(f"Ignoring the bundle of {DATA_DIR}: written by bundle version {manifest.get('bundle_version')}")
+        return None
+    sources = source_hashes(DATA_DIR)
+    changed = sorted(s for s in set(sources) | set(manifest['sources']) if sources.get(s) != manifest['sources'].get(s))
+    if changed:
+        logging.info(f"Ignoring the bundle of {DATA_DIR}, built before changes to: {', '.join(changed)}. "
+                     f"Rebuild it with `python -m modules.build`.")
+        return None
+
+    logging.info(f"Reading the views of {DATA_DIR} from its bundle (built {manifest['created']})")
+    return {'dir': os.path.dirname(path), 'manifest': manifest, 'parts': {}, 'views': {}}
+
+
+def _read_frame(bundle, entry):
+    """
+    Read a DataFrame of a view from its Arrow IPC file, sharing the columns it was written without.
+
+    The file is mapped only while it is read: to_pandas copies its columns,
+    so the frames stay writable and the bundle can be rebuilt while the app runs.
+    """
+    with pa.memory_map(os.path.join(bundle['dir'], entry['table'])) as source:
+        own = pa.ipc.open_file(source).read_all().to_pandas()
+    if not entry['shared']:
+        return own
+
+    # The shared columns keep their memory: they come with a shallow copy of their frame
+    sources = list(entry['shared'].items())
+    first, first_columns = sources[0]
+    frame = _read_part(bundle, first).copy(deep=False)
+    for column in [c for c in frame.columns if c not in first_columns]:
+        del frame[column]
+    for source, columns in sources[1:]:
+        other = _read_part(bundle, source)
+        for column in columns:
+            frame[column] = other[column]
+    for column in own.columns:
+        frame.insert(min(entry['columns'].index(str(column)), len(frame.columns)), column, own[column])
+
+    if [str(c) for c in frame.columns] != entry['columns']:
+        by_name = {str(c): c for c in frame.columns}
+        frame = frame[[by_name[name] for name in entry['columns']]]
+    return frame
+
+
+def _read_part(bundle, part_name):
+    with _lock:
+        if part_name not in bundle['parts']:
+            name, position = part_name.rsplit('.', 1)
+            entry = bundle['manifest']['views'][name]['parts'][int(position)]
+            bundle['parts'][part_name] = _read_frame(bundle, entry)
+        return bundle['parts'][part_name]
+
+
+class _Unpickler(pickle.Unpickler):
+    def __init__(self, file, bundle):
+        super().__init__(file)
+        self.bundle = bundle
+
+    def persistent_load(self, pid):
+        return _read_part(self.bundle, pid)
+
+
+def _read_view(bundle, name):
+    with _lock:
+        if name in bundle['views']:
+            return bundle['views'][name]
+        entry = bundle['manifest']['views'][name]
+        parts = tuple(_read_part(bundle, f"{name}.{position}") for position in range(len(entry['parts'])))
+        view = parts if entry['tuple'] else parts[0]
+        bundle['views'][name] = view
+
+        if entry['structures_file'] is not None:
+            with open(os.path.join(bundle['dir'], entry['structures_file']), 'rb') as f:
+                structures = _Unpickler(f, bundle).load()
+            # Attached as they were computed (see data_registry.derived)
+            for position, by_name in structures.items():
+                for structure_name, structure in by_name.items():
+                    derived(parts[position], structure_name, lambda _, s=structure: s)
+        return view
+
+
+def bundled_view(DATA_DIR, name):
+    """
+    Return the view `name` of DATA_DIR read from its bundle, with the structures derived from it.
+
+    Parameters:
+    - DATA_DIR (str): The directory where the Excel data files are located.
+    - name (str): Name of the view (e.g. 'prix_median').
+
+    Returns:
+    - The view, or None if bundles are disabled, DATA_DIR has no up-to-date
+      bundle or the bundle does not have the view.
+    """
+    if not _state['enabled']:
+        return None
+    bundle = open_bundle(DATA_DIR)
+    if bundle is None or name not in bundle['manifest']['views']:
+        return None
+    try:
+        return _read_view(bundle, name)
+    except Exception as e:
+        logging.warning(f"Could not read the view '{name}' from the bundle of {DATA_DIR}, building it instead: {e}")
+        return None
@@ -0,0 +1,97 @@
+# modules/comparison.py
+
+import numpy as np
+import pandas as pd
+
+# Value of the "Comparer avec" dropdown meaning "the cycle before the selected one"
+PREVIOUS_CYCLE = 'previous'
+
+
+def cycle_number(cycle):
+    """Return N for a cycle name like 'cycle_N'."""
+    return int(str(cycle).replace('cycle_', ''))
+
+
+def comparison_choices(cycle_choices):
+    """
+    Return the choices of a "Comparer avec" dropdown as {value: label}.
+
+    Parameters:
+    - cycle_choices (list): Cycle names such as ['cycle_1', 'cycle_2'].
+
+    Returns:
+    - choices (dict): The previous cycle first, then every cycle.
+    """
+    choices = {PREVIOUS_CYCLE: 'Cycle précédent'}
+    for cycle in sorted(cycle_choices, key=cycle_number):
+        choices[cycle] = f"Cycle {cycle_number(cycle)}"
+    return choices
+
+
+def baseline_cycle(current_cycle, baseline=None):
+    """
+    Return the cycle that `current_cycle` is compared with.
+
+    Parameters:
+    - current_cycle (str): The selected cycle, e.g. 'cycle_3'.
+    - baseline (str): A cycle name, or None / PREVIOUS_CYCLE for the previous cycle.
+
+    Returns:
+    - str: The baseline cycle, or None when there is nothing to compare with
+      (first cycle, or the baseline is the selected cycle itself).
+    """
+    if baseline in (None, '', PREVIOUS_CYCLE):
+        number = cycle_number(current_cycle)
+        return f"cycle_{number - 1}" if number > 1 else None
+    return baseline if baseline != current_cycle else None
+
+
+def percent_change(current, baseline, label):
+    """
+    Compute the percentage change from `baseline` to `current` for every cell of two pivots.
+
+    Both pivots are aligned on the union of their rows (sorted) and on the
+    columns of `current` that `baseline` also has. The change is computed on
+    whole arrays; cells where either value is missing or the baseline is zero
+    are left empty (NaN).
+
+    Parameters:
+    - current (pd.DataFrame): Pivot of the compared cycle (rows indexed by label).
+    - baseline (pd.DataFrame): Pivot of the baseline cycle, with the same layout.
+    - label (str): Name of the column holding the row labels (e.g. 'Produit', 'sector').
+
+    Returns:
+    - change (pd.DataFrame): The `label` column followed by one column of changes (in %) per shared column.
+    """
+    rows = sorted(set(current.index) | set(baseline.index))
+    baseline_columns = set(baseline.columns)
+    columns = [col for col in current.columns if col in baseline_columns]
+
+    curr = current.reindex(index=rows, columns=columns).to_numpy(dtype=float)
+    prev = baseline.reindex(index=rows, columns=columns).to_numpy(dtype=float)
+
+    change = np.full(curr.shape, np.nan)
+    valid = ~np.isnan(curr) & ~np.isnan(prev) & (prev != 0)
+    change[valid] = (curr[valid] - prev[valid]) / prev[valid] * 100
+    # Drop the float noise of currency conversions, so that equal prices still show no change
+    change = np.round(change, 9)
+
+    table = pd.DataFrame(change, columns=list(columns))
+    table.insert(0, label, rows)
+    return table
+
+
+def percent_changes(pivots, baseline, label):
+    """
+    Compare every cycle after `baseline` with it.
+
+    Parameters:
+    - pivots (dict): {cycle: pivot} as taken by percent_change.
+    - baseline (str): The baseline cycle, which must be a key of `pivots`.
+    - label (str): Name of the column holding the row labels.
+
+    Returns:
+    - changes (dict): {cycle: percent_change(pivots[cycle], pivots[baseline], label)}, by cycle order.
+    """
+    later = sorted((c for c in pivots if cycle_number(c) > cycle_number(baseline)), key=cycle_number)
+    return {cycle: percent_change(pivots[cycle], pivots[baseline], label) for cycle in later}
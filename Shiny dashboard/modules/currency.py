@@ -0,0 +1,115 @@
+# modules/currency.py
+
+import numpy as np
+import pandas as pd
+
+from .ingest import read_cycle_workbooks
+from .data_registry import get_view, derived
+
+# Currency in which every amount of the data is stored
+BASE_CURRENCY = 'HTG'
+
+# Currencies that can be shown, with their name in the UI
+CURRENCIES = {
+    'HTG': 'gourdes haïtiennes',
+    'USD': 'dollars américains',
+}
+
+# Decimals shown for the amounts of each currency (1 USD is worth about 130 HTG)
+CURRENCY_DECIMALS = {
+    'HTG': 0,
+    'USD': 2,
+}
+
+# Columns of the MEB workbooks holding the value of one unit of a currency, in HTG
+RATE_COLUMNS = {
+    'USD': 'USD_official',
+}
+
+RATES_SUFFIX = '_MEB_analyse.xlsx'
+
+
+def build_exchange_rates(df):
+    """
+    Build the exchange rates of every cycle from workbooks carrying rate columns.
+
+    The workbooks repeat the official rate of the cycle on every row; the median
+    of each cycle is kept.
+
+    Parameters:
+    - df (pd.DataFrame): Rows with a 'Cycle' column and the columns of RATE_COLUMNS.
+
+    Returns:
+    - rates (pd.DataFrame): Value of one unit of each currency in HTG, indexed by
+      'Cycle', one column per currency (BASE_CURRENCY first, always 1).
+    """
+    cycles = sorted(df['Cycle'].dropna().unique())
+    rates = pd.DataFrame({BASE_CURRENCY: 1.0}, index=pd.Index(cycles, name='Cycle'))
+    for currency, column in RATE_COLUMNS.items():
+        if column in df.columns:
+            rate = pd.to_numeric(df[column], errors='coerce').groupby(df['Cycle'], observed=True).median()
+            rates[currency] = rate.where(rate > 0).reindex(rates.index)
+    return rates
+
+
+def load_exchange_rates(DATA_DIR):
+    """Return the exchange rates of every cycle of DATA_DIR (see build_exchange_rates), read once."""
+    return get_view(DATA_DIR, 'exchange_rates',
+                    lambda d: build_exchange_rates(read_cycle_workbooks(d, RATES_SUFFIX)))
+
+
+def attach_exchange_rates(frame, rates):
+    """
+    Attach exchange rates to a view, for exchange_rates(frame) to return them.
+
+    Returns:
+    - frame (pd.DataFrame): The same DataFrame.
+    """
+    derived(frame, 'exchange_rates', lambda _: rates)
+    return frame
+
+
+def exchange_rates(frame):
+    """
+    Return the exchange rates attached to a view (see attach_exchange_rates).
+
+    A frame without attached rates can only be shown in BASE_CURRENCY.
+    """
+    return derived(frame, 'exchange_rates', lambda f: build_exchange_rates(f[['Cycle']]))
+
+
+def currency_choices(rates):
+    """Return the currencies with a rate for at least one cycle, BASE_CURRENCY first."""
+    return [currency for currency in rates.columns if rates[currency].notna().any()]
+
+
+def conversion_rate(rates, cycle, currency):
+    """Return the value of one unit of `currency` in HTG for a cycle, or NaN if it is unknown."""
+    if currency == BASE_CURRENCY:
+        return 1.0
+    if currency not in rates.columns or cycle not in rates.index:
+        return np.nan
+    return float(rates.at[cycle, currency])
+
+
+def convert_pivot(pivot, rates, cycle, currency):
+    """
+    Convert a pivot of amounts in HTG of a single cycle to `currency`.
+
+    Returns:
+    - pivot (pd.DataFrame): The converted pivot, or None if the rate of the cycle is unknown.
+    """
+    rate = conversion_rate(rates, cycle, currency)
+    if np.isnan(rate):
+        return None
+    return pivot if currency == BASE_CURRENCY else pivot / rate
+
+
+def relabel_currency(label, currency):
+    """Replace the '(HTG)' of a label (e.g. a product name) with the shown currency."""
+    return str(label).replace(f"({BASE_CURRENCY})", f"({currency})")
+
+
+def currency_title(currency):
+    """Return the name of a currency for titles, e.g. 'gourdes haïtiennes (HTG)'."""
+    return f"{CURRENCIES.get(currency, currency)} ({currency})"
@@ -0,0 +1,510 @@
+# modules/data_registry.py
+
+import os
+import logging
+import threading
+import weakref
+from concurrent.futures import Future
+
+import numpy as np
+import pandas as pd
+from shiny import reactive
+
+from .ingest import read_cycle_workbooks
+
+ICSM_SUFFIX = '_ICSM_analyse.xlsx'
+
+# Text columns with at most this share of distinct values are stored as categoricals
+CATEGORICAL_MAX_UNIQUE_RATIO = 0.5
+
+# Seconds between two checks of the data version by each session
+RELOAD_POLL_INTERVAL = 2
+
+# One entry per data directory:
+#   {'views': {view_name: object}, 'builders': {view_name: builder}, 'signature': {...}}
+# An entry is never modified once published: a reload builds a new entry and swaps it in.
+_registry = {}
+# Only held to look up and publish results: views and structures are built outside it
+_lock = threading.RLock()
+
+# Views and derived structures being built, by key (see _build_once) -> (Future, building thread)
+_pending = {}
+
+# Incremented each time new data is published, for any data directory
+_version = 0
+
+# id() of the published views (or elements of tuple views) ->
+#   (data directory, view name, position, object, first publication, data version)
+# The object is kept so that its id() cannot be reused. Views of the first load are
+# kept for the whole process since the app passes them to every new session.
+_origins = {}
+
+# Entries being built by reload_data in the current thread
+_local = threading.local()
+
+_watchers = {}
+
+# (id(frame), name) -> (weak reference to the frame, structure derived from it)
+_derived = {}
+
+
+def _key(DATA_DIR):
+    return os.path.abspath(DATA_DIR)
+
+
+def _new_entry(key):
+    return {'views': {}, 'builders': {}, 'signature': directory_signature(key)}
+
+
+def directory_signature(DATA_DIR):
+    """
+    Return {file name: (modification time, size)} for the Excel workbooks of DATA_DIR.
+
+    Used to detect new, modified or removed workbooks without reading them.
+    """
+    signature = {}
+    for f in os.listdir(DATA_DIR):
+        if f.endswith('.xlsx') and not f.startswith('~$'):
+            st = os.stat(os.path.join(DATA_DIR, f))
+            signature[f] = (st.st_mtime_ns, st.st_size)
+    return signature
+
+
+def data_version():
+    """Return a number that changes each time reloaded data is published."""
+    return _version
+
+
+def published_version(data):
+    """
+    Return the data version under which a view (or an element of a tuple view) was published.
+
+    Unlike data_version(), this is the version of the data a session actually
+    shows, which can lag behind for a few seconds after a reload (see live_view).
+    Objects that do not come from the registry get None.
+    """
+    origin = _origins.get(id(data))
+    return origin[5] if origin is not None and origin[3] is data else None
+
+
+def normalise_icsm(df):
+    """
+    Apply the normalisation shared by every tab built on the ICSM analyse workbooks.
+
+    Parameters:
+    - df (pd.DataFrame): The merged '_ICSM_analyse.xlsx' workbooks.
+
+    Returns:
+    - df (pd.DataFrame): The same DataFrame, normalised in place.
+    """
+    # Replace "Toute l'evaluation" with "Tout le pays" in 'Filtre' and 'Disag'
+    df['Filtre'] = df['Filtre'].replace({"Toute l'evaluation": 'Tout le pays'})
+    df['Disag'] = df['Disag'].replace({"Toute l'evaluation": 'Tout le pays'})
+    return df
+
+
+def memory_usage_mb(df):
+    """Return the memory used by a DataFrame, including the Python strings it holds, in MB."""
+    return df.memory_usage(deep=True).sum() / 1e6
+
+
+def compact_columns(df, max_unique_ratio=CATEGORICAL_MAX_UNIQUE_RATIO):
+    """
+    Store the repetitive text columns of a DataFrame as pandas categoricals.
+
+    The long-format workbooks repeat a handful of labels ('Sector', 'Filtre',
+    'Cycle', 'Indicator description'...) on every row. As categoricals each row
+    only holds an integer code, and comparisons such as df['Sector'] == 'ABNA'
+    compare codes instead of strings. Columns that are mostly unique
+    (e.g. 'analysis_key') are left as they are.
+
+    Parameters:
+    - df (pd.DataFrame): The DataFrame to compact, modified in place.
+    - max_unique_ratio (float): Maximum share of distinct values for a column to be converted.
+
+    Returns:
+    - df (pd.DataFrame): The same DataFrame.
+    """
+    for col in df.columns[df.dtypes == object]:
+        if df[col].nunique() <= max_unique_ratio * len(df):
+            df[col] = df[col].astype('category')
+    return df
+
+
+def map_categories(s, func):
+    """
+    Apply `func` to each distinct value of a Series instead of to each row.
+
+    Values mapped to the same result are merged into one category, and values
+    mapped to None become missing. Missing values are never passed to `func`.
+
+    Parameters:
+    - s (pd.Series): A categorical Series (other Series are converted first).
+    - func (callable): Function receiving a value and returning its new value.
+
+    Returns:
+    - pd.Series: A categorical Series with the same index and name as `s`.
+    """
+    if not isinstance(s.dtype, pd.CategoricalDtype):
+        s = s.astype('category')
+    renamed = s.cat.categories.map(func)
+    categories = renamed.dropna().unique()
+    # Old code -> new code, with a trailing -1 so that missing values (code -1) stay missing
+    lookup = np.append(categories.get_indexer(renamed), -1)
+    codes = lookup[s.cat.codes.to_numpy()]
+    return pd.Series(pd.Categorical.from_codes(codes, dtype=pd.CategoricalDtype(categories)),
+                     index=s.index, name=s.name)
+
+
+def build_icsm_base(DATA_DIR):
+    """Read all '*_ICSM_analyse.xlsx' workbooks of DATA_DIR, normalise and compact them."""
+    df = read_cycle_workbooks(DATA_DIR, ICSM_SUFFIX)
+    for col in ['Filtre', 'Disag']:
+        if col not in df.columns:
+            raise KeyError(f"Required column '{col}' is missing from the data.")
+    df = normalise_icsm(df)
+
+    # Convert after the merge: categoricals of different workbooks would concatenate back to strings
+    before = memory_usage_mb(df)
+    compact_columns(df)
+    n_categorical = sum(isinstance(dtype, pd.CategoricalDtype) for dtype in df.dtypes)
+    logging.info(f"ICSM base frame: {before:.1f} MB -> {memory_usage_mb(df):.1f} MB "
+                 f"({n_categorical} columns stored as categoricals)")
+    return df
+
+
+def get_icsm_base(DATA_DIR):
+    """
+    Return the normalised ICSM base frame of DATA_DIR.
+
+    All '*_ICSM_analyse.xlsx' workbooks are read and normalised once per process
+    (and again after a reload); later calls return the same DataFrame. The base
+    frame is shared by every view and must never be modified in place.
+    """
+    return get_view(DATA_DIR, 'icsm_base', build_icsm_base)
+
+
+def derive_view(base):
+    """
+    Return a shallow copy of `base` to which a view can add or replace columns.
+
+    Columns that the view does not reassign keep sharing their memory with the base frame.
+    """
+    return base.copy(deep=False)
+
+
+def _build_once(task, lookup, build, publish):
+    """
+    Return `lookup()`, or build and publish the missing result once across threads.
+
+    The first thread missing the result calls `build()` without holding the lock, so
+    that unrelated views and structures are built at the same time, then publishes
+    the result with `publish(result)` under the lock. Other threads asking for the
+    same key meanwhile wait for it instead of building it again.
+
+    Parameters:
+    - task (tuple): Key of the view or structure.
+    - lookup (callable): Returns the published result, or None if there is none yet.
+    - build (callable): Builds the result.
+    - publish (callable): Stores the result, called with the lock held; returns the value to return.
+
+    Returns:
+    - The published result.
+    """
+    with _lock:
+        found = lookup()
+        if found is not None:
+            return found
+        pending = _pending.get(task)
+        if pending is None:
+            future = Future()
+            _pending[task] = (future, threading.get_ident())
+    if pending is not None:
+        future, thread = pending
+        if thread == threading.get_ident():
+            raise RuntimeError(f"{task[-1]} is needed to build itself")
+        return future.result()
+
+    try:
+        result = build()
+        with _lock:
+            result = publish(result)
+            del _pending[task]
+    except BaseException as e:
+        with _lock:
+            _pending.pop(task, None)
+        future.set_exception(e)
+        raise
+    future.set_result(result)
+    return result
+
+
+def derived(frame, name, builder):
+    """
+    Return `builder(frame)`, computed once per frame object.
+
+    Used for lookup structures precomputed over a view (pivot cubes, filter
+    indexes...). The result is kept as long as the frame itself is alive, so a
+    reload that publishes a new frame also gets a new structure.
+
+    Parameters:
+    - frame (pd.DataFrame): The frame the structure is computed from.
+    - name (str): Name of the structure (e.g. 'prix_cube').
+    - builder (callable): Function receiving the frame and returning the structure.
+
+    Returns:
+    - The object returned by `builder`.
+    """
+    key = (id(frame), name)
+    entry = _derived.get(key)
+    if entry is not None and entry[0]() is frame:
+        return entry[1]
+
+    def lookup():
+        entry = _derived.get(key)
+        return entry if entry is not None and entry[0]() is frame else None
+
+    def publish(structure):
+        # Drop the structure together with the frame
+        ref = weakref.ref(frame, lambda _, key=key: _derived.pop(key, None))
+        _derived[key] = (ref, structure)
+        return _derived[key]
+
+    return _build_once(('derived',) + key, lookup, lambda: builder(frame), publish)[1]
+
+
+def derived_structures(frame):
+    """
+    Return the structures derived from a frame so far (see derived).
+
+    Returns:
+    - structures (dict): {name: structure}, e.g. {'prix_cube': {...}}.
+    """
+    with _lock:
+        return {name: entry[1] for (frame_id, name), entry in _derived.items()
+                if frame_id == id(frame) and entry[0]() is frame}
+
+
+def _record_origins(key, name, view, first, version):
+    parts = view if isinstance(view, tuple) else (view,)
+    for position, part in enumerate(parts):
+        _origins[id(part)] = (key, name, position if isinstance(view, tuple) else None, part, first, version)
+
+
+def _build(DATA_DIR, entry, name, builder):
+    view = builder(DATA_DIR)
+    entry['views'][name] = view
+    entry['builders'][name] = builder
+    return view
+
+
+def get_view(DATA_DIR, name, builder):
+    """
+    Return the view `name` of DATA_DIR, building it once with `builder(DATA_DIR)`.
+
+    On first load, a view found in an up-to-date bundle of DATA_DIR (see
+    bundle.py and `python -m modules.build`) is read from it instead.
+    The builder is remembered, so that the view can be rebuilt when the
+    workbooks of DATA_DIR change (see reload_data).
+
+    Parameters:
+    - DATA_DIR (str): The directory where the Excel data files are located.
+    - name (str): Name of the view (e.g. 'prix_median', 'indicateurs').
+    - builder (callable): Function receiving DATA_DIR and returning the view.
+
+    Returns:
+    - The object returned by `builder`.
+    """
+    key = _key(DATA_DIR)
+
+    # While reload_data rebuilds the views, dependencies come from the new entry
+    building = getattr(_local, 'entries', {}).get(key)
+    if building is not None:
+        if name in building['views']:
+            return building['views'][name]
+        return _build(DATA_DIR, building, name, builder)
+
+    entry = _registry.get(key)
+    if entry is not None and name in entry['views']:
+        return entry['views'][name]
+
+    # Imported here: the bundle module imports this one
+    from .bundle import bundled_view
+
+    def lookup():
+        entry = _registry.get(key)
+        # Wrapped, since a view could be falsy
+        return None if entry is None or name not in entry['views'] else (entry['views'][name],)
+
+    def build():
+        view = bundled_view(key, name)
+        return builder(DATA_DIR) if view is None else view
+
+    def publish(view):
+        entry = _registry.setdefault(key, _new_entry(key))
+        entry['views'][name] = view
+        entry['builders'][name] = builder
+        _record_origins(key, name, view, first=True, version=_version)
+        return (view,)
+
+    return _build_once(('view', key, name), lookup, build, publish)[0]
+
+
+def published_views(DATA_DIR):
+    """Return {view name: view} of the views of DATA_DIR built so far."""
+    entry = _registry.get(_key(DATA_DIR))
+    return {} if entry is None else dict(entry['views'])
+
+
+def reload_data(DATA_DIR):
+    """
+    Rebuild every view of DATA_DIR if its workbooks changed, then publish them at once.
+
+    Only new or modified workbooks are parsed again: the others are read back
+    from their Parquet copy (see ingest.read_excel_cached). The new views are
+    built aside and swapped in with a single assignment, so that a session
+    never sees a mix of old and new frames.
+
+    Returns:
+    - changed (bool): Whether new data was published.
+    """
+    global _version
+    key = _key(DATA_DIR)
+    old_entry = _registry.get(key)
+    if old_entry is None:
+        return False
+
+    signature = directory_signature(key)
+    if signature == old_entry['signature']:
+        return False
+
+    changed = sorted(f for f in set(signature) | set(old_entry['signature'])
+                     if signature.get(f) != old_entry['signature'].get(f))
+    logging.info(f"Reloading data of {key} after changes to: {', '.join(changed)}")
+
+    new_entry = {'views': {}, 'builders': {}, 'signature': signature}
+    while True:
+        # Views can be added meanwhile by a background loader (see map.start_map_data):
+        # they are built in turn, so that none of them goes missing from the new data
+        with _lock:
+            old_entry = _registry[key]
+            missing = {name: builder for name, builder in old_entry['builders'].items()
+                       if name not in new_entry['views']}
+            building = [future for task, (future, _) in _pending.items() if task[:2] == ('view', key)]
+            if not missing and not building:
+                for obj_id, origin in list(_origins.items()):
+                    if origin[0] == key and not origin[4]:
+                        del _origins[obj_id]
+                for name, view in new_entry['views'].items():
+                    _record_origins(key, name, view, first=False, version=_version + 1)
+                _registry[key] = new_entry
+                _version += 1
+                return True
+
+        # Views still being built from the old data are published first, then rebuilt
+        for future in building:
+            try:
+                future.result()
+            except Exception:
+                # Reported to the thread that built it
+                pass
+
+        _local.entries = {key: new_entry}
+        try:
+            for name, builder in missing.items():
+                get_view(DATA_DIR, name, builder)
+        except Exception as e:
+            logging.error(f"Could not reload the data of {key}, keeping the current data: {e}")
+            return False
+        finally:
+            _local.entries = {}
+
+
+def start_data_watcher(DATA_DIR):
+    """
+    Watch DATA_DIR in a background thread and reload the data when a workbook changes.
+
+    The watcher is started once per data directory; later calls do nothing.
+    """
+    key = _key(DATA_DIR)
+    with _lock:
+        if key in _watchers:
+            return
+        try:
+            from watchfiles import watch
+        except ImportError:
+            logging.warning("watchfiles is not installed: new cycles will need a restart to be loaded.")
+            _watchers[key] = None
+            return
+
+        def is_workbook(change, path):
+            file = os.path.basename(path)
+            return file.endswith('.xlsx') and not file.startswith('~$')
+
+        def run():
+            for _ in watch(key, watch_filter=is_workbook, recursive=False):
+                try:
+                    reload_data(key)
+                except Exception as e:
+                    logging.error(f"Error while reloading the data of {key}: {e}")
+
+        thread = threading.Thread(target=run, name=f"data-watcher-{os.path.basename(key)}", daemon=True)
+        thread.start()
+        _watchers[key] = thread
+
+
+def live_view(data):
+    """
+    Return a reactive calc giving the latest version of `data` in a session.
+
+    `data` is a view returned by a load_* function (or one element of it, e.g.
+    `df_filtered`). The calc is invalidated when reloaded data is published and
+    then returns the matching frame of the new data. Objects that do not come
+    from the registry are returned unchanged.
+    The first call also starts the watcher of the data directory.
+    """
+    origin = _origins.get(id(data))
+    if origin is not None:
+        start_data_watcher(origin[0])
+
+    @reactive.poll(data_version, RELOAD_POLL_INTERVAL)
+    def version():
+        return data_version()
+
+    @reactive.calc
+    def _live():
+        version()
+        if origin is None:
+            return data
+        key, name, position = origin[:3]
+        view = _registry[key]['views'].get(name, data)
+        if position is not None and isinstance(view, tuple):
+            return view[position]
+        return view
+
+    return _live
+
+
+def live_named_view(DATA_DIR, name):
+    """
+    Return a reactive calc giving the latest version of the view `name` of DATA_DIR in a session.
+
+    Unlike live_view, the view does not need to exist when the session starts:
+    the calc gives None until it is built, e.g. by a background loader, whose
+    completion the caller must watch (see map.map_server). The calc is
+    invalidated when reloaded data is published.
+    """
+    key = _key(DATA_DIR)
+    start_data_watcher(key)
+
+    @reactive.poll(data_version, RELOAD_POLL_INTERVAL)
+    def version():
+        return data_version()
+
+    @reactive.calc
+    def _live():
+        version()
+        entry = _registry.get(key)
+        return None if entry is None else entry['views'].get(name)
+
+    return _live
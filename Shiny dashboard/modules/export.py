@@ -0,0 +1,340 @@
+# modules/export.py
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import logging
+import itertools
+from types import SimpleNamespace
+from concurrent.futures import ProcessPoolExecutor
+
+from .ingest import MAX_WORKERS
+from .comparison import PREVIOUS_CYCLE, comparison_choices
+from .currency import CURRENCIES, currency_title
+from .boundaries import BOUNDARIES_DIR, BOUNDARIES_URL, boundary_urls
+from .prix_median import load_prix_median_data, get_prix_median_choices, prix_table_html
+from .meb import load_meb_data, get_meb_choices, meb_secteurs_table_html
+from .map import (DATA_DIR, MAP_ID, MAP_MODES, MAP_DEPENDENCIES, AREA_LEVELS, indicator_labels,
+                  start_map_data, map_feature_collections, admin_scores, map_init_message)
+
+WWW_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'www')
+
+# Folder of the static site written by `python -m modules.export`
+EXPORT_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'static_site')
+
+# Folder of the site holding one file per distinct view, named after the hash of its content
+VIEWS_DIR_NAME = 'views'
+
+# Files of www copied to the site
+SITE_ASSETS = ['styles.css', 'map.js', 'router.js']
+
+# Font Awesome, for the icons of the map markers (the version used by folium), then the map
+SITE_DEPENDENCIES = [
+    ('css', 'https://cdn.jsdelivr.net/npm/@fortawesome/fontawesome-free@6.2.0/css/all.min.css'),
+] + MAP_DEPENDENCIES
+
+# Views rendered by each task of the process pool
+VIEWS_PER_TASK = 64
+
+TOGGLE_CHOICES = {'0': 'Non', '1': 'Oui'}
+
+# Each process of the pool reads the data once (see _init_worker)
+_worker = {}
+
+
+def static_input(**values):
+    """
+    Return an object answering `input.<id>()` with fixed values, like the input object of a Shiny session.
+
+    Used to render the outputs of the server functions outside a session,
+    e.g. `prix_table_html(df, static_input(cycle_select=2, ...))`.
+    """
+    return SimpleNamespace(**{name: (lambda value=value: value) for name, value in values.items()})
+
+
+def control(id, label, choices, when=None, selected=None):
+    """
+    Describe a dropdown of the static site.
+
+    Parameters:
+    - id (str): The id of the matching input of the app (e.g. 'cycle_select').
+    - label (str): The label shown above the dropdown.
+    - choices (dict): {value: label} of the options.
+    - when (str): The id of a switch the dropdown depends on: it is only shown, and only
+      part of the view, when the switch is on (e.g. 'Comparer avec').
+    - selected (str): The value selected first, None for the first one.
+
+    Returns:
+    - control (dict)
+    """
+    return {'id': id, 'label': label, 'choices': {str(k): str(v) for k, v in choices.items()},
+            'when': when, 'selected': selected}
+
+
+def view_keys(controls):
+    """
+    Enumerate the views of a tab: every combination of the values of its dropdowns.
+
+    Returns:
+    - views (list): (key, values) pairs, where key joins the values with '|' in the order of
+      `controls` (as www/router.js does) and values is {input id: value}. A dropdown
+      whose switch is off has the empty value.
+    """
+    views = []
+    for combination in itertools.product(*[list(c['choices']) for c in controls]):
+        values = dict(zip([c['id'] for c in controls], combination))
+        if any(c['when'] is not None and values[c['when']] != '1' and values[c['id']] != PREVIOUS_CYCLE
+               for c in controls):
+            # The views of a switch turned off only differ by the other dropdowns
+            continue
+        for c in controls:
+            if c['when'] is not None and values[c['when']] != '1':
+                values[c['id']] = ''
+        views.append(('|'.join(values[c['id']] for c in controls), values))
+    return views
+
+
+def cycle_choices_of(cycles):
+    """Return the choices of a cycle slider, as {number: 'Cycle N'}, for cycle names like 'cycle_N'."""
+    numbers = sorted(int(c.replace('cycle_', '')) for c in cycles)
+    return {n: f"Cycle {n}" for n in numbers}
+
+
+def prix_controls(df_filtered):
+    """Return the dropdowns of the "Prix des Produits" tab (see prix_median.prix_median_ui)."""
+    secteurs, regions, cycles = get_prix_median_choices(df_filtered)
+    return [
+        control('cycle_select', "Choisir le Cycle", cycle_choices_of(cycles)),
+        control('secteur_select_prix', "Choisir le Secteur", {s: s for s in secteurs}),
+        control('region_select', "Choisir le Niveau géographique", {r: r for r in regions}),
+        control('currency_select_prix', "Choisir la Devise", {c: c for c in CURRENCIES}),
+        control('toggle_diff', "Évolution des prix (en %)", TOGGLE_CHOICES),
+        control('compare_select_prix', "Comparer avec", comparison_choices(cycles), when='toggle_diff'),
+    ]
+
+
+def meb_controls(df_meb_long):
+    """Return the dropdowns of the "Cout du MEB par secteurs" tab (see meb.meb_ui)."""
+    type_meb_choices, meb_par_choices, _, currencies, cycles = get_meb_choices(df_meb_long)
+    return [
+        control('cycle_select_meb', "Choisir le Cycle", cycle_choices_of(cycles)),
+        control('type_meb_select_sectors', "Choisir le type de crise", {t: t for t in type_meb_choices}),
+        control('meb_par_select', "Choisir le Niveau géographique", {m: m for m in meb_par_choices}),
+        control('currency_select_meb', "Choisir la monnaie", {c: c for c in currencies}),
+        control('toggle_diff_meb', "Afficher les différences (%)", TOGGLE_CHOICES),
+        control('compare_select_meb', "Comparer avec", comparison_choices(cycles), when='toggle_diff_meb'),
+    ]
+
+
+def map_controls(markets_df):
+    """Return the dropdowns of the "Carte du Score de MFS" tab (see map.map_ui)."""
+    return [
+        control('cycle_select_map', "Choisir le Cycle", cycle_choices_of(markets_df['Cycle'].dropna().unique())),
+        control('indicator_select', "Choisir l'indicateur", indicator_labels,
+                selected='mfs_functionality_classification'),
+        control('map_mode', "Afficher", MAP_MODES),
+    ]
+
+
+def render_view(tab, values):
+    """
+    Render the HTML of a view of the "Prix des Produits" or "Cout du MEB par secteurs" tab,
+    with the functions of their server.
+
+    Parameters:
+    - tab (str): 'prix' or 'meb'.
+    - values (dict): {input id: value} of the view (see view_keys).
+
+    Returns:
+    - html (str)
+    """
+    values = dict(values)
+    for switch in ('toggle_diff', 'toggle_diff_meb'):
+        if switch in values:
+            values[switch] = values[switch] == '1'
+    if tab == 'prix':
+        values['cycle_select'] = int(values['cycle_select'])
+        title = f"Prix médian des produits en {currency_title(values['currency_select_prix'])}"
+        table = prix_table_html(_worker['prix'], static_input(**values))
+    else:
+        values['cycle_select_meb'] = int(values['cycle_select_meb'])
+        title = "MEB par Secteurs"
+        table = meb_secteurs_table_html(_worker['meb'], static_input(**values))
+    return f"<h2>{title}</h2>{table}"
+
+
+def _init_worker(data_dir):
+    """Read the data of the tables once per process (from the bundle when it is up to date)."""
+    _, _worker['prix'] = load_prix_median_data(data_dir)
+    _worker['meb'] = load_meb_data(data_dir)
+
+
+def _render_task(tab, views):
+    """Process pool task: render views of a tab, returning (key, html) pairs."""
+    return [(key, render_view(tab, values)) for key, values in views]
+
+
+def _pool_size(n_tasks):
+    n_workers = min(n_tasks, os.cpu_count() or 1, MAX_WORKERS)
+    return n_workers if n_workers > 1 else 0
+
+
+def render_views(data_dir, tasks, parallel=True):
+    """
+    Render the HTML of views of the "Prix des Produits" and "Cout du MEB par secteurs" tabs.
+
+    The views are rendered in batches of VIEWS_PER_TASK, fanned out across a
+    process pool: each process reads the data once.
+
+    Parameters:
+    - data_dir (str): The directory where the Excel data files are located.
+    - tasks (list): (tab, key, values) of every view.
+    - parallel (bool): Set to False to render every view in this process.
+
+    Returns:
+    - html (dict): {(tab, key): HTML}.
+    """
+    batches = []
+    for tab, group in itertools.groupby(tasks, key=lambda task: task[0]):
+        group = [(key, values) for _, key, values in group]
+        batches += [(tab, group[i:i + VIEWS_PER_TASK]) for i in range(0, len(group), VIEWS_PER_TASK)]
+
+    n_workers = _pool_size(len(batches)) if parallel else 0
+    if n_workers == 0:
+        _init_worker(data_dir)
+        results = [(tab, _render_task(tab, views)) for tab, views in batches]
+    else:
+        logging.info(f"Rendering {len(tasks)} views with {n_workers} processes")
+        with ProcessPoolExecutor(max_workers=n_workers, initializer=_init_worker, initargs=(data_dir,)) as pool:
+            futures = [(tab, pool.submit(_render_task, tab, views)) for tab, views in batches]
+            results = [(tab, future.result()) for tab, future in futures]
+    return {(tab, key): html for tab, rendered in results for key, html in rendered}
+
+
+def _write_content(site_dir, content, extension, written):
+    """Write a view once per distinct content, and return its path relative to the site."""
+    digest = hashlib.sha1(content.encode('utf-8')).hexdigest()[:16]
+    path = f"{VIEWS_DIR_NAME}/{digest}.{extension}"
+    if path not in written:
+        with open(os.path.join(site_dir, path), 'w', encoding='utf-8') as f:
+            f.write(content)
+        written.add(path)
+    return path
+
+
+def _index_html():
+    """Return the page of the static site: the three tabs, filled in by www/router.js."""
+    head = '\n'.join(
+        f'<link rel="stylesheet" href="{url}">' if kind == 'css' else f'<script src="{url}"></script>'
+        for kind, url in SITE_DEPENDENCIES
+    )
+    return f"""<!DOCTYPE html>
+<html lang="fr">
+<head>
+<meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>ICSM Haïti</title>
+<link rel="stylesheet" href="styles.css">
+{head}
+<script src="router.js"></script>
+</head>
+<body>
+<nav class="static-nav">
+<a href="#prix" data-tab="prix">Prix des Produits</a>
+<a href="#meb" data-tab="meb">MEB</a>
+<a href="#map" data-tab="map">Carte du Score de MFS</a>
+</nav>
+<section class="static-tab" id="tab-prix"><aside class="static-sidebar"></aside><div class="static-content"></div></section>
+<section class="static-tab" id="tab-meb"><aside class="static-sidebar"></aside><div class="static-content"></div></section>
+<section class="static-tab" id="tab-map"><aside class="static-sidebar map-sidebar"></aside>
+<div class="static-content map-container"><div id="{MAP_ID}" class="mfs-map"></div></div></section>
+</body>
+</html>
+"""
+
+
+def export_site(data_dir=DATA_DIR, out_dir=EXPORT_DIR, parallel=True):
+    """
+    Write every view of the "Prix des Produits", "Cout du MEB par secteurs" and
+    "Carte du Score de MFS" tabs as a static site, which needs no server to be browsed.
+
+    Every combination of the dropdowns and switches of each tab is rendered
+    with the functions of its server (see render_view). Each distinct table
+    (HTML) or map layer (JSON) is written once, named after the hash of its
+    content, and views.json maps each combination to its file. www/router.js
+    builds the dropdowns from views.json and loads the file of the selected
+    view; the map is drawn by www/map.js from the static GeoJSON boundaries.
+
+    Parameters:
+    - data_dir (str): The directory where the Excel data files are located.
+    - out_dir (str): The folder of the site, replaced.
+    - parallel (bool): Whether the tables may be rendered in a process pool.
+
+    Returns:
+    - summary (dict): {'views': number of views, 'files': number of distinct files}.
+    """
+    _, df_filtered = load_prix_median_data(data_dir)
+    df_meb_long = load_meb_data(data_dir)
+    map_data = start_map_data(data_dir).result()
+    markets_df = map_data['markets']
+
+    tabs = {
+        'prix': {'title': "Prix des Produits", 'controls': prix_controls(df_filtered)},
+        'meb': {'title': "Cout du MEB par secteurs", 'controls': meb_controls(df_meb_long)},
+        'map': {'title': "Carte du Score de MFS", 'controls': map_controls(markets_df)},
+    }
+    tasks = [(tab, key, values) for tab in ('prix', 'meb') for key, values in view_keys(tabs[tab]['controls'])]
+    html = render_views(data_dir, tasks, parallel=parallel)
+
+    tmp_dir = f"{out_dir}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(os.path.join(tmp_dir, VIEWS_DIR_NAME))
+    written = set()
+    for tab in ('prix', 'meb'):
+        tabs[tab]['views'] = {key: _write_content(tmp_dir, html[(tab, key)], 'html', written)
+                              for key, _ in view_keys(tabs[tab]['controls'])}
+
+    # The map gets the markets of the selected cycle, or the scores of the admin units of the selected level;
+    # the indicator is switched in the browser
+    features = map_feature_collections(markets_df)
+    scores = admin_scores(markets_df)
+    tabs['map']['features'] = {str(cycle): _write_content(tmp_dir, payload, 'json', written)
+                               for cycle, payload in features.items()}
+    tabs['map']['areas'] = {f"{cycle}|{level}": _write_content(tmp_dir, scores[(level, cycle)], 'json', written)
+                            for level, cycle in scores if level in AREA_LEVELS}
+
+    # The boundaries are served next to the page, without the tile server
+    urls = boundary_urls()
+    os.makedirs(os.path.join(tmp_dir, BOUNDARIES_URL))
+    for url in urls.values():
+        name = url.split('?')[0].split('/')[-1]
+        shutil.copy(os.path.join(BOUNDARIES_DIR, name), os.path.join(tmp_dir, BOUNDARIES_URL, name))
+    tabs['map']['init'] = map_init_message(urls)
+
+    for asset in SITE_ASSETS:
+        shutil.copy(os.path.join(WWW_DIR, asset), os.path.join(tmp_dir, asset))
+    with open(os.path.join(tmp_dir, 'views.json'), 'w', encoding='utf-8') as f:
+        json.dump(tabs, f, ensure_ascii=False, separators=(',', ':'))
+    with open(os.path.join(tmp_dir, 'index.html'), 'w', encoding='utf-8') as f:
+        f.write(_index_html())
+
+    old_dir = f"{out_dir}.{os.getpid()}.old"
+    if os.path.exists(out_dir):
+        os.replace(out_dir, old_dir)
+    os.replace(tmp_dir, out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+
+    n_views = sum(len(tab.get('views', {})) for tab in tabs.values()) + len(tabs['map']['features']) + len(tabs['map']['areas'])
+    return {'views': n_views, 'files': len(written)}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    out_dir = sys.argv[1] if len(sys.argv) > 1 else EXPORT_DIR
+    start = time.perf_counter()
+    summary = export_site(out_dir=out_dir)
+    print(f"{summary['views']} views written to {out_dir} as {summary['files']} files "
+          f"in {time.perf_counter() - start:.1f} s")
@@ -0,0 +1,131 @@
+# modules/filter_index.py
+
+import numpy as np
+import pandas as pd
+
+
+def _codes_and_values(series):
+    """Return the integer code of each row (-1 for missing values) and the value of each code."""
+    if not isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.astype('category')
+    return series.cat.codes.to_numpy(), list(series.cat.categories)
+
+
+def build_filter_index(df, levels):
+    """
+    Build a nested index of the rows of df over a hierarchy of columns.
+
+    The rows are sorted by `levels` (e.g. Sujet -> Cycle -> Sector -> ...), so that
+    every node of the hierarchy covers a contiguous slice of the sorted rows.
+    A node is a tuple (start, stop, children) where children maps each value of
+    the next level to its own node; missing values are keyed by None.
+
+    Parameters:
+    - df (pd.DataFrame): The DataFrame to index.
+    - levels (list): Column names, from the outermost to the innermost level.
+
+    Returns:
+    - index (dict): The index, to be queried with index_rows, index_frame and index_choices.
+    """
+    columns = [_codes_and_values(df[level]) for level in levels]
+    codes = np.column_stack([c for c, _ in columns]) if len(df) else np.empty((0, len(levels)), dtype=int)
+    # np.lexsort sorts on its last key first, and keeps the original order of equal rows
+    order = np.lexsort(codes.T[::-1]) if len(df) else np.empty(0, dtype=np.intp)
+    sorted_codes = codes[order]
+
+    def build_node(start, stop, depth):
+        if depth == len(levels):
+            return (start, stop, {})
+        col = sorted_codes[start:stop, depth]
+        bounds = [start, *(np.flatnonzero(col[1:] != col[:-1]) + 1 + start), stop]
+        values = columns[depth][1]
+        children = {}
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            code = sorted_codes[a, depth]
+            children[None if code < 0 else values[code]] = build_node(a, b, depth + 1)
+        return (start, stop, children)
+
+    return {
+        'frame': df,
+        'levels': list(levels),
+        'order': order,
+        'root': build_node(0, len(df), 0) if len(df) else (0, 0, {}),
+        # Memoised answers, keyed by the selection
+        'rows': {},
+        'choices': {},
+    }
+
+
+def _selection_key(index, selection):
+    """Turn a selection into a tuple with one value per level, None meaning any value."""
+    unknown = set(selection) - set(index['levels'])
+    if unknown:
+        raise KeyError(f"Unknown index levels: {', '.join(sorted(unknown))}")
+    return tuple(selection.get(level) or None for level in index['levels'])
+
+
+def _matching_nodes(index, key, depth):
+    """Return the nodes at `depth` whose path matches the first `depth` values of key."""
+    nodes = [index['root']]
+    for value in key[:depth]:
+        if value is None:
+            nodes = [child for node in nodes for child in node[2].values()]
+        else:
+            nodes = [node[2][value] for node in nodes if value in node[2]]
+    return nodes
+
+
+def index_rows(index, selection):
+    """
+    Return the positions of the rows of the indexed frame matching a selection.
+
+    Parameters:
+    - index (dict): An index returned by build_filter_index.
+    - selection (dict): {level: value}. Levels missing from the selection, or set
+      to None or '', match any value.
+
+    Returns:
+    - rows (np.ndarray): Row positions in the indexed frame, in their original order.
+    """
+    key = _selection_key(index, selection)
+    rows = index['rows'].get(key)
+    if rows is None:
+        # Below the innermost selected level, every matching row is in the node slices
+        depth = max((i + 1 for i, value in enumerate(key) if value is not None), default=0)
+        slices = [index['order'][start:stop] for start, stop, _ in _matching_nodes(index, key, depth)]
+        rows = np.sort(np.concatenate(slices)) if slices else np.empty(0, dtype=np.intp)
+        index['rows'][key] = rows
+    return rows
+
+
+def index_frame(index, selection):
+    """Return the rows of the indexed frame matching a selection (see index_rows)."""
+    return index['frame'].iloc[index_rows(index, selection)]
+
+
+def index_choices(index, level, selection):
+    """
+    Return the sorted distinct values of `level` among the rows matching a selection.
+
+    Missing values are left out, as with df[level].dropna().unique().
+
+    Parameters:
+    - index (dict): An index returned by build_filter_index.
+    - level (str): The level whose values are returned.
+    - selection (dict): {level: value}, as for index_rows.
+
+    Returns:
+    - choices (list): The sorted values.
+    """
+    key = _selection_key(index, selection)
+    choices = index['choices'].get((level, key))
+    if choices is None:
+        depth = index['levels'].index(level)
+        if all(value is None for value in key[depth:]):
+            # The values are the children of the matching nodes one level up
+            values = {value for node in _matching_nodes(index, key, depth) for value in node[2]}
+        else:
+            values = set(index['frame'][level].iloc[index_rows(index, selection)].unique())
+        choices = sorted(value for value in values if value is not None and not pd.isna(value))
+        index['choices'][(level, key)] = choices
+    return choices
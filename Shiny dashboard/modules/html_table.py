@@ -0,0 +1,182 @@
+# modules/html_table.py
+
+import time
+import warnings
+from html import escape
+
+import numpy as np
+
+# Background colours of the cells, from the lowest to the highest quarter of their row
+QUANTILE_COLORS = ["#FEEEED", "#F3BEBD", "#F27D7C", "#EE5859"]
+
+# Text colours of the differences tables
+INCREASE_COLOR = "#CD2030"
+DECREASE_COLOR = "#086D38"
+
+
+def row_quantile_bins(values, quantiles=(0.25, 0.5, 0.75)):
+    """
+    Return, for each cell of a matrix, the number of quantiles of its row that it exceeds.
+
+    With the default quantiles, 0 means the cell is in the lowest quarter of its
+    row and 3 in the highest. Quantiles are computed per row with np.nanquantile
+    (linear interpolation, like pandas), ignoring missing values; missing cells get 0.
+
+    Parameters:
+    - values (np.ndarray): 2-D float matrix.
+    - quantiles (tuple): Increasing quantiles that delimit the bins.
+
+    Returns:
+    - bins (np.ndarray): Integer matrix with the shape of `values`.
+    """
+    values = np.asarray(values, dtype=float)
+    bins = np.zeros(values.shape, dtype=np.int8)
+    if values.size == 0:
+        return bins
+    with warnings.catch_warnings():
+        # Rows without any value have NaN quantiles, which no cell exceeds
+        warnings.simplefilter("ignore", RuntimeWarning)
+        thresholds = np.nanquantile(values, quantiles, axis=1)
+    for threshold in thresholds:
+        bins += values > threshold[:, None]
+    return bins
+
+
+def _header_html(label_header, columns, highlight_column=None):
+    cells = [f"<th>{escape(str(label_header), quote=False)}</th>"]
+    for col in columns:
+        if col == highlight_column:
+            cells.append(f"<th class='highlighted-header'>{escape(str(col), quote=False)}</th>")
+        else:
+            cells.append(f"<th>{escape(str(col), quote=False)}</th>")
+    return "<thead><tr>" + "".join(cells) + "</tr></thead>"
+
+
+def heatmap_table_html(values, row_labels, columns, table_class, label_header,
+                       label_template="<td><strong>{}</strong></td>",
+                       highlight_column=None, total_label=None, formatted=None, decimals=0):
+    """
+    Render a matrix of amounts as an HTML table whose cells are coloured by row quartile.
+
+    Numbers are rounded to `decimals` and shown with thousands separators
+    (e.g. 1,250). The colours follow the values as displayed, i.e. after rounding.
+
+    Parameters:
+    - values (np.ndarray): 2-D float matrix (rows x columns); NaN cells are left empty.
+    - row_labels (list): Label of each row, shown in the first column.
+    - columns (list): Name of each column of `values`.
+    - table_class (str): CSS class of the table (e.g. 'prix-table').
+    - label_header (str): Header of the label column (e.g. 'Produit').
+    - label_template (str): HTML of a label cell, with {} for the label.
+    - highlight_column (str): Column shown highlighted and left out of the colouring (e.g. 'Tout le pays').
+    - total_label (str): Label of a row to style as a total row (e.g. 'Total').
+    - formatted (np.ndarray): Display strings of the values (e.g. PivotResult.formatted),
+      if already computed; None cells are left empty.
+    - decimals (int): Number of decimals shown.
+
+    Returns:
+    - html (str): The <table> element.
+    """
+    values = np.round(np.asarray(values, dtype=float), decimals)
+    if formatted is None:
+        spec = f",.{decimals}f"
+        formatted = [[None if v != v else format(v, spec) for v in row] for row in values.tolist()]
+    else:
+        formatted = formatted.tolist()
+    columns = list(columns)
+
+    coloured = [i for i, col in enumerate(columns) if col != highlight_column]
+    bins = np.zeros(values.shape, dtype=np.int8)
+    bins[:, coloured] = row_quantile_bins(values[:, coloured])
+
+    colour_cells = [f"<td style='background-color: {color};'>{{}}</td>" for color in QUANTILE_COLORS]
+    highlights = ["<td class='highlighted'><strong>{}</strong></td>" if col == highlight_column else None
+                  for col in columns]
+
+    rows = []
+    for label, row_text, row_bins in zip(row_labels, formatted, bins.tolist()):
+        cells = [label_template.format(escape(str(label), quote=False))]
+        for text, b, highlight in zip(row_text, row_bins, highlights):
+            if text is None:
+                cells.append("<td class='highlighted'></td>" if highlight else "<td></td>")
+            else:
+                cells.append((highlight or colour_cells[b]).format(text))
+        row_open = "<tr class='total-row'>" if total_label is not None and label == total_label else "<tr>"
+        rows.append(row_open + "".join(cells) + "</tr>")
+
+    return (f"<table class='{table_class}'>" + _header_html(label_header, columns, highlight_column)
+            + "<tbody>" + "".join(rows) + "</tbody></table>")
+
+
+def change_table_html(values, row_labels, columns, label_header, decrease_prefix="▼"):
+    """
+    Render a matrix of percentage changes as an HTML 'difference-table'.
+
+    Increases are shown in red with ▲, decreases in green with ▼ and no change with =.
+
+    Parameters:
+    - values (np.ndarray): 2-D float matrix of changes in %; NaN cells are left empty.
+    - row_labels (list): Label of each row, shown in bold in the first column.
+    - columns (list): Name of each column of `values`.
+    - label_header (str): Header of the label column (e.g. 'Produit').
+    - decrease_prefix (str): Text shown before a negative change (e.g. '▼' or '▼ ').
+
+    Returns:
+    - html (str): The <table> element.
+    """
+    values = np.asarray(values, dtype=float)
+    signs = np.sign(values).tolist()
+
+    rows = []
+    for label, row_values, row_signs in zip(row_labels, values.tolist(), signs):
+        cells = [f"<td><strong>{escape(str(label), quote=False)}</strong></td>"]
+        for value, sign in zip(row_values, row_signs):
+            if sign > 0:
+                cells.append(f"<td style='color: {INCREASE_COLOR};'><strong>▲ +{value:.1f}%</strong></td>")
+            elif sign < 0:
+                cells.append(f"<td style='color: {DECREASE_COLOR};'><strong>{decrease_prefix}{value:.1f}%</strong></td>")
+            elif sign == 0:
+                cells.append(f"<td><strong>= {value:.1f}%</strong></td>")
+            else:  # NaN
+                cells.append("<td></td>")
+        rows.append("<tr>" + "".join(cells) + "</tr>")
+
+    return ("<table class='difference-table'>" + _header_html(label_header, columns)
+            + "<tbody>" + "".join(rows) + "</tbody></table>")
+
+
+def benchmark(n_rows=500, n_cols=30, repeat=5, seed=0):
+    """
+    Time the renderers on a synthetic table of n_rows products x n_cols zones.
+
+    About 10% of the cells are missing, as in the price tables.
+
+    Returns:
+    - timings (dict): {renderer name: best time in milliseconds}.
+    """
+    rng = np.random.default_rng(seed)
+    values = rng.lognormal(mean=6, sigma=1, size=(n_rows, n_cols))
+    values[rng.random(values.shape) < 0.1] = np.nan
+    labels = [f"Produit {i}" for i in range(n_rows)]
+    columns = [f"Zone {j}" for j in range(n_cols - 1)] + ["Tout le pays"]
+    changes = rng.normal(scale=20, size=values.shape)
+
+    renderers = {
+        'heatmap_table_html': lambda: heatmap_table_html(values, labels, columns, 'prix-table', 'Produit',
+                                                         highlight_column='Tout le pays'),
+        'change_table_html': lambda: change_table_html(changes, labels, columns, 'Produit'),
+    }
+    timings = {}
+    for name, render in renderers.items():
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            render()
+            best = min(best, time.perf_counter() - start)
+        timings[name] = best * 1000
+    return timings
+
+
+if __name__ == "__main__":
+    for name, ms in benchmark().items():
+        print(f"{name}: {ms:.1f} ms for 500 products x 30 zones")
@@ -1,70 +1,59 @@
 # modules/indicateurs_non_tarifaires.py
 
-import os
-import pandas as pd
+import json
 import plotly.express as px
 import plotly.graph_objs as go
+import plotly.io as pio
+from plotly.utils import PlotlyJSONEncoder
 import textwrap
 import logging
+from collections import Counter
+from functools import lru_cache
 
 from shiny import ui, reactive, render
-from shinywidgets import render_widget, output_widget
+
+from .data_registry import get_view, get_icsm_base, derive_view, derived, map_categories, live_view
+from .filter_index import build_filter_index, index_rows, index_frame, index_choices
+from .render_cache import cached_render
 
 ###################################
 # 1. LOADING AND PREPROCESSING DATA
 ###################################
 
-def load_indicateurs_data(DATA_DIR):
-    """
-    Load and merge all Excel files ending with '_ICSM_analyse.xlsx' from DATA_DIR,
-    adding a 'Cycle' column to each dataset. The merged DataFrame is then cleaned
-    and transformed for use in the Indicateurs Non-Tarifaires app.
+def build_indicateurs_view(base):
     """
-    excel_files = [f for f in os.listdir(DATA_DIR) if f.endswith('_ICSM_analyse.xlsx')]
-    if not excel_files:
-        raise FileNotFoundError("No Excel files ending with '_ICSM_analyse.xlsx' found in the specified directory.")
-
-    # Merge all Excel files, each annotated with a 'Cycle' column.
-    list_dfs = []
-    for file in excel_files:
-        file_path = os.path.join(DATA_DIR, file)
-        try:
-            df_temp = pd.read_excel(file_path)
-        except Exception as e:
-            raise ValueError(f"Error reading the Excel file {file}: {e}")
-
-        # Extract the cycle name from the file name, e.g. "cycle_1_ICSM_analyse.xlsx" => "cycle_1"
-        cycle_name = file.split('_ICSM_analyse.xlsx')[0]
-        df_temp['Cycle'] = cycle_name
-        list_dfs.append(df_temp)
-
-    df = pd.concat(list_dfs, ignore_index=True)
+    Build the Indicateurs Non-Tarifaires view over the shared ICSM base frame.
 
+    Only the columns transformed here are copied; every other column keeps
+    sharing its memory with the base frame.
+    """
     # Basic cleanup (columns that you rely on must exist in each file)
     required_cols = ['question_type', 'question_variable_name', 'answer_variable_label',
                      'Indicator description', 'Filtre', 'Disag', 'Sector', 'Sujet', 'Value']
     for col in required_cols:
-        if col not in df.columns:
+        if col not in base.columns:
             raise KeyError(f"Required column '{col}' is missing from the data.")
 
+    df = derive_view(base)
+
     # Recode certain question types
-    df['question_type'] = df['question_type'].replace({
+    question_type_recode = {
         'recoded_variable_categorical': 'select_one',
         'recoded_variable_numeric': 'integer'
-    })
+    }
+    df['question_type'] = map_categories(df['question_type'], lambda x: question_type_recode.get(x, x))
 
     # Example label truncation
     long_phrase = 'De nombreux clients ne peuvent pas payer leurs articles d’une manière que vous pouvez accepter'
-    df['answer_variable_label'] = df['answer_variable_label'].apply(
+    df['answer_variable_label'] = map_categories(
+        df['answer_variable_label'],
         lambda x: long_phrase if str(x).startswith(long_phrase) else x
     )
 
-    # Replace "Toute l'evaluation" with "Tout le pays" in 'Filtre' and 'Disag'
-    df['Filtre'] = df['Filtre'].replace({"Toute l'evaluation": 'Tout le pays'})
-    df['Disag'] = df['Disag'].replace({"Toute l'evaluation": 'Tout le pays'})
-
     # Replace 'Indicateurs transversaux' with 'TOUS LES ARTICLES'
-    df['Sector'].replace({'Indicateurs transversaux': 'TOUS LES ARTICLES'}, inplace=True)
+    df['Sector'] = map_categories(
+        df['Sector'], lambda x: 'TOUS LES ARTICLES' if x == 'Indicateurs transversaux' else x
+    )
 
     # Extract product name from variable
     def extract_product_name(var_name):
@@ -79,7 +68,6 @@ def load_indicateurs_data(DATA_DIR):
                 return var_name.replace(suffix, '')
         return None
 
-    df['Produit'] = df['question_variable_name'].apply(extract_product_name)
 
     # Map codes to product names
     product_mapping = {
@@ -134,20 +122,271 @@ def load_indicateurs_data(DATA_DIR):
         'draw_hoe': 'Houe à tirer',
         'bucket_with_tap': 'Seau avec robinet',
     }
-    df['Produit'] = df['Produit'].map(product_mapping).fillna(df['Produit'])
+    def product_name(var_name):
+        code = extract_product_name(var_name)
+        return product_mapping.get(code, code)
+
+    # Each distinct variable name is resolved once, not once per row
+    df['Produit'] = map_categories(df['question_variable_name'], product_name)
+
+    return df
+
 
+def _indicateurs_view(DATA_DIR):
+    df = build_indicateurs_view(get_icsm_base(DATA_DIR))
+    # Build the filter index at load time rather than in the first session
+    indicateurs_index(df)
     return df
 
 
+# Levels of the filter index, from the outermost to the innermost
+INDEX_LEVELS = ['Sujet', 'Cycle', 'Sector', 'Produit', 'Indicator description', 'Filtre', 'Disag']
+
+
+def indicateurs_index(df):
+    """
+    Return the filter index of df over INDEX_LEVELS, built once per DataFrame.
+
+    The cascading dropdowns and the plots of the three panels read their choices
+    and rows from this index instead of scanning df with boolean masks.
+    """
+    return derived(df, 'indicateurs_index', lambda d: build_filter_index(d, INDEX_LEVELS))
+
+
+def load_indicateurs_data(DATA_DIR):
+    """
+    Load the data of the Indicateurs Non-Tarifaires app.
+
+    The '_ICSM_analyse.xlsx' workbooks of DATA_DIR are read and normalised once by
+    the data registry (each with a 'Cycle' column), which is shared with the
+    "Prix des Produits" tab. This function returns the view cleaned and
+    transformed for the Indicateurs Non-Tarifaires app.
+    """
+    return get_view(DATA_DIR, 'indicateurs', _indicateurs_view)
+
+
+# Number of renders of each plot of the tab, across all sessions (for debugging)
+RENDER_COUNTS = Counter()
+
+
+def resolve_choice(value, choices):
+    """Return `value` if it is one of `choices`, otherwise the first choice (or None)."""
+    if value in choices:
+        return value
+    return choices[0] if choices else None
+
+
+def cascade_state(selects, selection, qtype, niveau_II):
+    """
+    Bundle the resolved state of a panel of cascading dropdowns.
+
+    Parameters:
+    - selects (dict): {input id: (choices, resolved value, value in the browser)}.
+    - selection (dict): The index selection of the plot, without the 'Disag' level.
+    - qtype (str): The question type of the selected indicator, or None.
+    - niveau_II (str): The selected geographic unit, used for 'select_multiple' questions.
+
+    Returns:
+    - state (dict): {'selects': selects, 'output': what the outputs of the panel depend on}.
+    """
+    return {
+        'selects': selects,
+        'output': {'selection': selection, 'qtype': qtype, 'niveau_II': niveau_II},
+    }
+
+
 def get_cycle_choices(df):
     """
-    Return a sorted list of the unique cycles found in df['Cycle'].
+    Return a sorted list of the unique cycles found in df['Cycle'], computed once per DataFrame.
     """
-    cycles = sorted(df['Cycle'].dropna().unique().tolist())
-    return cycles
+    return derived(df, 'indicateurs_cycles', lambda d: sorted(d['Cycle'].dropna().unique().tolist()))
 
 ###################################
-# 2. UI DEFINITION
+# 2. PLOTS
+###################################
+
+# Plotly.js of the plotly version of requirements.txt: the browser draws the figure specs itself
+PLOTLY_JS_URL = 'https://cdn.plot.ly/plotly-2.25.2.min.js'
+
+def create_plot(data_, question_type):
+    """
+    Build the bar chart of the rows of an indicator.
+
+    Parameters:
+    - data_ (pd.DataFrame): The rows of the selected indicator and geographic level.
+    - question_type (str): 'select_one', 'select_multiple' or 'integer'.
+
+    Returns:
+    - fig (go.Figure): An empty figure for other question types.
+    """
+    # Color palettes
+    grey = '#BDBDBD'
+    color_1 = '#F3BEBD'
+    color_2 = '#F27D7C'
+    color_3 = '#EE5859'
+    color_4 = '#C0474A'
+    color_5 = '#792a2e'
+
+    title_text = data_['question_variable_label'].iloc[0]
+    if len(title_text) > 100:
+        title_text = '<br>'.join(textwrap.wrap(title_text, width=100))
+
+    # Plotly layout config
+    layout_config = dict(
+        autosize=True,
+        margin=dict(l=50, r=200, t=100, b=50),
+        title=dict(x=0.4, xanchor='center'),
+        font=dict(family="Arial Narrow", color="#58585A")
+    )
+
+    title_color = "#EE5859"
+    font_family_title = "Arial Narrow"
+
+    if question_type == 'select_one':
+        # Group by Filtre or Disag
+        if 'Disag' in data_.columns and not data_['Disag'].isnull().all():
+            y_axis = 'Disag'
+            y_label = 'Unité Géographique'
+        else:
+            y_axis = 'Filtre'
+            y_label = 'Niveau Géographique'
+
+        plot_data = data_.groupby([y_axis, 'answer_variable_label'], observed=True)['Value'].sum().reset_index()
+        plot_data[[y_axis, 'answer_variable_label']] = plot_data[[y_axis, 'answer_variable_label']].astype(str)
+        categories = plot_data[y_axis].unique().tolist()
+        # Move "Tout le pays" last, if it exists
+        if "Tout le pays" in categories:
+            categories.remove("Tout le pays")
+            categories.append("Tout le pays")
+
+        distinct_answers = plot_data['answer_variable_label'].unique().tolist()
+        # Identify "ne sait pas" answers
+        ne_sait_pas_answers = [
+            ans for ans in distinct_answers
+            if 'ne sait pas' in ans.lower()
+               or 'ne pas répondre' in ans.lower()
+               or 'ne sais pas' in ans.lower()
+        ]
+        n_answers = len(distinct_answers)
+
+        # Basic cycle of 5 colors
+        colors_cycle = [color_1, color_2, color_3, color_4, color_5]
+        answer_to_color = {}
+
+        # Assign grey to "ne sait pas" first
+        for ans in ne_sait_pas_answers:
+            answer_to_color[ans] = grey
+
+        # Filter out "ne sait pas" from main list
+        remaining_answers = [ans for ans in distinct_answers if ans not in ne_sait_pas_answers]
+
+        # Assign colors for the rest
+        if n_answers <= 5:
+            for i, ans in enumerate(remaining_answers):
+                answer_to_color[ans] = colors_cycle[i]
+        else:
+            for i, ans in enumerate(remaining_answers):
+                answer_to_color[ans] = colors_cycle[i % len(colors_cycle)]
+
+        fig = px.bar(
+            plot_data,
+            x='Value',
+            y=y_axis,
+            color='answer_variable_label',
+            orientation='h',
+            text='Value',
+            labels={'Value': 'Pourcentage', y_axis: y_label, 'answer_variable_label': 'Réponses'},
+            title=title_text,
+            category_orders={y_axis: categories},
+            color_discrete_map=answer_to_color
+        )
+        fig.update_layout(**layout_config)
+        fig.update_layout(title_font_color=title_color, title_font_family=font_family_title)
+        fig.update_layout(legend=dict(orientation='v', yanchor='top', y=1, xanchor='left', x=1.02))
+        fig.update_xaxes(range=[0, 100])
+        fig.update_traces(texttemplate='%{text:.1f}%')
+
+        # If only one category, make the bar narrower
+        if len(categories) == 1:
+            for trace in fig.data:
+                trace.width = 0.2
+
+        return fig
+
+    elif question_type == 'select_multiple':
+        plot_data = data_.groupby('answer_variable_label', observed=True)['Value'].sum().reset_index()
+        plot_data['answer_variable_label'] = plot_data['answer_variable_label'].astype(str)
+        plot_data = plot_data.sort_values(by='Value', ascending=False)
+
+        fig = px.bar(
+            plot_data,
+            x='Value',
+            y='answer_variable_label',
+            orientation='h',
+            labels={'Value': 'Pourcentage', 'answer_variable_label': 'Réponses'},
+            title=title_text,
+            color_discrete_sequence=[color_2]
+        )
+        fig.update_layout(**layout_config)
+        fig.update_layout(title_font_color=title_color, title_font_family=font_family_title)
+        fig.update_layout(legend=dict(orientation='v', yanchor='top', y=1, xanchor='left', x=1.02))
+        fig.update_yaxes(autorange='reversed')
+        fig.update_traces(texttemplate='%{x:.1f}%')
+        return fig
+
+    elif question_type == 'integer':
+        if 'Disag' in data_.columns and not data_['Disag'].isnull().all():
+            y_axis = 'Disag'
+            y_label = 'Unité Géographique'
+        else:
+            y_axis = 'Filtre'
+            y_label = 'Niveau Géographique'
+
+        plot_data = data_.groupby(y_axis, observed=True)['Value'].mean().reset_index()
+        plot_data[y_axis] = plot_data[y_axis].astype(str)
+        categories = plot_data[y_axis].unique().tolist()
+        if "Tout le pays" in categories:
+            categories.remove("Tout le pays")
+            categories.append("Tout le pays")
+
+        fig = px.bar(
+            plot_data,
+            x='Value',
+            y=y_axis,
+            orientation='h',
+            labels={'Value': 'Jours', y_axis: y_label},
+            title=title_text,
+            category_orders={y_axis: categories},
+            color_discrete_sequence=[color_2]
+        )
+        fig.update_layout(**layout_config)
+        fig.update_layout(title_font_color=title_color, title_font_family=font_family_title)
+        fig.update_layout(legend=dict(orientation='v', yanchor='top', y=1, xanchor='left', x=1.02))
+        fig.update_traces(texttemplate='%{x:.0f}')
+        return fig
+
+    else:
+        return go.Figure()
+
+
+def figure_spec(fig):
+    """
+    Return the JSON spec (data and layout) of a figure, without its template.
+
+    The template of plotly.express is the same for every figure: it is sent once
+    per session (see plot_template) instead of with each of them.
+    """
+    fig.update_layout(template=None)
+    return fig.to_json()
+
+
+@lru_cache(maxsize=None)
+def plot_template():
+    """Return the default Plotly template (used by plotly.express), as a dict ready to be sent as JSON."""
+    return json.loads(json.dumps(pio.templates[pio.templates.default].to_plotly_json(), cls=PlotlyJSONEncoder))
+
+###################################
+# 3. UI DEFINITION
 ###################################
 
 def indicateurs_ui(cycle_choices):
@@ -194,6 +433,7 @@ def indicateurs_ui(cycle_choices):
             " Indicateurs non tarifaires",
             class_="nav-panel-title"
         ),
+        ui.head_content(ui.tags.script(src=PLOTLY_JS_URL), ui.tags.script(src="plots.js")),
 
         #=== 1) STOCK ET RÉAPPROVISIONNEMENT ===
         ui.nav_panel("Stock et réapprovisionnement",
@@ -232,7 +472,7 @@ def indicateurs_ui(cycle_choices):
                     ui.HTML("<p>Cette page vous permet d’afficher et analyser les données sur la "
                             "disponibilité des stocks, les difficultés de réapprovisionnement et "
                             "les raisons potentielles des ruptures.</p>"),
-                    output_widget("plot_stock"),
+                    ui.div(id="plot_stock", class_="indicateurs-plot"),
                     ui.HTML("<hr><p><strong>Type de question :</strong></p>"),
                     ui.output_text("qtype_stock_out"),
                     style="width:100%; height:auto; overflow:auto; padding:20px;"
@@ -282,7 +522,7 @@ def indicateurs_ui(cycle_choices):
                     ui.HTML("<p>Cette page vous permet d’observer l’origine des produits (importés ou locaux) "
                             "et leur disponibilité sur les marchés. Cela permet d’évaluer la résilience "
                             "des chaînes d’approvisionnement.</p>"),
-                    output_widget("plot_dispo"),
+                    ui.div(id="plot_dispo", class_="indicateurs-plot"),
                     ui.HTML("<hr><p><strong>Type de question :</strong></p>"),
                     ui.output_text("qtype_dispo_out"),
                     style="width:100%; height:auto; overflow:auto; padding:20px;"
@@ -322,7 +562,7 @@ def indicateurs_ui(cycle_choices):
                     ui.HTML("<p>Cette page vous permet d’explorer des indicateurs illustrant la facilité ou la "
                             "difficulté d’accès aux marchés, leur fonctionnement global, et tout autre "
                             "facteur influençant leur performance.</p>"),
-                    output_widget("plot_fonc"),
+                    ui.div(id="plot_fonc", class_="indicateurs-plot"),
                     ui.HTML("<hr><p><strong>Type de question :</strong></p>"),
                     ui.output_text("qtype_fonc_out"),
                     style="width:100%; height:auto; overflow:auto; padding:20px;"
@@ -332,74 +572,46 @@ def indicateurs_ui(cycle_choices):
     )
 
 ###################################
-# 3. SERVER LOGIC
+# 4. SERVER LOGIC
 ###################################
 
 def indicateurs_server(input, output, session, df):
 
-    @reactive.Calc
-    def selected_cycle():
-        """
-        Convert the numeric slider value into a string like "cycle_1".
-        """
-        cycle_num = input.cycle_select_indic()
-        return f"cycle_{cycle_num}"
-
-    # Filtered subsets by topic + cycle
-    @reactive.Calc
-    def data_stock():
-        return df[(df['Sujet'] == 'Stock et réapprovisionnement') &
-                  (df['Cycle'] == selected_cycle())]
-
-    @reactive.Calc
-    def data_dispo():
-        return df[(df['Sujet'] == 'Disponibilité et origine de produits') &
-                  (df['Cycle'] == selected_cycle())]
-
-    @reactive.Calc
-    def data_fonc():
-        return df[(df['Sujet'] == 'Fonctionalité des Marchés') &
-                  (df['Cycle'] == selected_cycle())]
+    # Latest version of df, updated when a new cycle is loaded without restarting the server
+    data = live_view(df)
+    shown = {'df': df}
 
-    # Determine question types
-    @reactive.Calc
-    def question_type_stock():
-        indicator = input.indicator_stock()
-        data_ = data_stock()
-        if indicator:
-            data_ = data_[data_['Indicator description'] == indicator]
-            if not data_.empty:
-                qtype = data_['question_type'].iloc[0]
-                if qtype in ['select_one', 'select_multiple', 'integer']:
-                    return qtype
-        return None
+    @reactive.Effect
+    def update_sliders_after_reload():
+        """Push the cycle range of reloaded data to the three sliders of this session."""
+        df_now = data()
+        if df_now is shown['df']:
+            return
+        shown['df'] = df_now
+        numeric_cycles = [int(c.replace("cycle_", "")) for c in get_cycle_choices(df_now)
+                          if c.replace("cycle_", "").isdigit()]
+        if not numeric_cycles:
+            return
+        for slider_id in ["cycle_select_ind_stock", "cycle_select_ind_disp", "cycle_select_ind_func"]:
+            ui.update_slider(slider_id, min=min(numeric_cycles), max=max(numeric_cycles))
 
     @reactive.Calc
-    def question_type_dispo():
-        indicator = input.indicator_dispo()
-        data_ = data_dispo()
-        if indicator:
-            data_ = data_[data_['Indicator description'] == indicator]
-            if not data_.empty:
-                qtype = data_['question_type'].iloc[0]
-                if qtype in ['select_one', 'select_multiple', 'integer']:
-                    return qtype
-        return None
+    def index():
+        """Filter index of the current data (built once per DataFrame, see indicateurs_index)."""
+        return indicateurs_index(data())
 
-    @reactive.Calc
-    def question_type_fonc():
-        indicator = input.indicator_fonc()
-        data_ = data_fonc()
+    # Question type of the selected indicator, within a topic + cycle
+    def question_type(selection, indicator):
         if indicator:
-            data_ = data_[data_['Indicator description'] == indicator]
-            if not data_.empty:
-                qtype = data_['question_type'].iloc[0]
+            rows = index_rows(index(), {**selection, 'Indicator description': indicator})
+            if len(rows):
+                qtype = index()['frame']['question_type'].iat[rows[0]]
                 if qtype in ['select_one', 'select_multiple', 'integer']:
                     return qtype
         return None
 
     ###################################
-    # 3a. UPDATE FILTERS DYNAMICALLY
+    # 4a. UPDATE FILTERS DYNAMICALLY
     ###################################
 
     #=== REACTIVE CALCS FOR EACH SLIDER ===
@@ -421,413 +633,203 @@ def indicateurs_server(input, output, session, df):
         cycle_num = input.cycle_select_ind_func()   # from the FUNC slider
         return f"cycle_{cycle_num}"
 
-    #=== FILTER DATA FOR EACH TOPIC & CYCLE ===
+    #=== SELECTION OF EACH TOPIC & CYCLE IN THE INDEX ===
     @reactive.Calc
-    def data_stock():
-        return df[
-            (df['Sujet'] == 'Stock et réapprovisionnement') &
-            (df['Cycle'] == selected_cycle_stock())
-        ]
+    def selection_stock():
+        return {'Sujet': 'Stock et réapprovisionnement', 'Cycle': selected_cycle_stock()}
 
     @reactive.Calc
-    def data_dispo():
-        return df[
-            (df['Sujet'] == 'Disponibilité et origine de produits') &
-            (df['Cycle'] == selected_cycle_disp())
-        ]
+    def selection_dispo():
+        return {'Sujet': 'Disponibilité et origine de produits', 'Cycle': selected_cycle_disp()}
 
     @reactive.Calc
-    def data_fonc():
-        return df[
-            (df['Sujet'] == 'Fonctionalité des Marchés') &
-            (df['Cycle'] == selected_cycle_fonc())
-        ]
-
-    # ----------- STOCK -----------
-    @reactive.Effect
-    def update_stock_filters():
-        data_ = data_stock()
-        sectors = data_['Sector'].dropna().unique().tolist()
-        sectors.sort()
-        ui.update_select("sector_stock", choices=sectors)
+    def selection_fonc():
+        return {'Sujet': 'Fonctionalité des Marchés', 'Cycle': selected_cycle_fonc()}
 
-        niveau = data_['Filtre'].dropna().unique().tolist()
-        niveau.sort()
-        ui.update_select("niveau_stock", choices=niveau)
+    #=== RESOLVED STATE OF EACH PANEL ===
+    # Each panel resolves its whole cascade of dropdowns at once: every level
+    # keeps its current value when it is still a valid choice, and otherwise
+    # falls back to the first choice, as the browser would. The resulting
+    # state holds the choices and value of each dropdown, plus what the plot needs.
 
-    @reactive.Effect
-    def update_indicator_stock():
-        sector = input.sector_stock()
-        data_ = data_stock()
-        if sector:
-            data_ = data_[data_['Sector'] == sector]
-            indicators = data_['Indicator description'].dropna().unique().tolist()
-            indicators.sort()
-            ui.update_select("indicator_stock", choices=indicators)
-        else:
-            ui.update_select("indicator_stock", choices=[])
-
-    @reactive.Effect
-    def update_niveau_stock_II():
-        qtype = question_type_stock()
-        data_ = data_stock()
-        sector = input.sector_stock()
-        indicator = input.indicator_stock()
-        niveau = input.niveau_stock()
-
-        if sector:
-            data_ = data_[data_['Sector'] == sector]
-        if indicator:
-            data_ = data_[data_['Indicator description'] == indicator]
-        if niveau:
-            data_ = data_[data_['Filtre'] == niveau]
-
-        if qtype == 'select_multiple':
-            niveau_II = data_['Disag'].dropna().unique().tolist()
-            niveau_II.sort()
-            ui.update_select("niveau_stock_II", choices=niveau_II)
-        else:
-            ui.update_select("niveau_stock_II", choices=[])
-
-    # ----------- DISPO -----------
-    @reactive.Effect
-    def update_dispo_filters():
-        data_ = data_dispo()
-        sectors = data_['Sector'].dropna().unique().tolist()
-        sectors.sort()
-        ui.update_select("sector_dispo", choices=sectors)
-
-        niveau = data_['Filtre'].dropna().unique().tolist()
-        niveau.sort()
-        ui.update_select("niveau_dispo", choices=niveau)
-
-    @reactive.Effect
-    def update_produit_dispo():
-        data_ = data_dispo()
-        sector = input.sector_dispo()
-        if sector and sector != 'TOUS LES ARTICLES':
-            data_ = data_[data_['Sector'] == sector]
-            produits = data_['Produit'].dropna().unique().tolist()
-            produits.sort()
-            ui.update_select("produit_dispo", choices=produits)
-        else:
-            ui.update_select("produit_dispo", choices=[])
-
-    @reactive.Effect
-    def update_indicator_dispo():
-        sector = input.sector_dispo()
-        produit = input.produit_dispo()
-        data_ = data_dispo()
-        if sector:
-            data_ = data_[data_['Sector'] == sector]
-        if produit and sector != 'TOUS LES ARTICLES':
-            data_ = data_[data_['Produit'] == produit]
-        indicators = data_['Indicator description'].dropna().unique().tolist()
-        indicators.sort()
-        ui.update_select("indicator_dispo", choices=indicators)
-        if not indicators:
-            ui.update_select("indicator_dispo", choices=[])
+    @reactive.Calc
+    def state_stock():
+        selection = selection_stock()
+        sectors = index_choices(index(), 'Sector', selection)
+        sector = resolve_choice(input.sector_stock(), sectors)
+        indicators = (index_choices(index(), 'Indicator description', {**selection, 'Sector': sector})
+                      if sector else [])
+        indicator = resolve_choice(input.indicator_stock(), indicators)
+        niveaux = index_choices(index(), 'Filtre', selection)
+        niveau = resolve_choice(input.niveau_stock(), niveaux)
+
+        selection = {**selection, 'Sector': sector, 'Indicator description': indicator, 'Filtre': niveau}
+        qtype = question_type(selection_stock(), indicator)
+        niveaux_II = index_choices(index(), 'Disag', selection) if qtype == 'select_multiple' else []
+        niveau_II = resolve_choice(input.niveau_stock_II(), niveaux_II)
+
+        return cascade_state(
+            selects={
+                'sector_stock': (sectors, sector, input.sector_stock()),
+                'indicator_stock': (indicators, indicator, input.indicator_stock()),
+                'niveau_stock': (niveaux, niveau, input.niveau_stock()),
+                'niveau_stock_II': (niveaux_II, niveau_II, input.niveau_stock_II()),
+            },
+            selection=selection, qtype=qtype, niveau_II=niveau_II
+        )
 
-    @reactive.Effect
-    def update_niveau_dispo_II():
-        qtype = question_type_dispo()
-        data_ = data_dispo()
-        sector = input.sector_dispo()
-        produit = input.produit_dispo()
-        indicator = input.indicator_dispo()
-        niveau = input.niveau_dispo()
-        if sector:
-            data_ = data_[data_['Sector'] == sector]
+    @reactive.Calc
+    def state_dispo():
+        selection = selection_dispo()
+        sectors = index_choices(index(), 'Sector', selection)
+        sector = resolve_choice(input.sector_dispo(), sectors)
+        produits = (index_choices(index(), 'Produit', {**selection, 'Sector': sector})
+                    if sector and sector != 'TOUS LES ARTICLES' else [])
+        produit = resolve_choice(input.produit_dispo(), produits)
+
+        selection = {**selection, 'Sector': sector}
         if produit and sector != 'TOUS LES ARTICLES':
-            data_ = data_[data_['Produit'] == produit]
-        if indicator:
-            data_ = data_[data_['Indicator description'] == indicator]
-        if niveau:
-            data_ = data_[data_['Filtre'] == niveau]
-
-        if qtype == 'select_multiple':
-            niveau_II = data_['Disag'].dropna().unique().tolist()
-            niveau_II.sort()
-            ui.update_select("niveau_dispo_II", choices=niveau_II)
-        else:
-            ui.update_select("niveau_dispo_II", choices=[])
-
-    # ----------- FONC -----------
-    @reactive.Effect
-    def update_fonc_filters():
-        data_ = data_fonc()
-        indicators = data_['Indicator description'].dropna().unique().tolist()
-        indicators.sort()
-        ui.update_select("indicator_fonc", choices=indicators)
+            selection['Produit'] = produit
+        indicators = index_choices(index(), 'Indicator description', selection)
+        indicator = resolve_choice(input.indicator_dispo(), indicators)
+        niveaux = index_choices(index(), 'Filtre', selection_dispo())
+        niveau = resolve_choice(input.niveau_dispo(), niveaux)
+
+        selection = {**selection, 'Indicator description': indicator, 'Filtre': niveau}
+        qtype = question_type(selection_dispo(), indicator)
+        niveaux_II = index_choices(index(), 'Disag', selection) if qtype == 'select_multiple' else []
+        niveau_II = resolve_choice(input.niveau_dispo_II(), niveaux_II)
+
+        return cascade_state(
+            selects={
+                'sector_dispo': (sectors, sector, input.sector_dispo()),
+                'produit_dispo': (produits, produit, input.produit_dispo()),
+                'indicator_dispo': (indicators, indicator, input.indicator_dispo()),
+                'niveau_dispo': (niveaux, niveau, input.niveau_dispo()),
+                'niveau_dispo_II': (niveaux_II, niveau_II, input.niveau_dispo_II()),
+            },
+            selection=selection, qtype=qtype, niveau_II=niveau_II
+        )
 
-        niveau = data_['Filtre'].dropna().unique().tolist()
-        niveau.sort()
-        ui.update_select("niveau_fonc", choices=niveau)
+    @reactive.Calc
+    def state_fonc():
+        selection = selection_fonc()
+        indicators = index_choices(index(), 'Indicator description', selection)
+        indicator = resolve_choice(input.indicator_fonc(), indicators)
+        niveaux = index_choices(index(), 'Filtre', selection)
+        niveau = resolve_choice(input.niveau_fonc(), niveaux)
+
+        selection = {**selection, 'Indicator description': indicator, 'Filtre': niveau}
+        qtype = question_type(selection_fonc(), indicator)
+        niveaux_II = index_choices(index(), 'Disag', selection) if qtype == 'select_multiple' else []
+        niveau_II = resolve_choice(input.niveau_fonc_II(), niveaux_II)
+
+        return cascade_state(
+            selects={
+                'indicator_fonc': (indicators, indicator, input.indicator_fonc()),
+                'niveau_fonc': (niveaux, niveau, input.niveau_fonc()),
+                'niveau_fonc_II': (niveaux_II, niveau_II, input.niveau_fonc_II()),
+            },
+            selection=selection, qtype=qtype, niveau_II=niveau_II
+        )
 
-    @reactive.Effect
-    def update_niveau_fonc_II():
-        qtype = question_type_fonc()
-        data_ = data_fonc()
-        indicator = input.indicator_fonc()
-        niveau = input.niveau_fonc()
+    #=== ONE BATCH OF UPDATES PER USER ACTION ===
+    def settle(state):
+        """
+        Push the resolved dropdowns of a panel in one batch and return its settled output state.
 
-        if indicator:
-            data_ = data_[data_['Indicator description'] == indicator]
-        if niveau:
-            data_ = data_[data_['Filtre'] == niveau]
-
-        if qtype == 'select_multiple':
-            niveau_II = data_['Disag'].dropna().unique().tolist()
-            niveau_II.sort()
-            ui.update_select("niveau_fonc_II", choices=niveau_II)
-        else:
-            ui.update_select("niveau_fonc_II", choices=[])
+        Only the dropdowns whose choices changed, or whose value differs from
+        the browser's, are sent. When the browser echoes the new values back,
+        the panel resolves to the same state: nothing is sent again and the
+        outputs, which depend on the returned value, do not render again.
+        """
+        pushed = {}
+        settled = reactive.Value(None)
+
+        @reactive.Effect
+        def push_updates():
+            current = state()
+            for input_id, (choices, selected, browser_value) in current['selects'].items():
+                last = pushed.get(input_id)
+                # A value already pushed but not echoed back yet does not need to be sent again
+                if (last is None or last[0] != choices
+                        or ((selected or '') != (browser_value or '') and selected != last[1])):
+                    ui.update_select(input_id, choices=choices, selected=selected)
+                    pushed[input_id] = (choices, selected)
+            with reactive.isolate():
+                if settled.get() != current['output']:
+                    settled.set(current['output'])
+
+        return settled
+
+    settled_stock = settle(state_stock)
+    settled_dispo = settle(state_dispo)
+    settled_fonc = settle(state_fonc)
 
     ###################################
-    # 3b. OUTPUTS
+    # 4b. OUTPUTS
     ###################################
 
     # Display question type
     @output
     @render.text
     def qtype_stock_out():
-        qtype = question_type_stock()
-        return qtype if qtype else ""
+        state = settled_stock()
+        return state['qtype'] if state and state['qtype'] else ""
 
     @output
     @render.text
     def qtype_dispo_out():
-        qtype = question_type_dispo()
-        return qtype if qtype else ""
+        state = settled_dispo()
+        return state['qtype'] if state and state['qtype'] else ""
 
     @output
     @render.text
     def qtype_fonc_out():
-        qtype = question_type_fonc()
-        return qtype if qtype else ""
+        state = settled_fonc()
+        return state['qtype'] if state and state['qtype'] else ""
 
     # PLOTS
-    @output
-    @render_widget
-    def plot_stock():
-        sector = input.sector_stock()
-        indicator = input.indicator_stock()
-        niveau = input.niveau_stock()
-        niveau_II = input.niveau_stock_II()
-        data_ = data_stock()
-
-        if sector:
-            data_ = data_[data_['Sector'] == sector]
-        if indicator:
-            data_ = data_[data_['Indicator description'] == indicator]
-        if niveau:
-            data_ = data_[data_['Filtre'] == niveau]
-
-        question_type = question_type_stock()
-        if question_type == 'select_multiple' and niveau_II:
-            data_ = data_[data_['Disag'] == niveau_II]
-
-        if data_.empty:
-            return go.Figure()
-
-        return create_plot(data_, question_type)
-
-    @output
-    @render_widget
-    def plot_dispo():
-        sector = input.sector_dispo()
-        produit = input.produit_dispo()
-        indicator = input.indicator_dispo()
-        niveau = input.niveau_dispo()
-        niveau_II = input.niveau_dispo_II()
-        data_ = data_dispo()
-
-        if sector:
-            data_ = data_[data_['Sector'] == sector]
-        if produit and sector != 'TOUS LES ARTICLES':
-            data_ = data_[data_['Produit'] == produit]
-        if indicator:
-            data_ = data_[data_['Indicator description'] == indicator]
-        if niveau:
-            data_ = data_[data_['Filtre'] == niveau]
-
-        question_type = question_type_dispo()
-        if question_type == 'select_multiple' and niveau_II:
-            data_ = data_[data_['Disag'] == niveau_II]
+    # The figures are sent as JSON specs and drawn by Plotly.js (see www/plots.js)
+    template_sent = {'done': False}
+
+    def plot_settled(name, state):
+        """Return the figure spec of a settled panel state, counting renders in RENDER_COUNTS."""
+        RENDER_COUNTS[name] += 1
+        logging.debug(f"{name} render #{RENDER_COUNTS[name]}")
+        if state is None:
+            return figure_spec(go.Figure())
+
+        selection = dict(state['selection'])
+        if state['qtype'] == 'select_multiple' and state['niveau_II']:
+            selection['Disag'] = state['niveau_II']
+
+        def build():
+            data_ = index_frame(index(), selection)
+            if data_.empty:
+                return figure_spec(go.Figure())
+            return figure_spec(create_plot(data_, state['qtype']))
+
+        # The three panels can show the same plot: they share one cache entry
+        inputs = (tuple(sorted(selection.items())), state['qtype'])
+        return cached_render('indicateurs_plot', data(), inputs, build)
+
+    async def send_plot(name, state):
+        message = {'id': name, 'payload': plot_settled(name, state)}
+        if not template_sent['done']:
+            # The template of the figures, once per session
+            message['template'] = plot_template()
+            template_sent['done'] = True
+        await session.send_custom_message('indicateurs_plot', message)
 
-        if data_.empty:
-            return go.Figure()
-
-        return create_plot(data_, question_type)
-
-    @output
-    @render_widget
-    def plot_fonc():
-        indicator = input.indicator_fonc()
-        niveau = input.niveau_fonc()
-        niveau_II = input.niveau_fonc_II()
-        data_ = data_fonc()
-
-        if indicator:
-            data_ = data_[data_['Indicator description'] == indicator]
-        if niveau:
-            data_ = data_[data_['Filtre'] == niveau]
-
-        question_type = question_type_fonc()
-        if question_type == 'select_multiple' and niveau_II:
-            data_ = data_[data_['Disag'] == niveau_II]
-
-        if data_.empty:
-            return go.Figure()
-
-        return create_plot(data_, question_type)
-
-    ###################################
-    # 3c. HELPER: CREATE PLOT
-    ###################################
-    def create_plot(data_, question_type):
-        # Color palettes
-        grey = '#BDBDBD'
-        color_1 = '#F3BEBD'
-        color_2 = '#F27D7C'
-        color_3 = '#EE5859'
-        color_4 = '#C0474A'
-        color_5 = '#792a2e'
-
-        title_text = data_['question_variable_label'].iloc[0]
-        if len(title_text) > 100:
-            title_text = '<br>'.join(textwrap.wrap(title_text, width=100))
-
-        # Plotly layout config
-        layout_config = dict(
-            autosize=True,
-            margin=dict(l=50, r=200, t=100, b=50),
-            title=dict(x=0.4, xanchor='center'),
-            font=dict(family="Arial Narrow", color="#58585A")
-        )
+    @reactive.Effect
+    async def plot_stock():
+        await send_plot('plot_stock', settled_stock())
 
-        title_color = "#EE5859"
-        font_family_title = "Arial Narrow"
-
-        if question_type == 'select_one':
-            # Group by Filtre or Disag
-            if 'Disag' in data_.columns and not data_['Disag'].isnull().all():
-                y_axis = 'Disag'
-                y_label = 'Unité Géographique'
-            else:
-                y_axis = 'Filtre'
-                y_label = 'Niveau Géographique'
-
-            plot_data = data_.groupby([y_axis, 'answer_variable_label'])['Value'].sum().reset_index()
-            categories = plot_data[y_axis].unique().tolist()
-            # Move "Tout le pays" last, if it exists
-            if "Tout le pays" in categories:
-                categories.remove("Tout le pays")
-                categories.append("Tout le pays")
-
-            distinct_answers = plot_data['answer_variable_label'].unique().tolist()
-            # Identify "ne sait pas" answers
-            ne_sait_pas_answers = [
-                ans for ans in distinct_answers
-                if 'ne sait pas' in ans.lower()
-                   or 'ne pas répondre' in ans.lower()
-                   or 'ne sais pas' in ans.lower()
-            ]
-            n_answers = len(distinct_answers)
-
-            # Basic cycle of 5 colors
-            colors_cycle = [color_1, color_2, color_3, color_4, color_5]
-            answer_to_color = {}
-
-            # Assign grey to "ne sait pas" first
-            for ans in ne_sait_pas_answers:
-                answer_to_color[ans] = grey
-
-            # Filter out "ne sait pas" from main list
-            remaining_answers = [ans for ans in distinct_answers if ans not in ne_sait_pas_answers]
-
-            # Assign colors for the rest
-            if n_answers <= 5:
-                for i, ans in enumerate(remaining_answers):
-                    answer_to_color[ans] = colors_cycle[i]
-            else:
-                for i, ans in enumerate(remaining_answers):
-                    answer_to_color[ans] = colors_cycle[i % len(colors_cycle)]
-
-            fig = px.bar(
-                plot_data,
-                x='Value',
-                y=y_axis,
-                color='answer_variable_label',
-                orientation='h',
-                text='Value',
-                labels={'Value': 'Pourcentage', y_axis: y_label, 'answer_variable_label': 'Réponses'},
-                title=title_text,
-                category_orders={y_axis: categories},
-                color_discrete_map=answer_to_color
-            )
-            fig.update_layout(**layout_config)
-            fig.update_layout(title_font_color=title_color, title_font_family=font_family_title)
-            fig.update_layout(legend=dict(orientation='v', yanchor='top', y=1, xanchor='left', x=1.02))
-            fig.update_xaxes(range=[0, 100])
-            fig.update_traces(texttemplate='%{text:.1f}%')
-
-            # If only one category, make the bar narrower
-            if len(categories) == 1:
-                for trace in fig.data:
-                    trace.width = 0.2
-
-            return fig
-
-        elif question_type == 'select_multiple':
-            plot_data = data_.groupby('answer_variable_label')['Value'].sum().reset_index()
-            plot_data = plot_data.sort_values(by='Value', ascending=False)
-
-            fig = px.bar(
-                plot_data,
-                x='Value',
-                y='answer_variable_label',
-                orientation='h',
-                labels={'Value': 'Pourcentage', 'answer_variable_label': 'Réponses'},
-                title=title_text,
-                color_discrete_sequence=[color_2]
-            )
-            fig.update_layout(**layout_config)
-            fig.update_layout(title_font_color=title_color, title_font_family=font_family_title)
-            fig.update_layout(legend=dict(orientation='v', yanchor='top', y=1, xanchor='left', x=1.02))
-            fig.update_yaxes(autorange='reversed')
-            fig.update_traces(texttemplate='%{x:.1f}%')
-            return fig
-
-        elif question_type == 'integer':
-            if 'Disag' in data_.columns and not data_['Disag'].isnull().all():
-                y_axis = 'Disag'
-                y_label = 'Unité Géographique'
-            else:
-                y_axis = 'Filtre'
-                y_label = 'Niveau Géographique'
-
-            plot_data = data_.groupby(y_axis)['Value'].mean().reset_index()
-            categories = plot_data[y_axis].unique().tolist()
-            if "Tout le pays" in categories:
-                categories.remove("Tout le pays")
-                categories.append("Tout le pays")
-
-            fig = px.bar(
-                plot_data,
-                x='Value',
-                y=y_axis,
-                orientation='h',
-                labels={'Value': 'Jours', y_axis: y_label},
-                title=title_text,
-                category_orders={y_axis: categories},
-                color_discrete_sequence=[color_2]
-            )
-            fig.update_layout(**layout_config)
-            fig.update_layout(title_font_color=title_color, title_font_family=font_family_title)
-            fig.update_layout(legend=dict(orientation='v', yanchor='top', y=1, xanchor='left', x=1.02))
-            fig.update_traces(texttemplate='%{x:.0f}')
-            return fig
+    @reactive.Effect
+    async def plot_dispo():
+        await send_plot('plot_dispo', settled_dispo())
 
-        else:
-            return go.Figure()
+    @reactive.Effect
+    async def plot_fonc():
+        await send_plot('plot_fonc', settled_fonc())
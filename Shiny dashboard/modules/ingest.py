@@ -0,0 +1,200 @@
+# modules/ingest.py
+
+import os
+import hashlib
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import pyarrow as pa
+
+# Bump this whenever the way a workbook is turned into a DataFrame changes,
+# so that every cached columnar copy is rebuilt on the next start.
+LOADER_VERSION = 1
+
+CACHE_DIR_NAME = '.cache'
+
+# Upper bound on the number of processes used to parse workbooks
+MAX_WORKERS = int(os.environ.get('ICSM_MAX_WORKERS', 8))
+
+
+def file_hash(file_path, chunk_size=1 << 20):
+    """
+    Return the hex digest of the content of a file.
+
+    The file is read in chunks so that large workbooks are never held in memory twice.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_path_for(file_path, content_hash=None):
+    """
+    Return the path of the Parquet copy of an Excel workbook.
+
+    The copy lives in a '.cache' directory next to the workbook and its name
+    carries the workbook content hash and the loader version, e.g.
+    'data/.cache/cycle_1_ICSM_analyse.3f2a...-v1.parquet'.
+    """
+    if content_hash is None:
+        content_hash = file_hash(file_path)
+    directory, file = os.path.split(file_path)
+    stem = os.path.splitext(file)[0]
+    return os.path.join(directory, CACHE_DIR_NAME, f"{stem}.{content_hash}-v{LOADER_VERSION}.parquet")
+
+
+def _remove_stale_copies(cache_path):
+    """Delete older Parquet copies of the same workbook (other hash or loader version)."""
+    directory, cache_file = os.path.split(cache_path)
+    stem = cache_file[:-len('.parquet')].rsplit('.', 1)[0]
+    for f in os.listdir(directory):
+        if f != cache_file and f.startswith(stem + '.') and f.endswith('.parquet'):
+            try:
+                os.remove(os.path.join(directory, f))
+            except OSError as e:
+                logging.warning(f"Could not remove stale cache file {f}: {e}")
+
+
+def read_excel_cached(file_path, content_hash=None):
+    """
+    Read an Excel workbook through an on-disk Parquet cache.
+
+    The first read parses the workbook with pd.read_excel and writes a Parquet copy
+    keyed on the workbook content hash and LOADER_VERSION. Later reads load the
+    Parquet copy directly as long as the workbook has not changed.
+    If the cache cannot be read or written (read-only disk, mixed-type columns...), the workbook is simply parsed as before.
+
+    Parameters:
+    - file_path (str): Path of the Excel workbook.
+    - content_hash (str): The content hash of the workbook, if the caller already computed it.
+
+    Returns:
+    - df (pd.DataFrame): The content of the first sheet of the workbook.
+    """
+    cache_path = cache_path_for(file_path, content_hash)
+
+    if os.path.exists(cache_path):
+        try:
+            return pd.read_parquet(cache_path)
+        except Exception as e:
+            logging.warning(f"Ignoring unreadable cache file {cache_path}: {e}")
+
+    df = pd.read_excel(file_path)
+
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        df.to_parquet(tmp_path, index=False)
+        # Rename into place so that concurrent workers never read a half-written file
+        os.replace(tmp_path, cache_path)
+        _remove_stale_copies(cache_path)
+    except Exception as e:
+        logging.warning(f"Could not cache {os.path.basename(file_path)} as Parquet: {e}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return df
+
+
+def list_cycle_files(DATA_DIR, suffix):
+    """
+    Return the sorted names of the files in DATA_DIR ending with `suffix` (e.g. '_ICSM_analyse.xlsx').
+
+    Raises FileNotFoundError when no such file exists.
+    """
+    files = sorted(f for f in os.listdir(DATA_DIR) if f.endswith(suffix))
+    if not files:
+        raise FileNotFoundError(f"No Excel files ending with '{suffix}' found in the specified directory.")
+    return files
+
+
+def _read_workbook_as_arrow(file_path, content_hash):
+    """Process pool task: read one workbook (through the cache) and return it as an Arrow table."""
+    return pa.Table.from_pandas(read_excel_cached(file_path, content_hash), preserve_index=False)
+
+
+def _pool_size(n_tasks):
+    """Number of worker processes to use for `n_tasks` workbooks (0 means read in this process)."""
+    # Never start a pool from a pool worker (e.g. when the package is re-imported by a spawned worker)
+    if n_tasks < 2 or multiprocessing.parent_process() is not None:
+        return 0
+    n_workers = min(n_tasks, os.cpu_count() or 1, MAX_WORKERS)
+    return n_workers if n_workers > 1 else 0
+
+
+def read_workbooks(file_paths, parallel=True):
+    """
+    Read several workbooks, parsing the ones missing from the cache in parallel.
+
+    Workbooks that already have a valid Parquet copy are read in this process.
+    The others are parsed by openpyxl, which is CPU-bound and holds the GIL, so they
+    are fanned out across a process pool, one task per workbook. Each task returns
+    an Arrow table, which is cheap to send back to the parent process.
+
+    Parameters:
+    - file_paths (list): Paths of the Excel workbooks.
+    - parallel (bool): Set to False to parse every workbook in this process. This is
+      required while the `modules` package itself is being imported: the pool would
+      need to import it again to send the tasks, and would wait forever on the import lock.
+
+    Returns:
+    - dfs (list): One DataFrame per workbook, in the order of `file_paths`.
+    """
+    def read_here(file_path, content_hash):
+        try:
+            return read_excel_cached(file_path, content_hash)
+        except Exception as e:
+            raise ValueError(f"Error reading the Excel file {os.path.basename(file_path)}: {e}")
+
+    # Each workbook is hashed once, here, and its hash passed on to the readers
+    hashes = [file_hash(file_path) for file_path in file_paths]
+    dfs = [None] * len(file_paths)
+    to_parse = []
+    for i, file_path in enumerate(file_paths):
+        if os.path.exists(cache_path_for(file_path, hashes[i])):
+            dfs[i] = read_here(file_path, hashes[i])
+        else:
+            to_parse.append(i)
+
+    n_workers = _pool_size(len(to_parse)) if parallel else 0
+    if n_workers == 0:
+        for i in to_parse:
+            dfs[i] = read_here(file_paths[i], hashes[i])
+        return dfs
+
+    logging.info(f"Parsing {len(to_parse)} workbooks with {n_workers} processes")
+    with ProcessPoolExecutor(max_workers=n_workers) as pool:
+        futures = {i: pool.submit(_read_workbook_as_arrow, file_paths[i], hashes[i]) for i in to_parse}
+        for i, future in futures.items():
+            try:
+                dfs[i] = future.result().to_pandas()
+            except Exception as e:
+                raise ValueError(f"Error reading the Excel file {os.path.basename(file_paths[i])}: {e}")
+    return dfs
+
+
+def read_cycle_workbooks(DATA_DIR, suffix, parallel=True):
+    """
+    Read every workbook of DATA_DIR ending with `suffix` and merge them into a single DataFrame.
+
+    Each workbook is annotated with a 'Cycle' column extracted from its file name
+    (e.g. 'cycle_1' from 'cycle_1_ICSM_analyse.xlsx'). Workbooks that are not
+    cached yet are parsed in parallel (see read_workbooks).
+
+    Parameters:
+    - DATA_DIR (str): The directory where the Excel data files are located.
+    - suffix (str): The file name suffix shared by the workbooks of all cycles.
+    - parallel (bool): Whether workbooks missing from the cache may be parsed in a process pool.
+
+    Returns:
+    - df (pd.DataFrame): The merged DataFrame.
+    """
+    files = list_cycle_files(DATA_DIR, suffix)
+    list_dfs = read_workbooks([os.path.join(DATA_DIR, file) for file in files], parallel=parallel)
+    for file, df_temp in zip(files, list_dfs):
+        df_temp['Cycle'] = file.split(suffix)[0]
+    return pd.concat(list_dfs, ignore_index=True)
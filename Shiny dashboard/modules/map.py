@@ -1,62 +1,133 @@
 # modules/map.py
 
-from shiny import ui, render
+from shiny import ui, render, reactive
 from shiny.ui import tags, modal, modal_show
+import numpy as np
 import pandas as pd
-import geopandas as gpd
 import os
-import folium
-from folium.plugins import MarkerCluster
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .ingest import read_excel_cached, read_cycle_workbooks, list_cycle_files
+from .data_registry import get_view, live_named_view, derived
+from .boundaries import AREA_LEVELS, assign_admin_units, boundary_urls
+from .tiles import TILES_URL, TILE_LEVELS, TILE_MAX_ZOOM, tile_server_mounted
 
 # Define the data paths
 DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+MFS_SUFFIX = '_mfs.xlsx'
+
+# Seconds between two checks, by each session, of whether the map data is loaded
+MAP_READY_POLL_INTERVAL = 0.5
+
+# Element of the Leaflet map, created once per page by www/map.js
+MAP_ID = 'mfs-map'
+
+# Leaflet and its plugins, loaded by the page (the versions used by folium)
+MAP_DEPENDENCIES = [
+    ('css', 'https://cdn.jsdelivr.net/npm/leaflet@1.9.3/dist/leaflet.css'),
+    ('css', 'https://cdnjs.cloudflare.com/ajax/libs/Leaflet.awesome-markers/2.0.2/leaflet.awesome-markers.css'),
+    ('css', 'https://cdnjs.cloudflare.com/ajax/libs/leaflet.markercluster/1.1.0/MarkerCluster.css'),
+    ('css', 'https://cdnjs.cloudflare.com/ajax/libs/leaflet.markercluster/1.1.0/MarkerCluster.Default.css'),
+    ('js', 'https://cdn.jsdelivr.net/npm/leaflet@1.9.3/dist/leaflet.js'),
+    ('js', 'https://cdnjs.cloudflare.com/ajax/libs/Leaflet.awesome-markers/2.0.2/leaflet.awesome-markers.js'),
+    ('js', 'https://cdnjs.cloudflare.com/ajax/libs/leaflet.markercluster/1.1.0/leaflet.markercluster.js'),
+    ('js', 'https://unpkg.com/leaflet.vectorgrid@1.3.0/dist/Leaflet.VectorGrid.bundled.js'),
+    ('js', 'map.js'),
+]
+
+# Base map, boundaries and view sent once per session in the 'mfs_map_init' message
+MAP_TILES = {
+    'name': 'cartodbpositron',
+    'url': 'https://{s}.basemaps.cartocdn.com/light_all/{z}/{x}/{y}{r}.png',
+    'attribution': '&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> '
+                   'contributors &copy; <a href="https://carto.com/attributions">CARTO</a>',
+}
+# Admin level, name in the layer control and line width of the outlines. The communal
+# sections are only drawn from the vector tiles (see tiles.with_tile_server).
+MAP_BOUNDARIES = [
+    ('adm3', 'Sections communales', 0.5),
+    ('adm2', 'Communes', 1),
+    ('adm1', 'Départements', 2),
+    ('adm0', 'Pays', 4),
+]
+
+# What the map shows: the markets, or the admin units shaded by the scores of their markets
+MAP_MODES = {
+    'markets': 'Marchés',
+    'adm1': 'Départements',
+    'adm2': 'Communes',
+    'adm3': 'Sections communales',
+}
 
 # --- Load and prepare data for "Score de Fonctionnalité des marchés" ---
+# The workbooks are read in a background thread (see start_map_data), so that the
+# app starts and serves its other tabs without waiting for them.
+_map_data = {'future': None}
+_map_data_lock = threading.Lock()
+
+
+def build_markets_data(DATA_DIR):
+    """
+    Merge the marketplace list with the MFS analysis of every cycle.
+    """
+    # Load market data
+    icsm_marketplaces = read_excel_cached(os.path.join(DATA_DIR, 'ICSM_Marketplaces.xlsx'))
+
+    # Merge all Excel files ending with '_mfs.xlsx', each with a 'Cycle' column.
+    # The first load runs in the background thread of start_map_data, without a process pool.
+    mfs_analysis = read_cycle_workbooks(DATA_DIR, MFS_SUFFIX, parallel=False)
+
+    # Merge marketplace info with the MFS analysis
+    markets_df = pd.merge(icsm_marketplaces, mfs_analysis, on='marketplace')
+    markets_df.columns = markets_df.columns.str.strip()
+    markets_df['marketplace'] = markets_df['marketplace'].str.strip()
 
-# Load shapefiles
-shapefile_dir = os.path.join(DATA_DIR, 'Shapefiles', 'hti_adm_cnigs_20181129')
-country_shp = gpd.read_file(os.path.join(shapefile_dir, 'hti_admbnda_adm0_cnigs_20181129.shp'))
-departments_shp = gpd.read_file(os.path.join(shapefile_dir, 'hti_admbnda_adm1_cnigs_20181129.shp'))
-communes_shp = gpd.read_file(os.path.join(shapefile_dir, 'hti_admbnda_adm2_cnigs_20181129.shp'))
+    # The colour bins and legends of the map are computed once here, for every cycle and indicator
+    map_bins(markets_df)
+    return markets_df
 
-def convert_datetime_columns_to_str(gdf):
-    for col in gdf.columns:
-        if pd.api.types.is_datetime64_any_dtype(gdf[col]):
-            gdf[col] = gdf[col].astype(str)
-    return gdf
 
-country_shp = convert_datetime_columns_to_str(country_shp)
-departments_shp = convert_datetime_columns_to_str(departments_shp)
-communes_shp = convert_datetime_columns_to_str(communes_shp)
+def _load_map_data(DATA_DIR):
+    # The boundaries are simplified once, offline (see boundaries.build_boundary_assets)
+    boundaries = boundary_urls()
+    markets_df = get_view(DATA_DIR, 'markets', build_markets_data)
+    # Aggregated once here, so that the first session showing the map or the admin units does not wait
+    map_feature_collections(markets_df)
+    admin_scores(markets_df)
+    logging.info(f"Map data loaded: {len(markets_df)} market rows")
+    return {'boundaries': boundaries, 'markets': markets_df}
 
-# Load market data
-icsm_marketplaces = pd.read_excel(os.path.join(DATA_DIR, 'ICSM_Marketplaces.xlsx'))
 
-# Loop through all Excel files ending with '_mfs.xlsx'
-excel_files = [f for f in os.listdir(DATA_DIR) if f.endswith('_mfs.xlsx')]
-if not excel_files:
-    raise FileNotFoundError("No Excel files ending with '_mfs.xlsx' found in the specified directory.")
+def start_map_data(DATA_DIR=DATA_DIR):
+    """
+    Start loading the map data in a background thread, once per process.
 
-list_dfs = []
-for file in excel_files:
-    file_path = os.path.join(DATA_DIR, file)
-    try:
-        df_temp = pd.read_excel(file_path)
-    except Exception as e:
-        raise ValueError(f"Error reading the Excel file {file}: {e}")
+    Returns:
+    - future (concurrent.futures.Future): Done when the data is loaded. Its result is
+      {'boundaries': {level: URL} (see boundaries.boundary_urls), 'markets': pd.DataFrame};
+      the markets are those of the first load (sessions follow reloads with live_named_view).
+    """
+    with _map_data_lock:
+        if _map_data['future'] is None:
+            executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='map-data')
+            _map_data['future'] = executor.submit(_load_map_data, DATA_DIR)
+            # The thread exits once the data is loaded
+            executor.shutdown(wait=False)
+        return _map_data['future']
 
-    # Extract the cycle name from the file name (e.g. 'cycle_1' from 'cycle_1_mfs.xlsx')
-    cycle_name = file.split('_mfs.xlsx')[0]
-    df_temp['Cycle'] = cycle_name
 
-    list_dfs.append(df_temp)
+def map_data_ready():
+    """Return whether the map data was loaded successfully (the readiness check of tiles.with_tile_server)."""
+    future = _map_data['future']
+    return future is not None and future.done() and future.exception() is None
 
-mfs_analysis = pd.concat(list_dfs, ignore_index=True)
 
-# Merge marketplace info with the MFS analysis
-markets_df = pd.merge(icsm_marketplaces, mfs_analysis, on='marketplace')
-markets_df.columns = markets_df.columns.str.strip()
-markets_df['marketplace'] = markets_df['marketplace'].str.strip()
+def map_cycle_numbers(DATA_DIR=DATA_DIR):
+    """Return the sorted cycle numbers of the MFS workbooks, from their file names only."""
+    return sorted(int(f.split(MFS_SUFFIX)[0].replace("cycle_", "")) for f in list_cycle_files(DATA_DIR, MFS_SUFFIX))
 
 # Indicators
 numerical_indicators = {
@@ -124,15 +195,7 @@ def create_legend_html(thresholds, colors, indicator_label):
     Create a legend for numerical indicators with thresholds.
     """
     legend_html = f'''
-    <div style="
-        position: fixed; 
-        bottom: 40px; right: 20px; width: 270px; height: auto;
-        border:2px solid grey; z-index:9999; font-size:14px;
-        background-color:white; opacity: 0.9;
-        padding: 10px;
-        border-radius: 5px;
-        box-shadow: 2px 2px 5px rgba(0,0,0,0.3);
-        ">
+    <div class="map-legend">
      &nbsp;<b>{indicator_label}</b><br><br>
     '''
     for i in range(len(colors)):
@@ -153,15 +216,7 @@ def create_categorical_legend_html(categories, colors, indicator_label):
     to a visible hex code for the squares.
     """
     legend_html = f'''
-    <div style="
-        position: fixed; 
-        bottom: 40px; right: 20px; width: 270px; height: auto;
-        border:2px solid grey; z-index:9999; font-size:14px;
-        background-color:white; opacity: 0.9;
-        padding: 10px;
-        border-radius: 5px;
-        box-shadow: 2px 2px 5px rgba(0,0,0,0.3);
-        ">
+    <div class="map-legend">
      &nbsp;<b>{indicator_label}</b><br><br>
     '''
     for category, color in zip(categories, colors):
@@ -174,264 +229,320 @@ def create_categorical_legend_html(categories, colors, indicator_label):
     legend_html += '</div>'
     return legend_html
 
-def map_output(input):
-    """
-    Build the Folium map using:
-      - cycle_select_map (an integer slider)
-      - indicator_select
-    Then compare the selected cycle vs. previous cycle if available.
-    We keep the previous marker format (colored icons). 
-    Popup shows "Cycle actuel" / "Cycle précédent" instead of cycle_xx labels.
+# Colours of the quartiles of the numerical indicators, from the lowest to the highest
+quartile_colors = ['red', 'lightred', 'orange', 'green']
+
+# Colours of sum_low_dimensions: 1 -> orange, 2 -> lightred, >= 3 -> red
+low_dimensions_colors = ['orange', 'lightred', 'red']
+
+# Decimals of the values shown in the popups
+indicator_decimals = {key: 1 for key in numerical_indicators}
+indicator_decimals['sum_low_dimensions'] = 0
+
+# Every marker colour; the bins of the markets are stored as indexes into this list
+marker_colors = ['red', 'lightred', 'orange', 'green', 'gray']
+
+
+def merge_cycles(markets_df, selected_cycle_int):
     """
+    Return the markets of a cycle with their values of the previous cycle (if any).
 
-    # Determine selected cycle, e.g. 2 => "cycle_2"
-    selected_cycle_int = input.cycle_select_map()
+    The columns of the selected cycle end with '_current' and those of the previous
+    cycle with '_prev'; the '_prev' indicators are empty for the first cycle.
+    """
     selected_cycle_str = f"cycle_{selected_cycle_int}"
-
-    # Previous cycle (if any)
+    current_df = markets_df[markets_df["Cycle"] == selected_cycle_str]
     if selected_cycle_int > 1:
-        prev_cycle_str = f"cycle_{selected_cycle_int - 1}"
-    else:
-        prev_cycle_str = None
-
-    # Filter for the current cycle
-    current_df = markets_df[markets_df["Cycle"] == selected_cycle_str].copy()
-    # Merge with previous if it exists
-    if prev_cycle_str is not None:
-        prev_df = markets_df[markets_df["Cycle"] == prev_cycle_str].copy()
-        merged_df = pd.merge(
-            current_df,
-            prev_df,
-            on="marketplace",
-            how="left",
-            suffixes=("_current", "_prev")
-        )
-    else:
-        merged_df = current_df.copy()
-        # rename columns => *_current (except for marketplace)
-        for col in merged_df.columns:
-            if col != "marketplace":
-                merged_df.rename(columns={col: col + "_current"}, inplace=True)
-        # Add dummy prev columns
-        for ind in indicator_choices.keys():
-            merged_df[ind + "_prev"] = None
-
-    # Identify which indicator is selected
-    label_to_key = {v: k for k, v in indicator_labels.items()}
-    selected_label = input.indicator_select()
-    selected_key = label_to_key.get(selected_label, "mfs_total_score")
-
-    indicator_info = indicator_choices[selected_key]
-    indicator_type = indicator_info['type']
-    selected_icon = indicator_icons.get(selected_key, 'info-circle')
-
-    # Build Folium map
-    m = folium.Map(
-        location=[19.0, -72.0],
-        zoom_start=8,
-        tiles='cartodbpositron',
-    )
-    folium.GeoJson(
-        data=communes_shp,
-        name='Communes',
-        style_function=lambda x: {'color': '#737373', 'weight': 1, 'fillOpacity': 0}
-    ).add_to(m)
-    folium.GeoJson(
-        data=departments_shp,
-        name='Départements',
-        style_function=lambda x: {'color': '#737373', 'weight': 2, 'fillOpacity': 0}
-    ).add_to(m)
-    folium.GeoJson(
-        data=country_shp,
-        name='Pays',
-        style_function=lambda x: {'color': '#737373', 'weight': 4, 'fillOpacity': 0}
-    ).add_to(m)
-
-    marker_cluster = MarkerCluster(name='Indicateurs de marché').add_to(m)
-
-    # ------------------------------------------------------
-    # 1) Numerical Indicators
-    # ------------------------------------------------------
-    if indicator_type == 'numerical':
-        curr_col = selected_key + "_current"
-        valid_rows = merged_df[~merged_df[curr_col].isna()]
-
-        # compute threshold color bins from current values
-        if not valid_rows.empty:
-            values = valid_rows[curr_col]
-            q25, q50, q75 = values.quantile([0.25, 0.5, 0.75]).tolist()
-            min_val = values.min()
-            max_val = values.max()
-            thresholds = [min_val, q25, q50, q75, max_val]
+        prev_df = markets_df[markets_df["Cycle"] == f"cycle_{selected_cycle_int - 1}"]
+        return pd.merge(current_df, prev_df, on="marketplace", how="left", suffixes=("_current", "_prev"))
+
+    merged_df = current_df.rename(columns={col: col + "_current" for col in current_df.columns if col != "marketplace"})
+    for ind in indicator_choices.keys():
+        merged_df[ind + "_prev"] = None
+    return merged_df
+
+
+def indicator_bins(key, values):
+    """
+    Bin the values of an indicator into marker colours, and build its legend.
+
+    Parameters:
+    - key (str): The indicator (a key of indicator_choices).
+    - values (pd.Series): The values of the selected cycle.
+
+    Returns:
+    - codes (np.ndarray): The colour of each value, as an int8 index into marker_colors ('gray' if unknown).
+    - thresholds (list): The quartile bounds [min, q25, q50, q75, max] of a numerical indicator, else None.
+    - legend_html (str): The legend of the indicator ('' if no value is classified).
+    """
+    thresholds = None
+    if indicator_choices[key]['type'] == 'numerical':
+        valid = values.dropna()
+        if not valid.empty:
+            q25, q50, q75 = valid.quantile([0.25, 0.5, 0.75]).tolist()
+            thresholds = [valid.min(), q25, q50, q75, valid.max()]
         else:
             thresholds = [0, 0, 0, 0, 0]
+        # A value on a threshold belongs to the lower quartile
+        bins = np.digitize(values.to_numpy(dtype=float), thresholds[1:4], right=True)
+        colors = np.where(values.isna(), 'gray', np.array(quartile_colors, dtype=object)[bins])
+        legend_html = create_legend_html(thresholds, quartile_colors, indicator_labels[key])
+
+    elif key == 'sum_low_dimensions':
+        v = values.to_numpy(dtype=float)
+        colors = np.select([v >= 3, v == 2, v == 1], low_dimensions_colors[::-1], 'gray')
+        legend_title = f"{indicator_choices[key]['rename']} (dimensions < 50% de leur score max)"
+        legend_html = create_categorical_legend_html(['1', '2', '≥ 3'], low_dimensions_colors, legend_title)
 
-        colors = ['red', 'lightred', 'orange', 'green']
-
-        def get_color(v):
-            for i in range(len(thresholds) - 1):
-                if thresholds[i] <= v <= thresholds[i+1]:
-                    return colors[i]
-            return 'gray'
-
-        for idx, row in merged_df.iterrows():
-            lat = row.get("latitude_current", None)
-            lon = row.get("longitude_current", None)
-            curr_val = row.get(curr_col, None)
-
-            if pd.isna(lat) or pd.isna(lon) or pd.isna(curr_val):
-                continue
-
-            marketplace_name = row.get("marketplace", "Unknown")
-            color_bg = get_color(curr_val)  # background color from thresholds
-
-            prev_val = row.get(selected_key + "_prev", None)
-            # Build popup: "Cycle actuel" / "Cycle précédent"
-            current_str = f"Cycle actuel: {round(curr_val,1)}"
-            if prev_cycle_str and pd.notna(prev_val):
-                prev_str = f"Cycle précédent: {round(prev_val,1)}"
-            else:
-                prev_str = "(Pas de cycle précédent)"
-
-            popup_html = f"""
-            <table style='width:220px;'>
-              <tr><td colspan='2'><b>{marketplace_name}</b></td></tr>
-              <tr><td>{current_str}</td><td></td></tr>
-              <tr><td>{prev_str}</td><td></td></tr>
-            </table>
-            """
-
-            folium.Marker(
-                location=[lat, lon],
-                popup=folium.Popup(popup_html, max_width=250),
-                icon=folium.Icon(
-                    color=color_bg,
-                    prefix='fa',
-                    icon=selected_icon
-                )
-            ).add_to(marker_cluster)
-
-        # numerical legend
-        legend_html = create_legend_html(thresholds, colors, selected_label)
-        m.get_root().html.add_child(folium.Element(legend_html))
-
-    # ------------------------------------------------------
-    # 2) sum_low_dimensions (categorical approach)
-    # ------------------------------------------------------
-    elif selected_key == 'sum_low_dimensions':
-        # 1 -> orange, 2 -> lightred, >=3 -> red
-        def get_sld_color(v):
-            if v >= 3:
-                return 'red'
-            elif v == 2:
-                return 'lightred'
-            elif v == 1:
-                return 'orange'
-            else:
-                return 'gray'
-
-        curr_col = "sum_low_dimensions_current"
-        prev_col = "sum_low_dimensions_prev"
-
-        for idx, row in merged_df.iterrows():
-            lat = row.get("latitude_current", None)
-            lon = row.get("longitude_current", None)
-            curr_val = row.get(curr_col, None)
-
-            if pd.isna(lat) or pd.isna(lon) or pd.isna(curr_val):
-                continue
-
-            marketplace_name = row.get("marketplace", "Unknown")
-            color_bg = get_sld_color(curr_val)
-
-            prev_val = row.get(prev_col, None)
-            current_str = f"Cycle actuel: {int(curr_val)}"
-            if prev_cycle_str and pd.notna(prev_val):
-                prev_str = f"Cycle précédent: {int(prev_val)}"
-            else:
-                prev_str = "(Pas de cycle précédent)"
-
-            popup_html = f"""
-            <table style='width:220px;'>
-              <tr><td colspan='2'><b>{marketplace_name}</b></td></tr>
-              <tr><td>{current_str}</td><td></td></tr>
-              <tr><td>{prev_str}</td><td></td></tr>
-            </table>
-            """
-
-            folium.Marker(
-                location=[lat, lon],
-                popup=folium.Popup(popup_html, max_width=250),
-                icon=folium.Icon(
-                    color=color_bg,
-                    prefix='fa',
-                    icon=indicator_icons['sum_low_dimensions']
-                )
-            ).add_to(marker_cluster)
-
-        categories = ['1', '2', '≥ 3']
-        legend_colors = ['orange', 'lightred', 'red']
-        legend_title = f"{indicator_info['rename']} (dimensions < 50% de leur score max)"
-        legend_html = create_categorical_legend_html(categories, legend_colors, legend_title)
-        m.get_root().html.add_child(folium.Element(legend_html))
-
-    # ------------------------------------------------------
-    # 3) mfs_functionality_classification (categorical)
-    # ------------------------------------------------------
     else:
-        curr_col = "mfs_functionality_classification_current"
-        prev_col = "mfs_functionality_classification_prev"
-
-        for idx, row in merged_df.iterrows():
-            lat = row.get("latitude_current", None)
-            lon = row.get("longitude_current", None)
-            curr_val = row.get(curr_col, "Unknown")
-
-            if pd.isna(lat) or pd.isna(lon):
-                continue
-
-            marketplace_name = row.get("marketplace", "Unknown")
-            curr_label = classification_labels.get(curr_val, 'Pas connu')
-            color_bg = classification_colors.get(curr_val, 'gray')
-
-            prev_val = row.get(prev_col, None)
-            current_str = f"Cycle actuel: {curr_label}"
-            if prev_cycle_str and pd.notna(prev_val):
-                prev_label = classification_labels.get(prev_val, 'Pas connu')
-                prev_str = f"Cycle précédent: {prev_label}"
-            else:
-                prev_str = "(Pas de cycle précédent)"
-
-            popup_html = f"""
-            <table style='width:220px;'>
-              <tr><td colspan='2'><b>{marketplace_name}</b></td></tr>
-              <tr><td>{current_str}</td><td></td></tr>
-              <tr><td>{prev_str}</td><td></td></tr>
-            </table>
-            """
-
-            folium.Marker(
-                location=[lat, lon],
-                popup=folium.Popup(popup_html, max_width=250),
-                icon=folium.Icon(
-                    color=color_bg,
-                    prefix='fa',
-                    icon=indicator_icons['mfs_functionality_classification']
-                )
-            ).add_to(marker_cluster)
-
-        # Build a legend from whatever classifications we have in the current cycle
-        all_current_vals = merged_df[curr_col].dropna().unique()
-        classifications = [v for v in all_current_vals if v in classification_labels]
+        # mfs_functionality_classification: a legend of the classifications of the selected cycle
+        colors = values.map(classification_colors).fillna('gray').to_numpy(dtype=object)
+        classifications = [v for v in values.dropna().unique() if v in classification_labels]
+        legend_html = ''
         if classifications:
-            cat_labels = [classification_labels[c] for c in classifications]
-            cat_colors = [classification_colors[c] for c in classifications]
-            legend_label = indicator_labels[selected_key]
-            legend_html = create_categorical_legend_html(cat_labels, cat_colors, legend_label)
-            m.get_root().html.add_child(folium.Element(legend_html))
+            legend_html = create_categorical_legend_html(
+                [classification_labels[c] for c in classifications],
+                [classification_colors[c] for c in classifications],
+                indicator_labels[key]
+            )
+
+    codes = pd.Series(colors).map({color: code for code, color in enumerate(marker_colors)})
+    return codes.to_numpy(dtype=np.int8), thresholds, legend_html
+
 
-    folium.LayerControl().add_to(m)
-    return ui.HTML(m._repr_html_())
+def indicator_colors(key, values):
+    """
+    Return the marker colour of every value of an indicator, and its legend (see indicator_bins).
+
+    Returns:
+    - colors (np.ndarray): The colour of each value ('gray' if unknown).
+    - legend_html (str): The legend of the indicator.
+    """
+    codes, _, legend_html = indicator_bins(key, values)
+    return np.array(marker_colors, dtype=object)[codes], legend_html
+
+
+def build_map_bins(markets_df):
+    """
+    Bin every indicator of every cycle once, when the markets are loaded.
+
+    The colours of the markets of a cycle only depend on the values of that
+    cycle, so the map looks them up instead of computing quantiles on each render.
+
+    Parameters:
+    - markets_df (pd.DataFrame): The markets of every cycle (see build_markets_data).
+
+    Returns:
+    - bins (dict):
+      - 'codes' (pd.DataFrame): The colour code (see marker_colors) of each indicator
+        (columns) for each row of markets_df (same index), as int8.
+      - 'thresholds' (pd.DataFrame): The quartile bounds t0..t4 of the numerical
+        indicators, indexed by (Cycle, indicator).
+      - 'legends' (dict): {(Cycle, indicator): legend HTML}.
+    """
+    codes = pd.DataFrame(0, index=markets_df.index, columns=list(indicator_choices), dtype=np.int8)
+    thresholds = []
+    legends = {}
+    for cycle_str, cycle_df in markets_df.groupby("Cycle"):
+        for key in indicator_choices:
+            values = cycle_df[key]
+            if key == 'mfs_functionality_classification':
+                # Markets without a classification are shown as unknown
+                values = values.fillna('Unknown')
+            cycle_codes, bounds, legends[(cycle_str, key)] = indicator_bins(key, values)
+            codes.loc[cycle_df.index, key] = cycle_codes
+            if bounds is not None:
+                thresholds.append([cycle_str, key, *bounds])
+
+    thresholds = pd.DataFrame(thresholds, columns=['Cycle', 'indicator', 't0', 't1', 't2', 't3', 't4'])
+    return {'codes': codes, 'thresholds': thresholds.set_index(['Cycle', 'indicator']), 'legends': legends}
+
+
+def map_bins(markets_df):
+    """Return the bins of the indicators (see build_map_bins), computed once per markets data."""
+    return derived(markets_df, 'map_bins', build_map_bins)
+
+
+def _popup_values(key, values):
+    """Return the values of an indicator as shown in the popups (classifications in French)."""
+    if key == 'mfs_functionality_classification':
+        labels = values.map(classification_labels)
+        return labels.where(values.isna() | labels.notna(), 'Pas connu')
+    return pd.to_numeric(values, errors='coerce')
+
+
+def map_features(markets_df, selected_cycle_int):
+    """
+    Build the markets of a cycle, with every indicator, as a GeoJSON FeatureCollection.
+
+    Each feature carries, for each indicator of indicator_choices, its value of the
+    selected cycle (`<key>`), of the previous cycle (`<key>_prev`) and its marker
+    colour (`<key>_color`). The collection also carries the label, icon, legend and
+    popup decimals of each indicator (`indicators`), so that www/map.js switches
+    indicators without asking the server.
+
+    Parameters:
+    - markets_df (pd.DataFrame): The markets of every cycle (see build_markets_data).
+    - selected_cycle_int (int): The cycle of the slider, e.g. 2 => "cycle_2".
+
+    Returns:
+    - collection (dict): The FeatureCollection.
+    """
+    # The colours and legends are looked up in the bins computed when the markets were loaded
+    bins = map_bins(markets_df)
+    codes = bins['codes'].add_suffix("_code")
+    merged_df = merge_cycles(markets_df.join(codes), selected_cycle_int)
+    merged_df = merged_df[merged_df["latitude_current"].notna() & merged_df["longitude_current"].notna()]
+    palette = np.array(marker_colors, dtype=object)
+
+    properties = pd.DataFrame({'marketplace': merged_df["marketplace"].fillna("Unknown").to_numpy()})
+    indicators = {}
+    for key in indicator_choices:
+        current = merged_df[key + "_current"]
+        if key == 'mfs_functionality_classification':
+            # Markets without a classification are shown as unknown
+            current = current.fillna('Unknown')
+        properties[key] = _popup_values(key, current).to_numpy()
+        properties[key + "_prev"] = _popup_values(key, merged_df[key + "_prev"]).to_numpy()
+        properties[key + "_color"] = palette[merged_df[key + "_code_current"].to_numpy(dtype=int)]
+        indicators[key] = {
+            'label': indicator_labels[key],
+            'icon': indicator_icons.get(key, 'info-circle'),
+            'legend': bins['legends'][(f"cycle_{selected_cycle_int}", key)],
+            'decimals': indicator_decimals.get(key),
+        }
+
+    # NaN becomes null
+    records = json.loads(properties.to_json(orient='records', double_precision=15))
+    coordinates = zip(merged_df["longitude_current"].round(5).tolist(), merged_df["latitude_current"].round(5).tolist())
+    return {
+        'type': 'FeatureCollection',
+        'features': [
+            {'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': list(point)}, 'properties': record}
+            for point, record in zip(coordinates, records)
+        ],
+        'indicators': indicators,
+    }
+
+
+def build_map_feature_collections(markets_df):
+    """
+    Build the markets of every cycle as GeoJSON (see map_features).
+
+    Returns:
+    - collections (dict): {cycle number: JSON of the FeatureCollection}.
+    """
+    cycles = sorted(int(c.replace("cycle_", "")) for c in markets_df["Cycle"].dropna().unique())
+    return {cycle: json.dumps(map_features(markets_df, cycle)) for cycle in cycles}
+
+
+def map_feature_collections(markets_df):
+    """Return the markets of every cycle as GeoJSON (see build_map_feature_collections), built once per markets data."""
+    return derived(markets_df, 'map_features', build_map_feature_collections)
+
+
+def market_admin_units(markets_df):
+    """
+    Return the department, commune and communal section of every marketplace.
+
+    Returns:
+    - units (pd.DataFrame): 'marketplace' and the columns of boundaries.assign_admin_units.
+    """
+    places = markets_df.drop_duplicates("marketplace").dropna(subset=["latitude", "longitude"])
+    units = assign_admin_units(places["longitude"], places["latitude"])
+    units.insert(0, "marketplace", places["marketplace"].to_numpy())
+    return units
+
+
+def _most_frequent(values):
+    counts = values.value_counts()
+    return counts.index[0] if len(counts) else None
+
+
+def build_admin_scores(markets_df):
+    """
+    Aggregate the indicators of the markets by admin unit, for every level of
+    boundaries.AREA_LEVELS and every cycle.
+
+    Each unit gets the mean of the numerical indicators and of sum_low_dimensions
+    over its markets, and their most frequent classification. The colours are
+    binned across the units of the level, as the markers are across markets.
+
+    Parameters:
+    - markets_df (pd.DataFrame): The markets of every cycle (see build_markets_data).
+
+    Returns:
+    - scores (dict): {(level, cycle number): JSON of {'level', 'areas': {pcode: {'name',
+      'markets', <key>, <key>_color}}, 'indicators': {key: {'legend', 'decimals'}}}}.
+    """
+    units = derived(markets_df, 'market_admin_units', market_admin_units)
+    located = markets_df.merge(units, on="marketplace", how="inner")
+    mean_keys = list(numerical_indicators) + ['sum_low_dimensions']
+
+    scores = {}
+    for level in AREA_LEVELS:
+        for cycle_str, cycle_df in located.groupby("Cycle"):
+            groups = cycle_df.groupby(f"{level}_pcode")
+            table = groups[mean_keys].mean()
+            table['mfs_functionality_classification'] = groups['mfs_functionality_classification'].agg(_most_frequent)
+
+            areas = pd.DataFrame({'name': groups[f"{level}_name"].first(), 'markets': groups["marketplace"].nunique()})
+            indicators = {}
+            for key in indicator_choices:
+                values = table[key]
+                # The colours of sum_low_dimensions are those of whole numbers of dimensions
+                colors, legend_html = indicator_colors(key, values.round() if key == 'sum_low_dimensions' else values)
+                areas[key] = _popup_values(key, values)
+                areas[key + "_color"] = [fix_color_for_legend(c) for c in colors]
+                # Means have decimals, even those of sum_low_dimensions
+                indicators[key] = {'legend': legend_html,
+                                   'decimals': None if key == 'mfs_functionality_classification' else 1}
+
+            payload = {
+                'level': level,
+                'areas': json.loads(areas.to_json(orient='index', double_precision=15)),
+                'indicators': indicators,
+            }
+            scores[(level, int(cycle_str.replace("cycle_", "")))] = json.dumps(payload)
+    return scores
+
+
+def admin_scores(markets_df):
+    """Return the scores of the admin units (see build_admin_scores), computed once per markets data."""
+    return derived(markets_df, 'map_admin_scores', build_admin_scores)
+
+
+def map_init_message(boundaries):
+    """
+    Return the 'mfs_map_init' message, which creates the Leaflet map of www/map.js.
+
+    The outlines are drawn from the vector tiles if they are served next to the app,
+    else from the static GeoJSON files.
+
+    Parameters:
+    - boundaries (dict): {level: URL} of the simplified boundaries (see boundaries.boundary_urls).
+    """
+    outlines = []
+    for level, name, weight in MAP_BOUNDARIES:
+        outline = {'name': name, 'style': {'color': '#737373', 'weight': weight}}
+        if tile_server_mounted():
+            outline.update(level=level, tiles=f"{TILES_URL}/{level}/{{z}}/{{x}}/{{y}}.pbf",
+                           minZoom=TILE_LEVELS[level], maxNativeZoom=TILE_MAX_ZOOM)
+        elif level in boundaries:
+            outline['url'] = boundaries[level]
+        else:
+            continue
+        outlines.append(outline)
+
+    return {
+        'id': MAP_ID,
+        'center': [19.0, -72.0],
+        'zoom': 8,
+        'tiles': MAP_TILES,
+        'boundaries': outlines,
+        'areas': {level: boundaries[f"{level}_areas"] for level in AREA_LEVELS},
+        'markers_name': 'Indicateurs de marché',
+    }
 
 # ---------------------
 # UI Definition
@@ -439,16 +550,14 @@ def map_output(input):
 def map_ui():
     """
     Return a nav panel containing:
-      - A left column with the cycle slider and indicator select
-      - A right column with the map
+      - A left column with the cycle slider, indicator select and map mode (markets or admin units)
+      - A right column with the map (created in the browser by www/map.js)
     """
-    # Gather unique cycle names (e.g. "cycle_1", "cycle_2", ...)
-    unique_cycles = sorted(
-        markets_df["Cycle"].unique(),
-        key=lambda x: int(x.replace("cycle_", ""))
-    )
-    # Convert them to int for the slider
-    cycle_nums = [int(x.replace("cycle_", "")) for x in unique_cycles]
+    # The map data starts loading with the server, while the other tabs are served
+    start_map_data()
+
+    # Cycle numbers of the MFS workbooks, for the slider
+    cycle_nums = map_cycle_numbers()
 
     cycle_slider = ui.input_slider(
         "cycle_select_map",
@@ -485,24 +594,116 @@ def map_ui():
                     ),
                     class_="custom-select"
                 ),
+                ui.div(
+                    tags.label("Afficher", class_="custom-select-label"),
+                    ui.input_radio_buttons("map_mode", None, choices=MAP_MODES, selected='markets'),
+                    class_="custom-select"
+                ),
                 ui.output_ui("map_info"),
                 class_="map-sidebar"
             ),
             ui.column(9,
+                ui.div(id=MAP_ID, class_="mfs-map"),
                 ui.output_ui("map"),
                 class_="map-container"
             )
-        )
+        ),
+        ui.head_content(*[
+            tags.link(rel="stylesheet", href=url) if kind == 'css' else tags.script(src=url)
+            for kind, url in MAP_DEPENDENCIES
+        ])
     )
 
 # ---------------------
 # Server Definition
 # ---------------------
 def map_server(input, output, session):
+    loading = start_map_data()
+
+    @reactive.poll(loading.done, MAP_READY_POLL_INTERVAL)
+    def map_loaded():
+        return loading.done()
+
+    # Latest markets data, updated when a new cycle is loaded without restarting the server
+    live_markets = live_named_view(DATA_DIR, 'markets')
+
+    @reactive.calc
+    def markets():
+        return live_markets() if map_loaded() else None
+
+    shown = {'df': None}
+
+    @reactive.Effect
+    def update_slider_after_reload():
+        """Push the cycle range of the loaded (or reloaded) data to the slider of this session."""
+        df_now = markets()
+        if df_now is None or df_now is shown['df']:
+            return
+        shown['df'] = df_now
+        cycle_nums = [int(x.replace("cycle_", "")) for x in df_now["Cycle"].unique()]
+        ui.update_slider("cycle_select_map", min=min(cycle_nums), max=max(cycle_nums))
+
     @output
     @render.ui
     def map():
-        return map_output(input)
+        """Show a message over the map while its data is loading, or if it could not be loaded."""
+        if not map_loaded():
+            return ui.div(
+                ui.tags.i(class_="fa fa-spinner fa-spin"),
+                " Chargement de la carte…",
+                class_="map-placeholder"
+            )
+        if loading.exception() is not None:
+            logging.error(f"Could not load the map data: {loading.exception()}")
+            return ui.div(ui.p("La carte n'a pas pu être chargée."), class_="map-placeholder")
+        return None
+
+    initialised = {'map': False}
+
+    @reactive.Effect
+    async def update_map():
+        """
+        Create the map of the session once, then send it the markets of the selected
+        cycle with every indicator: the map and its layers are kept by the browser.
+        """
+        if not map_loaded() or loading.exception() is not None:
+            return
+        df_now = markets()
+        if df_now is None:
+            return
+        selected_cycle_int = input.cycle_select_map()
+
+        if not initialised['map']:
+            initialised['map'] = True
+            await session.send_custom_message('mfs_map_init', map_init_message(loading.result()['boundaries']))
+
+        # The features only depend on the cycle: built once per markets data, for every cycle
+        payload = map_feature_collections(df_now).get(selected_cycle_int)
+        if payload is None:
+            return
+        await session.send_custom_message('mfs_map_features', {'payload': payload})
+
+    @reactive.Effect
+    async def update_map_areas():
+        """Shade the admin units of the selected level by the scores of their markets, or show the markets."""
+        if not map_loaded() or loading.exception() is not None:
+            return
+        df_now = markets()
+        if df_now is None:
+            return
+        level = input.map_mode()
+        payload = None
+        if level in AREA_LEVELS:
+            # Aggregated once per markets data, for every level and cycle
+            payload = admin_scores(df_now).get((level, input.cycle_select_map()))
+        await session.send_custom_message('mfs_map_areas', {'payload': payload})
+
+    @reactive.Effect
+    async def update_map_indicator():
+        """Show another indicator of the features already sent to the browser."""
+        label_to_key = {v: k for k, v in indicator_labels.items()}
+        selected_key = label_to_key.get(input.indicator_select(), "mfs_total_score")
+        await session.send_custom_message('mfs_map_indicator', {'indicator': selected_key})
 
     @output
     @render.ui
@@ -601,6 +802,14 @@ def map_server(input, output, session):
             )
         )
 
+        # Aggregation of the markets by admin unit (map_mode)
+        areas_text = tags.p(
+            "En affichant les départements, communes ou sections communales, chaque unité est colorée "
+            "selon la moyenne des scores de ses marchés (ou leur classification la plus fréquente), "
+            "avec les mêmes groupes de couleurs que les marchés.",
+            class_="p1"
+        )
+
         # Which text to show depends on the selected indicator
         mfs_indicators = [
             'Accessibilité',
@@ -611,6 +820,6 @@ def map_server(input, output, session):
             'Score Total'
         ]
         if selected_label in mfs_indicators:
-            return mfs_text
+            return ui.TagList(mfs_text, areas_text)
         else:
-            return classification_text
+            return ui.TagList(classification_text, areas_text)
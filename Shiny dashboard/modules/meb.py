@@ -1,58 +1,69 @@
 import pandas as pd
-import os
 import pandas as pd
+import numpy as np
 #from shiny import render, reactive, ui
 from shiny import App, ui, render, reactive
 from shiny.ui import tags, modal, modal_show
+from shiny.types import SafeException
+
+from .ingest import read_cycle_workbooks
+from .data_registry import get_view, derived, live_view
+from .comparison import PREVIOUS_CYCLE, cycle_number, baseline_cycle, comparison_choices, percent_change
+from .html_table import heatmap_table_html, change_table_html
+from .render_cache import cached_render
+from .pivot import PivotResult
+from .currency import (BASE_CURRENCY, CURRENCY_DECIMALS, load_exchange_rates, attach_exchange_rates, exchange_rates,
+                       currency_choices, conversion_rate, convert_pivot)
+from .prix_median import load_prix_median_data
+from .meb_engine import TYPE_MEB, NATIONAL, ScenarioCosts, compute_meb_costs, monthly_quantities, article_columns
+
+# Columns of the 'Produits du MEB' table; the quantities can be edited for a what-if scenario
+QUANTITY_COLUMN = 'Quantité pour menage 5 personnes'
+MONTHLY_COLUMN = 'Quantités/ménage/mois'
+PRODUITS_COLUMNS = ['Articles', 'Unités', QUANTITY_COLUMN, MONTHLY_COLUMN, 'Fréquence']
 
 def load_meb_data(DATA_DIR):
     """
     Load and prepare data for the "MEB" tab panel.
+
+    The costs are computed from the median prices of the ICSM workbooks and the
+    basket quantities of create_meb_produits_data (see meb_engine.compute_meb_costs).
+    The result is kept by the data registry and rebuilt when the workbooks change.
     """
-    # Loop through all Excel files ending with '_MEB_analyse.xlsx'
-    excel_files = [f for f in os.listdir(DATA_DIR) if f.endswith('_MEB_analyse.xlsx')]
-    if not excel_files:
-        raise FileNotFoundError("No Excel files ending with '_MEB_analyse.xlsx' found in the specified directory.")
-    
-    list_dfs = []
-    for file in excel_files:
-        file_path = os.path.join(DATA_DIR, file)
-        try:
-            df_temp = pd.read_excel(file_path)
-        except Exception as e:
-            raise ValueError(f"Error reading the Excel file {file}: {e}")
-        # Extract the cycle name from the file name (e.g. 'cycle_1' from 'cycle_1_MEB_analyse.xlsx')
-        cycle_name = file.split('_MEB_analyse.xlsx')[0]
-        df_temp['Cycle'] = cycle_name
-        list_dfs.append(df_temp)
-    df_meb = pd.concat(list_dfs, ignore_index=True)
+    return get_view(DATA_DIR, 'meb', _meb_view)
 
-    # Drop rows where 'meb_par' is NaN
-    df_meb.dropna(subset=['meb_par'], inplace=True)
 
-    # Identify MEB columns that are numerical
-    meb_columns = [col for col in df_meb.columns if col.startswith('MEB_') and pd.api.types.is_numeric_dtype(df_meb[col])]
+def _meb_view(DATA_DIR):
+    _, df_prices = load_prix_median_data(DATA_DIR)
+    df_meb_long = compute_meb_costs(df_prices, create_meb_produits_data())
+    df_meb_long = attach_exchange_rates(df_meb_long, load_exchange_rates(DATA_DIR))
+    # Materialise the pivot cube at load time rather than on the first render
+    meb_cube(df_meb_long)
+    return df_meb_long
+
 
-    # Filter rows where 'Type_meb' is 'Urgence' and 'meb_par' is 'Marché'
-    mask = (df_meb['Type_meb'] == 'Urgence') & (df_meb['meb_par'] == 'Marché')
-    df_urgent_marche = df_meb[mask].copy()
+def build_meb_data(DATA_DIR):
+    """
+    Read the '_MEB_analyse.xlsx' workbooks of DATA_DIR and reshape them to the long format.
+
+    The dashboard computes the costs itself (see load_meb_data); the precomputed
+    workbooks are kept to check the computation (see meb_engine.compare_with_workbooks).
 
-    # Check if there are any rows to process
-    if not df_urgent_marche.empty:
-        # Convert MEB columns from HTG to USD by dividing by 'USD_official'
-        df_urgent_usd = df_urgent_marche.copy()
-        df_urgent_usd['currency'] = 'USD'
-        df_urgent_usd[meb_columns] = df_urgent_usd[meb_columns].div(df_urgent_usd['USD_official'], axis=0)
+    Only the amounts in HTG are kept: other currencies are converted when a
+    table is shown (see currency.convert_pivot).
+    """
+    # Merge all Excel files ending with '_MEB_analyse.xlsx', each with a 'Cycle' column
+    df_meb = read_cycle_workbooks(DATA_DIR, '_MEB_analyse.xlsx')
 
-        # Append the new USD rows to the original DataFrame
-        df_meb = pd.concat([df_meb, df_urgent_usd], ignore_index=True)
+    # Drop rows where 'meb_par' is NaN
+    df_meb.dropna(subset=['meb_par'], inplace=True)
 
-    df_meb.reset_index(drop=True, inplace=True)
+    # Keep the amounts in HTG; the workbooks' USD rows are the same amounts divided by 'USD_official'
+    df_meb = df_meb[df_meb['currency'].str.strip() == BASE_CURRENCY].reset_index(drop=True)
 
     # Strip whitespace from text columns
     df_meb['Type_meb'] = df_meb['Type_meb'].str.strip()
     df_meb['meb_par'] = df_meb['meb_par'].str.strip()
-    df_meb['currency'] = df_meb['currency'].str.strip()
     df_meb['zone'] = df_meb['zone'].str.strip()
 
     # Change 'pays' to 'Tout le pays' in 'zone' column
@@ -131,7 +142,7 @@ def load_meb_data(DATA_DIR):
 
     # Melt the DataFrame to long format
     df_meb_long = df_meb.melt(
-        id_vars=['currency', 'zone', 'Type_meb', 'meb_par', 'Cycle'],
+        id_vars=['zone', 'Type_meb', 'meb_par', 'Cycle'],
         value_vars=meb_columns,
         var_name='Product',
         value_name='Value'
@@ -157,22 +168,77 @@ def load_meb_data(DATA_DIR):
     return df_meb_long
 
 
-def get_meb_choices(df_meb_long):
+def build_meb_cube(df_meb_long):
+    """
+    Precompute the sector × zone pivot of the basket costs for every selection of the "Secteurs" tab.
+
+    Parameters:
+    - df_meb_long (pd.DataFrame): The long-format MEB DataFrame.
+
+    Returns:
+    - cube (dict): {(cycle, Type_meb, meb_par): pd.DataFrame} where each DataFrame
+      holds the mean 'Value' in HTG indexed by 'sector', one column per 'zone'.
+   """
+    baskets = df_meb_long[df_meb_long['is_basket']]
+    return {
+        key: rows.pivot_table(index='sector', columns='zone', values='Value', aggfunc='mean')
+        for key, rows in baskets.groupby(['Cycle', 'Type_meb', 'meb_par'])
+    }
+
+
+def meb_cube(df_meb_long):
+    """Return the pivot cube of df_meb_long (see build_meb_cube), computed once per DataFrame."""
+    return derived(df_meb_long, 'meb_cube', build_meb_cube)
+
+
+def build_meb_choices(df_meb_long):
     """
     Get unique choices for the select inputs based on the MEB DataFrame
     """
     type_meb_choices = sorted(df_meb_long['Type_meb'].dropna().unique().tolist())
     meb_par_choices = sorted(df_meb_long['meb_par'].dropna().unique().tolist())
     sector_choices_meb = sorted(df_meb_long['sector'].dropna().unique().tolist())
-    currency_choices_meb = sorted(df_meb_long['currency'].dropna().unique().tolist())
+    currency_choices_meb = currency_choices(exchange_rates(df_meb_long))
     cycle_choices = sorted(df_meb_long['Cycle'].dropna().unique().tolist())
     return type_meb_choices, meb_par_choices, sector_choices_meb, currency_choices_meb, cycle_choices
 
 
+def get_meb_choices(df_meb_long):
+    """Return the choices of the select inputs (see build_meb_choices), computed once per DataFrame."""
+    return derived(df_meb_long, 'meb_choices', build_meb_choices)
+
+
+def meb_result(pivot, currency=BASE_CURRENCY):
+    """
+    Return a cube pivot in `currency` as a PivotResult of the "Secteurs" tab.
+
+    Sectors are sorted with 'Total' as the last row, and 'Tout le pays' is the last column.
+    """
+    pivot = pivot.copy()
+    pivot.index = pivot.index.astype(str)
+
+    # Sort sectors, move 'Total' to the last row
+    rows = sorted(sector for sector in pivot.index if sector != 'Total')
+    if 'Total' in pivot.index:
+        rows.append('Total')
+
+    # Rearrange columns to have 'Pays' as the last column, if it exists
+    columns = [col for col in pivot.columns if col != 'Tout le pays']
+    if 'Tout le pays' in pivot.columns:
+        columns.append('Tout le pays')
+
+    return PivotResult.from_pivot(pivot.loc[rows, columns], 'Secteur', CURRENCY_DECIMALS.get(currency, 2))
+
+
 def create_meb_secteurs_table(df_meb_long, input):
     """
     Create the pivot table for the "Secteurs" tab (normal table), including the 'Total' row.
     IMPORTANT: now we filter on the selected cycle to show the correct data.
+
+    Returns:
+    - result (PivotResult): Mean basket cost by 'Secteur' and zone, in the selected
+      currency. Zones without a cost are NaN; the display strings (e.g. '12,500')
+      are in result.formatted. Empty if there is no data or no exchange rate.
     """
     # Normalize inputs
     type_meb_selected = input.type_meb_select_sectors().strip()
@@ -186,53 +252,25 @@ def create_meb_secteurs_table(df_meb_long, input):
         cycle_num = 1
     cycle_selected = f"cycle_{cycle_num}"
 
-    # Filter data to include basket indicators AND the currently selected cycle
-    filtered_df = df_meb_long[
-        (df_meb_long['Cycle'] == cycle_selected) &
-        (df_meb_long['Type_meb'] == type_meb_selected) &
-        (df_meb_long['meb_par'] == meb_par_selected) &
-        (df_meb_long['currency'] == currency_selected) &
-        (df_meb_long['is_basket'])
-    ]
-
-    # Pivot table
-    pivot_df = filtered_df.pivot_table(
-        index='sector',
-        columns='zone',
-        values='Value',
-        aggfunc='mean'
-    ).reset_index()
-
-    # Remove decimals from the values
-    pivot_df.iloc[:, 1:] = pivot_df.iloc[:, 1:].round(0).astype(int)
+    # Look up the precomputed pivot of the basket indicators for the selected cycle
+    pivot = meb_cube(df_meb_long).get((cycle_selected, type_meb_selected, meb_par_selected))
+    rates = exchange_rates(df_meb_long)
+    if pivot is None or np.isnan(conversion_rate(rates, cycle_selected, currency_selected)):
+        return PivotResult.from_pivot(pd.DataFrame(), 'Secteur')
 
-    # Rename 'sector' to 'Secteur'
-    pivot_df = pivot_df.rename(columns={'sector': 'Secteur'})
+    # One result per cube entry and currency, so that its display strings are formatted once
+    return derived(pivot, f'meb_result_{currency_selected}',
+                   lambda p: meb_result(convert_pivot(p, rates, cycle_selected, currency_selected), currency_selected))
 
-    # Sort sectors, move 'Total' to the last row
-    pivot_df['Secteur'] = pivot_df['Secteur'].astype(str)
-    pivot_df = pivot_df.sort_values(by='Secteur')
-    if 'Total' in pivot_df['Secteur'].values:
-        total_row = pivot_df[pivot_df['Secteur'] == 'Total']
-        pivot_df = pivot_df[pivot_df['Secteur'] != 'Total']
-        pivot_df = pd.concat([pivot_df, total_row], ignore_index=True)
 
-    # Rearrange columns to have 'Pays' as the last column, if it exists
-    columns_order = ['Secteur'] + [col for col in pivot_df.columns if col != 'Secteur' and col != 'Tout le pays']
-    if 'Tout le pays' in pivot_df.columns:
-        columns_order.append('Tout le pays')
-    pivot_df = pivot_df[columns_order]
-
-    return pivot_df
-
-
-def create_meb_difference_table(df_meb_long, input):
+def create_meb_difference_table(df_meb_long, input, baseline=None):
     """
-    Create a pivot table of percent differences between consecutive cycles for MEB.
-    For the selected cycle (e.g. cycle_2) compare with cycle_1,
-    computing ((current - previous) / previous)*100 for each sector & zone.
-    
-    Returns None if user selects the first cycle or if there's no data to compare.
+    Create a pivot table of percent differences between two cycles for MEB.
+    For the selected cycle (e.g. cycle_3) compare with the baseline cycle
+    (by default the previous one, cycle_2), computing
+    ((current - baseline) / baseline)*100 for each sector & zone.
+
+    Returns None if there is no cycle to compare with (first cycle, or the baseline itself).
     Returns an empty DataFrame if the filtering yields no valid pivot for comparison.
     """
     import logging
@@ -241,94 +279,32 @@ def create_meb_difference_table(df_meb_long, input):
     except Exception as e:
         logging.error(f"Error converting cycle selection to integer: {e}")
         return pd.DataFrame()
-    
-    # If the user chooses cycle 1, there's no previous cycle to compare.
-    if cycle_num <= 1:
-        return None
 
     current_cycle = f"cycle_{cycle_num}"
-    previous_cycle = f"cycle_{cycle_num - 1}"
+    compared_cycle = baseline_cycle(current_cycle, baseline)
+    if compared_cycle is None:
+        return None
 
     type_meb_selected = input.type_meb_select_sectors().strip()
     meb_par_selected = input.meb_par_select().strip()
     currency_selected = input.currency_select_meb().strip()
 
-    # Filter for the current cycle
-    df_current = df_meb_long[
-        (df_meb_long['Cycle'] == current_cycle) &
-        (df_meb_long['Type_meb'] == type_meb_selected) &
-        (df_meb_long['meb_par'] == meb_par_selected) &
-        (df_meb_long['currency'] == currency_selected) &
-        (df_meb_long['is_basket'])
-    ]
-    # Filter for the previous cycle
-    df_previous = df_meb_long[
-        (df_meb_long['Cycle'] == previous_cycle) &
-        (df_meb_long['Type_meb'] == type_meb_selected) &
-        (df_meb_long['meb_par'] == meb_par_selected) &
-        (df_meb_long['currency'] == currency_selected) &
-        (df_meb_long['is_basket'])
-    ]
+    # Look up the pivots of both cycles
+    cube = meb_cube(df_meb_long)
+    pivot_current = cube.get((current_cycle, type_meb_selected, meb_par_selected))
+    pivot_baseline = cube.get((compared_cycle, type_meb_selected, meb_par_selected))
 
-    if df_current.empty or df_previous.empty:
+    if pivot_current is None or pivot_baseline is None:
         return pd.DataFrame()
 
-    # Pivot each
-    pivot_current = df_current.pivot_table(
-        index='sector',
-        columns='zone',
-        values='Value',
-        aggfunc='mean'
-    ).reset_index()
-
-    pivot_previous = df_previous.pivot_table(
-        index='sector',
-        columns='zone',
-        values='Value',
-        aggfunc='mean'
-    ).reset_index()
-
-    # Merge on 'sector'
-    merged = pd.merge(
-        pivot_current, pivot_previous,
-        on='sector', how='outer',
-        suffixes=('_curr', '_prev')
-    )
-
-    # Compute difference for each 'zone' column
-    for col in pivot_current.columns:
-        if col == 'sector':
-            continue
-        curr_col = f"{col}_curr"
-        prev_col = f"{col}_prev"
-        if curr_col in merged.columns and prev_col in merged.columns:
-            merged[f"{col}_diff"] = merged.apply(
-                lambda row: (
-                    ((row[curr_col] - row[prev_col]) / row[prev_col]) * 100
-                    if pd.notna(row[curr_col]) and pd.notna(row[prev_col]) and row[prev_col] != 0
-                    else None
-                ),
-                axis=1
-            )
-
-    # Build final difference table
-    diff_cols = ['sector']
-    for col in pivot_current.columns:
-        if col != 'sector' and f"{col}_diff" in merged.columns:
-            diff_cols.append(f"{col}_diff")
-
-    diff_table = merged[diff_cols].copy()
-
-    # Rename columns to remove "_diff"
-    new_columns = {}
-    for c in diff_table.columns:
-        if c.endswith("_diff"):
-            new_columns[c] = c.replace("_diff", "")
-        else:
-            new_columns[c] = c
-    diff_table.rename(columns=new_columns, inplace=True)
+    # Each cycle is converted at its own rate
+    rates = exchange_rates(df_meb_long)
+    pivot_current = convert_pivot(pivot_current, rates, current_cycle, currency_selected)
+    pivot_baseline = convert_pivot(pivot_baseline, rates, compared_cycle, currency_selected)
+    if pivot_current is None or pivot_baseline is None:
+        return pd.DataFrame()
 
-    return diff_table
+    return percent_change(pivot_current, pivot_baseline, 'sector')
 
 
 def create_meb_produits_data():
@@ -493,11 +469,113 @@ def create_produits_meb_table(df_produits, input):
         (df_produits['Sector'] == sector_selected)
     ]
 
-    # Select columns to display
-    columns_to_display = ['Articles', 'Unités', 'Quantité pour menage 5 personnes', 'Quantités/ménage/mois', 'Fréquence']
-
     # Return the filtered DataFrame
-    return filtered_df[columns_to_display]
+    return filtered_df[PRODUITS_COLUMNS]
+
+
+def edited_produits(df_produits, edits):
+    """
+    Return the product definitions with the quantities of a what-if scenario.
+
+    Parameters:
+    - df_produits (pd.DataFrame): The product definitions (see create_meb_produits_data).
+    - edits (dict): {row of df_produits: quantity for a household of 5 people}; for the
+      flat amounts ('Forfait en HTG'), the monthly amount in HTG. 0 drops the article.
+
+    Returns:
+    - df_produits (pd.DataFrame): A copy with the edited quantities and their monthly quantities.
+    """
+    if not edits:
+        return df_produits
+    df_produits = df_produits.copy()
+    rows = list(edits)
+    df_produits.loc[rows, QUANTITY_COLUMN] = list(edits.values())
+    df_produits.loc[rows, MONTHLY_COLUMN] = monthly_quantities(df_produits.loc[rows]).round(2).to_numpy()
+    return df_produits
+
+
+def parse_quantity(value):
+    """Return a quantity typed in the 'Produits du MEB' table as a float, or raise a SafeException."""
+    try:
+        quantity = float(str(value).strip().replace(',', '.'))
+    except ValueError:
+        quantity = np.nan
+    if not np.isfinite(quantity) or quantity < 0:
+        raise SafeException("La quantité doit être un nombre positif (0 pour retirer l'article du panier).")
+    return quantity
+
+
+def scenario_result(scenario, sector, meb_par):
+    """
+    Return the costs of a what-if scenario for a sector basket and the total, as a PivotResult.
+
+    Parameters:
+    - scenario (ScenarioCosts): The costs of the edited baskets of a crisis type.
+    - sector (str): The sector shown with the total (absent from the rows if not part of the crisis type).
+    - meb_par (str): The geographic level (e.g. 'Département et national').
+
+    Returns:
+    - result (PivotResult): One row per cycle and basket (e.g. 'WASH - Cycle 1'),
+      one column per zone, 'Tout le pays' last.
+    """
+    selected = (scenario.zones['meb_par'] == meb_par).to_numpy()
+    zones = scenario.zones[selected]
+    baskets = [basket for basket in (sector, 'Total') if basket in scenario.baskets]
+    costs = pd.DataFrame(scenario.values[selected][:, [scenario.baskets.index(b) for b in baskets]],
+                         columns=baskets)
+    costs['Cycle'] = zones['Cycle'].to_numpy()
+    costs['zone'] = zones['zone'].to_numpy()
+
+    columns = sorted(zone for zone in costs['zone'].unique() if zone != NATIONAL)
+    if NATIONAL in costs['zone'].values:
+        columns.append(NATIONAL)
+
+    rows, labels = [], []
+    for cycle, cycle_costs in sorted(costs.groupby('Cycle'), key=lambda item: cycle_number(item[0])):
+        cycle_costs = cycle_costs.set_index('zone').reindex(columns)
+        for basket in baskets:
+            rows.append(cycle_costs[basket].to_numpy(dtype=float))
+            labels.append(f"{basket} - Cycle {cycle_number(cycle)}")
+    values = np.vstack(rows) if rows else np.empty((0, len(columns)))
+    return PivotResult(values, labels, columns, 'Panier', CURRENCY_DECIMALS[BASE_CURRENCY])
+
+
+def meb_secteurs_table_html(df_meb_long, input):
+    """
+    Render the table of the "Cout du MEB par secteurs" tab for the selections of `input`:
+    the basket costs, or their difference (%) when the switch is on.
+
+    Parameters:
+    - df_meb_long (pd.DataFrame): The long-format MEB DataFrame (see load_meb_data).
+    - input: Shiny input object, or an object answering the same calls (see export.static_input).
+
+    Returns:
+    - ui.HTML: The table, or a message when there is nothing to show.
+    """
+    # Check the switch: if toggled, show the differences table; otherwise, show the normal table.
+    if input.toggle_diff_meb():
+        diff_df = create_meb_difference_table(df_meb_long, input, input.compare_select_meb())
+        if diff_df is None:
+            # This happens when the selected cycle is the first one, or is the baseline itself
+            return ui.HTML("<p>Aucune donnée disponible pour calculer la différence pour le cycle sélectionné.</p>")
+        if diff_df.empty:
+            return ui.HTML("<p>Aucune donnée disponible pour les sélections actuelles ou pas de comparaison possible.</p>")
+
+        diff_columns = [col for col in diff_df.columns if col != 'sector']
+        return ui.HTML(change_table_html(diff_df[diff_columns].to_numpy(dtype=float), diff_df['sector'].tolist(),
+                                         diff_columns, 'Secteur', decrease_prefix="▼ "))
+
+    else:
+        # Render the normal (avg value) MEB table
+        result = create_meb_secteurs_table(df_meb_long, input)
+        if result.empty:
+            return ui.HTML("<p>Aucune donnée disponible pour les sélections actuelles.</p>")
+
+        table_html = heatmap_table_html(result.values, result.row_labels, result.columns,
+                                        'meb-secteurs-table', result.label,
+                                        label_template="<td class='first-column'>{}</td>", total_label='Total',
+                                        formatted=result.formatted, decimals=result.decimals)
+        return ui.HTML(table_html)
 
 
 def meb_ui(cycle_choices, type_meb_choices, meb_par_choices, currency_choices, type_meb_choices_produits, secteur_choices):
@@ -553,12 +631,26 @@ def meb_ui(cycle_choices, type_meb_choices, meb_par_choices, currency_choices, t
                             ),
                             class_="custom-select"
                         ),
+                        ui.div(
+                            ui.tags.label("Choisir le Niveau géographique", class_="custom-select-label"),
+                            ui.input_select(
+                                "meb_par_select_products",
+                                None,
+                                choices=meb_par_choices,
+                            ),
+                            class_="custom-select"
+                        ),
+                        ui.input_action_button("reset_scenario", "Réinitialiser les quantités"),
                     ),
                     ui.h2("Inventaire des articles utilisés"),
+                    ui.p("Modifiez la quantité d'un article (double-clic sur la cellule) pour calculer le coût "
+                         "du panier dans toutes les zones et tous les cycles. Saisissez 0 pour retirer l'article du panier."),
                     ui.div(
                         ui.output_data_frame("produits_meb_table"),
                         class_="produits_meb_table"
                     ),
+                    ui.h2("Coût mensuel du panier avec ces quantités (HTG)"),
+                    ui.output_ui("meb_scenario_table"),
                 ),
             ),
 
@@ -601,6 +693,20 @@ def meb_ui(cycle_choices, type_meb_choices, meb_par_choices, currency_choices, t
                             ),
                             class_="custom-select"
                         ),
+                        # Baseline of the differences, shown with the differences switch
+                        ui.panel_conditional(
+                            "input.toggle_diff_meb",
+                            ui.div(
+                                ui.tags.label("Comparer avec", class_="custom-select-label"),
+                                ui.input_select(
+                                    "compare_select_meb",
+                                    None,
+                                    choices=comparison_choices(cycle_choices),
+                                    selected=PREVIOUS_CYCLE,
+                                ),
+                                class_="custom-select"
+                            ),
+                        ),
                     ),
                     ui.div(
                         # Switch to toggle between normal table and difference table
@@ -629,15 +735,125 @@ def meb_server(input, output, session, df_meb_long, df_produits):
     Handles the rendering of produits_meb_table and meb_secteurs_table,
     including the 'Afficher les différences (%)' feature for the MEB table.
     """
+    # Latest version of df_meb_long, updated when a new cycle is loaded without restarting the server
+    data = live_view(df_meb_long)
+    shown = {'df': df_meb_long}
+
+    @reactive.Effect
+    def update_choices_after_reload():
+        """Push the slider range and choices of reloaded data to this session."""
+        df_now = data()
+        if df_now is shown['df']:
+            return
+        shown['df'] = df_now
+        _, meb_par_choices, _, currency_choices, cycle_choices = get_meb_choices(df_now)
+        with reactive.isolate():
+            meb_par = input.meb_par_select()
+            meb_par_products = input.meb_par_select_products()
+            currency = input.currency_select_meb()
+            baseline = input.compare_select_meb()
+        ui.update_slider("cycle_select_meb", max=len(cycle_choices))
+        compare_choices = comparison_choices(cycle_choices)
+        ui.update_select("compare_select_meb", choices=compare_choices,
+                         selected=baseline if baseline in compare_choices else PREVIOUS_CYCLE)
+        ui.update_select("meb_par_select", choices=meb_par_choices,
+                         selected=meb_par if meb_par in meb_par_choices else None)
+        ui.update_select("meb_par_select_products", choices=meb_par_choices,
+                         selected=meb_par_products if meb_par_products in meb_par_choices else None)
+        ui.update_select("currency_select_meb", choices=currency_choices,
+                         selected=currency if currency in currency_choices else None)
+
+    # What-if scenario of this session: {row of df_produits: quantity typed in the table}
+    edits = reactive.value({})
+    # Costs of the scenario for each crisis type: {Type_meb: (frame of the prices, ScenarioCosts)}
+    scenarios = {}
+    shown_produits = {'rows': [], 'resets': reactive.value(0)}
+
+    def scenario(type_meb):
+        """Return the costs of this session's scenario for a crisis type, with the current prices."""
+        df_now = data()
+        entry = scenarios.get(type_meb)
+        if entry is None or entry[0] is not df_now:
+            # The base costs are shared by every session; each session edits its own copy
+            costs = derived(df_now, f"meb_scenario_{type_meb}",
+                            lambda f: ScenarioCosts.from_costs(f, df_produits, type_meb)).copy()
+            with reactive.isolate():
+                current = edited_produits(df_produits, edits.get())
+            rows = [row for row in edits.get() if TYPE_MEB.get(current.at[row, 'Crisis Type']) == type_meb]
+            for article, quantity in zip(article_columns(current.loc[rows]), monthly_quantities(current.loc[rows])):
+                costs.set_quantity(article, quantity)
+            entry = scenarios[type_meb] = (df_now, costs)
+        return entry[1]
+
+    @reactive.Effect
+    @reactive.event(input.reset_scenario)
+    def reset_scenario():
+        """Go back to the quantities of the MEB."""
+        edits.set({})
+        scenarios.clear()
+        shown_produits['resets'].set(shown_produits['resets'].get() + 1)
 
     @output
     @render.data_frame
     def produits_meb_table():
         """
-        Renders the 'Produits du MEB' data frame based on user inputs.
+        Renders the 'Produits du MEB' data frame based on user inputs,
+        with the quantities of the session's scenario.
+        """
+        shown_produits['resets'].get()
+        with reactive.isolate():
+            current = edited_produits(df_produits, edits.get())
+        df_table = create_produits_meb_table(current, input)
+        shown_produits['rows'] = df_table.index.tolist()
+        return render.DataGrid(df_table, editable=True)
+
+    @produits_meb_table.set_patches_fn
+    def apply_quantities(*, patches):
         """
-        df_table = create_produits_meb_table(df_produits, input)
-        return df_table
+        Apply the quantities typed in the table to the scenario.
+
+        Only the cost of each edited article is added to its basket and to the
+        total of every zone (see ScenarioCosts.set_quantity).
+        """
+        with reactive.isolate():
+            new_edits = dict(edits.get())
+            processed = []
+            for patch in patches:
+                if PRODUITS_COLUMNS[patch['column_index']] != QUANTITY_COLUMN:
+                    raise SafeException("Seule la quantité pour un ménage de 5 personnes peut être modifiée.")
+                quantity = parse_quantity(patch['value'])
+                row = shown_produits['rows'][patch['row_index']]
+                edited = edited_produits(df_produits, {row: quantity}).loc[[row]]
+                monthly = float(monthly_quantities(edited).iloc[0])
+                scenario(TYPE_MEB[df_produits.at[row, 'Crisis Type']]).set_quantity(
+                    article_columns(edited).iloc[0], monthly)
+                new_edits[row] = quantity
+                processed.append({**patch, 'value': f"{quantity:g}"})
+                processed.append({'row_index': patch['row_index'],
+                                  'column_index': PRODUITS_COLUMNS.index(MONTHLY_COLUMN),
+                                  'value': f"{edited.at[row, MONTHLY_COLUMN]:g}"})
+        edits.set(new_edits)
+        return processed
+
+    @output
+    @render.ui
+    def meb_scenario_table():
+        """
+        Renders the cost of the selected sector basket and of the total in every zone
+        and cycle, with the quantities of the session's scenario.
+        """
+        edits.get()
+        type_meb = TYPE_MEB.get(input.type_meb_select_products().strip())
+        meb_par = input.meb_par_select_products()
+        if type_meb is None or not meb_par:
+            return ui.HTML("<p>Aucune donnée disponible pour les sélections actuelles.</p>")
+        result = scenario_result(scenario(type_meb), input.secteur_select().strip(), meb_par.strip())
+        if result.empty:
+            return ui.HTML("<p>Aucune donnée disponible pour les sélections actuelles.</p>")
+        return ui.HTML(heatmap_table_html(result.values, result.row_labels, result.columns,
+                                          'meb-secteurs-table', result.label,
+                                          label_template="<td class='first-column'>{}</td>",
+                                          formatted=result.formatted, decimals=result.decimals))
 
     @output
     @render.ui
@@ -645,117 +861,17 @@ def meb_server(input, output, session, df_meb_long, df_produits):
         """
         Renders the 'Cout du MEB par secteurs' table as either:
          - The normal pivot (avg values) table, or
-         - The difference (%) table compared to the previous cycle,
+         - The difference (%) table compared to the baseline cycle
+           (the previous one unless another is chosen in "Comparer avec"),
            depending on the toggle_diff_meb switch.
+        The same inputs give the same table in every session, so it is rendered once per process.
         """
-        # Check the switch: if toggled, show the differences table; otherwise, show the normal table.
+        try:
+            cycle_num = int(input.cycle_select_meb())
+        except ValueError:
+            cycle_num = 1
+        inputs = (cycle_num, input.type_meb_select_sectors().strip(), input.meb_par_select().strip(),
+                  input.currency_select_meb().strip(), bool(input.toggle_diff_meb()))
         if input.toggle_diff_meb():
-            diff_df = create_meb_difference_table(df_meb_long, input)
-            if diff_df is None:
-                # This happens when the selected cycle is the first one
-                return ui.HTML("<p>Aucune donnée disponible pour calculer la différence pour le cycle sélectionné.</p>")
-            if diff_df.empty:
-                return ui.HTML("<p>Aucune donnée disponible pour les sélections actuelles ou pas de comparaison possible.</p>")
-
-            # Build HTML table for the difference data
-            def apply_diff_format(row):
-                styled_row = []
-                for col in diff_df.columns:
-                    if col == 'sector':
-                        # Bold sector name
-                        styled_row.append(f"<td><strong>{row[col]}</strong></td>")
-                    else:
-                        cell_value = row[col]
-                        if cell_value is None or pd.isna(cell_value):
-                            styled_row.append("<td></td>")
-                        else:
-                            if cell_value > 0:
-                                # Positive difference => red color (#CD2030), up arrow
-                                formatted = f"▲ +{cell_value:.1f}%"
-                                styled_row.append(f"<td style='color: #CD2030;'><strong>{formatted}</strong></td>")
-                            elif cell_value < 0:
-                                # Negative difference => green color (#086D38), down arrow
-                                formatted = f"▼ {cell_value:.1f}%"
-                                styled_row.append(f"<td style='color: #086D38;'><strong>{formatted}</strong></td>")
-                            else:
-                                # Exactly zero difference => show "="
-                                formatted = f"= {cell_value:.1f}%"
-                                styled_row.append(f"<td><strong>{formatted}</strong></td>")
-                return "<tr>" + "".join(styled_row) + "</tr>"
-
-            table_html = "<table class='difference-table'><thead><tr>"
-            for col in diff_df.columns:
-                if col == 'sector':
-                    table_html += "<th>Secteur</th>"
-                else:
-                    table_html += f"<th>{col}</th>"
-            table_html += "</tr></thead><tbody>"
-            for _, row in diff_df.iterrows():
-                table_html += apply_diff_format(row)
-            table_html += "</tbody></table>"
-
-            return ui.HTML(table_html)
-
-        else:
-            # Render the normal (avg value) MEB table
-            pivot_df = create_meb_secteurs_table(df_meb_long, input)
-            if pivot_df.empty:
-                return ui.HTML("<p>Aucune donnée disponible pour les sélections actuelles.</p>")
-
-            def apply_conditional_colors(row):
-                numeric_cols = [col for col in pivot_df.columns if col != 'Secteur']
-                try:
-                    values = pd.to_numeric(row[numeric_cols].replace(',', '', regex=True), errors='coerce')
-                except AttributeError:
-                    values = pd.to_numeric(row[numeric_cols], errors='coerce')
-
-                quantiles = values.quantile([0.25, 0.5, 0.75]).to_dict()
-
-                # Check if this row is 'Total'
-                row_class = "class='total-row'" if row['Secteur'] == 'Total' else ""
-                styled_row = [f"<tr {row_class}>"]
-
-                for col in pivot_df.columns:
-                    cell_value = row[col]
-                    if col == 'Secteur':
-                        # First column in bold
-                        styled_row.append(f"<td class='first-column'>{cell_value}</td>")
-                    else:
-                        if pd.isna(cell_value):
-                            styled_row.append("<td></td>")
-                        else:
-                            val = pd.to_numeric(str(cell_value).replace(',', ''), errors='coerce')
-                            color = "#FEEEED"  # default color for lower quantiles
-                            if val is not None:
-                                if val > quantiles.get(0.75, 0):
-                                    color = "#EE5859"
-                                elif val > quantiles.get(0.5, 0):
-                                    color = "#F27D7C"
-                                elif val > quantiles.get(0.25, 0):
-                                    color = "#F3BEBD"
-
-                            # Thousands separator formatting
-                            cell_display = "{:,}".format(int(val)) if val is not None else ""
-                            styled_row.append(f"<td style='background-color: {color};'>{cell_display}</td>")
-
-                styled_row.append("</tr>")
-                return "".join(styled_row)
-
-            # Build the HTML table
-            table_html = """
-            <table class="meb-secteurs-table">
-                <thead>
-                    <tr>
-            """
-            # Add table headers
-            for col in pivot_df.columns:
-                table_html += f"<th>{col}</th>"
-            table_html += "</tr></thead><tbody>"
-
-            # Add rows with conditional styling
-            for _, row in pivot_df.iterrows():
-                table_html += apply_conditional_colors(row)
-
-            table_html += "</tbody></table>"
-
-            return ui.HTML(table_html)
+            inputs += (baseline_cycle(f"cycle_{cycle_num}", input.compare_select_meb()),)
+        return ui.HTML(cached_render('meb_secteurs_table', data(), inputs, lambda: str(meb_secteurs_table_html(data(), input))))
@@ -0,0 +1,432 @@
+# modules/meb_engine.py
+
+import time
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from .data_registry import derived
+
+# Column of the MEB long format and price variable of the ICSM 'Prix median' rows
+# ('question_variable_name') of each article of create_meb_produits_data
+ARTICLES = {
+    'Marmite - acier inoxydable': ('MEB_cooking_pot', 'cooking_pot_7l_price_unit_item_calculate'),
+    'Poêle à frire': ('MEB_pan', 'pan_price_item_calculate'),
+    'Marmite avec couvercle': ('MEB_cooking_pot_with_lid', 'cooking_pot_with_lid_5l_price_unit_item_calculate'),
+    'Bol métallique': ('MEB_bowl', 'bowl_price_item_calculate'),
+    'Assiette métallique': ('MEB_plate', 'plate_price_item_calculate'),
+    'Gobelet métallique': ('MEB_mug', 'mug_price_item_calculate'),
+    'Cuillère à soupe en acier inoxydable': ('MEB_spoon', 'spoon_price_item_calculate'),
+    'Cuillère en bois à mélanger 30 cm': ('MEB_serving_spoon', 'serving_spoon_price_item_calculate'),
+    'Fourchette de table acier inoxydable': ('MEB_fork', 'fork_price_item_calculate'),
+    'Couteau de table acier inoxydable': ('MEB_kitchen_knife', 'kitchen_knife_price_item_calculate'),
+    'Couteau de cuisine, lame en acier inoxydable': ('MEB_knife', 'knife_price_item_calculate'),
+    'Tampon à récurer/paille de fer': ('MEB_scouring_pad', 'scouring_pad_price_item_calculate'),
+    'Couverture 50% laine': ('MEB_blanket', 'blanket_price_item_calculate'),
+    'Matelas': ('MEB_sleeping_mat', 'sleeping_mat_price_item_calculate'),
+    'Natte': ('MEB_carpet_price_item', 'carpet_price_item_calculate'),
+    'Combustible - charbon de bois': ('MEB_charcoal', 'charcoal_18lbs_price_unit_item_calculate'),
+    'Combustible - gaz propane': ('MEB_cooking_fuel', 'cooking_fuel_price_item_calculate'),
+    'Rechaud de 3 pièces (à charbon)': ('MEB_stove', 'stove_price_item_calculate'),
+    'Grande bassine': ('MEB_tub', 'tub_price_item_calculate'),
+    'Cuvette': ('MEB_water_container_small', 'water_container_small_price_item_calculate'),
+    'Eau potable (l)': ('MEB_water_bottle', 'water_bottle_price_item_calculate'),
+    'Savon lessive': ('MEB_laundry_soap_bar', 'laundry_soap_bar_price_item_calculate'),
+    'Brosse à dents': ('MEB_toothbrush_adult', 'toothbrush_adult_price_item_calculate'),
+    'Dentifrice': ('MEB_toothpaste', 'toothpaste_85g_price_unit_item_calculate'),
+    'Papier toilette': ('MEB_toilet_paper', 'toilet_paper_price_item_calculate'),
+    'Serviettes hygiéniques': ('MEB_sanitary_pad', 'sanitary_pad_8pc_price_unit_item_calculate'),
+    'Savon bain (75 Gr)': ('MEB_soap', 'soap_75g_price_unit_item_calculate'),
+    'Bassine pour faire la lessive': ('MEB_water_container', 'water_container_price_item_calculate'),
+    'Deodorant': ('MEB_deodorant', 'deodorant_price_item_calculate'),
+    'Corde Polypropylène, 6 mm diamètre rouleaux torsadés': ('MEB_rope', 'rope_price_item_calculate'),
+    '2” clou (50mm)': ('MEB_nails_50mm', 'nails_50mm_price_item_calculate'),
+    '3” clou (75mm)': ('MEB_nails_75mm', 'nails_75mm_price_item_calculate'),
+    '2.5” clou pour toiture (63mm)': ('MEB_nails_63mm', 'nails_63mm_price_item_calculate'),
+    'Fil de ligature': ('MEB_roll_tie_wire', 'roll_tie_wire_price_item_calculate'),
+    'Marteau': ('MEB_hammer', 'hammer_price_item_calculate'),
+    'Pelle': ('MEB_shovel', 'shovel_price_item_calculate'),
+    'Sécateur': ('MEB_pair_of_shears', 'pair_of_shears_price_item_calculate'),
+    'Houe': ('MEB_hoe', 'hoe_price_item_calculate'),
+    'Pioche': ('MEB_pickaxe', 'pickaxe_price_item_calculate'),
+    'Torche (y compris piles ou batteries)': ('MEB_torch', 'torch_price_item_calculate'),
+    'Carte sim': ('MEB_sim_card', 'sim_card_price_item_calculate'),
+    'Téléphone': ('MEB_mobile_phone', 'mobile_phone_price_item_calculate'),
+    'Recharge de telephone de 100 HTG': ('MEB_carte_telephone', None),
+    'Moustiquaire double': ('MEB_mosquito_net', 'mosquito_net_2plc_price_unit_item_calculate'),
+}
+
+# Unit price in HTG of the articles that are not surveyed
+FIXED_PRICES = {
+    'MEB_carte_telephone': 100.0,
+}
+
+# Monthly flat amounts in HTG ('Forfait en HTG') of the 'Dépenses moyennes' article of
+# each sector, based on the median expenses of the households
+FLAT_AMOUNTS = {
+    'Education': ('MEB_depanse_median_education', 7758.0),
+    'Santé': ('MEB_depanse_median_sante', 6465.0),
+}
+
+# Column of the MEB long format holding the cost of each sector basket
+BASKET_COLUMNS = {
+    'ABNA': 'MEB_abna_basket',
+    'ABNA Shelter': 'MEB_ABNA_shelter_basket',
+    'WASH': 'MEB_WASH_basket',
+    'Protection': 'MEB_Protection_basket',
+    'Santé': 'MEB_sante_basket',
+    'Education': 'MEB_Education_basket',
+}
+TOTAL_COLUMN = 'MEB_total'
+
+# 'Crisis Type' of the product definitions -> 'Type_meb' of the MEB long format
+TYPE_MEB = {
+    'MEB Crise prolongée': 'MEB crise prolongée',
+    "MEB Crise d'urgence": "MEB crise d'urgence",
+}
+
+# Geographic level of the MEB ('meb_par') -> ('Filtre' of the prices, whether the national cost is a zone)
+MEB_LEVELS = {
+    'Département et national': ('Département', True),
+    'Marché': ('Marché', False),
+    'Type de Marché': ('Type de marché', False),
+}
+NATIONAL = 'Tout le pays'
+
+# Articles bought once ('Ponctuelle') are renewed every year
+ONE_OFF_MONTHS = 12
+
+
+def monthly_quantities(df_produits):
+    """
+    Return the quantity of each article bought by a household of 5 people per month.
+
+    One-off articles are spread over ONE_OFF_MONTHS; the rounded 'Quantités/ménage/mois'
+    column of the product definitions is only shown. Flat amounts (FLAT_AMOUNTS) are
+    given in HTG, for a unit price of 1.
+
+    Parameters:
+    - df_produits (pd.DataFrame): The product definitions (see meb.create_meb_produits_data).
+
+    Returns:
+    - quantities (pd.Series): Float quantity of each row of df_produits.
+    """
+    quantities = pd.to_numeric(df_produits['Quantité pour menage 5 personnes'], errors='coerce').astype(float)
+    one_off = df_produits['Fréquence'].str.strip() == 'Ponctuelle'
+    quantities = quantities.where(~one_off, quantities / ONE_OFF_MONTHS)
+    flat = df_produits['Sector'].map({sector: amount for sector, (_, amount) in FLAT_AMOUNTS.items()})
+    return quantities.fillna(flat)
+
+
+def article_columns(df_produits):
+    """Return the MEB column of each row of df_produits (see ARTICLES and FLAT_AMOUNTS)."""
+    columns = df_produits['Articles'].map({article: column for article, (column, _) in ARTICLES.items()})
+    flat = df_produits['Sector'].map({sector: column for sector, (column, _) in FLAT_AMOUNTS.items()})
+    return columns.fillna(flat)
+
+
+def build_quantity_matrix(df_produits):
+    """
+    Build the matrix giving every output of the MEB long format from the article prices.
+
+    Each crisis type has one output per article of its baskets (price × quantity),
+    one per sector basket (sum of its articles) and one for MEB_total (sum of the
+    baskets), so that `prices @ matrix` computes all of them at once.
+
+    Parameters:
+    - df_produits (pd.DataFrame): The product definitions (see meb.create_meb_produits_data).
+
+    Returns:
+    - articles (list): MEB column of each row of the matrix (the price columns).
+    - outputs (pd.DataFrame): One row per column of the matrix, with the 'Type_meb',
+      'Product', 'sector', 'is_basket' and 'is_total' columns of the MEB long format.
+    - matrix (np.ndarray): Float matrix (articles x outputs) of the monthly quantities.
+    """
+    produits = pd.DataFrame({
+        'Type_meb': df_produits['Crisis Type'].str.strip().map(TYPE_MEB),
+        'sector': df_produits['Sector'].str.strip(),
+        'Product': article_columns(df_produits),
+        'quantity': monthly_quantities(df_produits),
+    }).dropna(subset=['Type_meb', 'Product'])
+    articles = sorted(produits['Product'].unique())
+    position = {article: i for i, article in enumerate(articles)}
+
+    outputs, columns = [], []
+    for type_meb, rows in produits.groupby('Type_meb', sort=True):
+        baskets = {}
+        for row in rows.itertuples(index=False):
+            column = np.zeros(len(articles))
+            column[position[row.Product]] = row.quantity
+            outputs.append((type_meb, row.Product, row.sector, False, False))
+            columns.append(column)
+            baskets[row.sector] = baskets.get(row.sector, 0) + column
+        for sector, column in baskets.items():
+            outputs.append((type_meb, BASKET_COLUMNS[sector], sector, True, False))
+            columns.append(column)
+        outputs.append((type_meb, TOTAL_COLUMN, 'Total', True, True))
+        columns.append(sum(baskets.values()))
+
+    outputs = pd.DataFrame(outputs, columns=['Type_meb', 'Product', 'sector', 'is_basket', 'is_total'])
+    return articles, outputs, np.column_stack(columns)
+
+
+def build_price_matrix(df_prices, articles):
+    """
+    Build the zone × article matrix of the median prices of every cycle and geographic level.
+
+    Articles without a price in a zone take the national median of the cycle, as
+    in the MEB methodology; articles without any price stay missing.
+
+    Parameters:
+    - df_prices (pd.DataFrame): The 'Prix median' rows in HTG (e.g. the filtered prix median view).
+    - articles (list): MEB column of each article (see build_quantity_matrix).
+
+    Returns:
+    - zones (pd.DataFrame): One row per row of the matrix, with the 'Cycle', 'meb_par' and 'zone' columns.
+    - prices (np.ndarray): Float matrix (zones x articles); missing prices are NaN.
+    """
+    variables = {variable: column for column, variable in ARTICLES.values() if variable is not None}
+    rows = df_prices[df_prices['question_variable_name'].isin(list(variables))]
+    medians = rows.pivot_table(index=['Cycle', 'Filtre', 'Disag'], columns='question_variable_name',
+                               values='Value', aggfunc='median', observed=True)
+    medians = medians.rename(columns=variables).reindex(columns=articles)
+
+    index = medians.index.to_frame(index=False)
+    cycles = index['Cycle'].astype(str).to_numpy()
+    filtres = index['Filtre'].astype(str).to_numpy()
+    disags = index['Disag'].astype(str).to_numpy()
+    is_national = disags == NATIONAL
+    national = medians[is_national].groupby(level='Cycle', observed=True).median()
+    national.index = national.index.astype(str)
+
+    prices = medians.to_numpy(dtype=float)
+    prices = np.where(np.isnan(prices), national.reindex(cycles).to_numpy(dtype=float), prices)
+
+    # Zones of each MEB level; the national cost is listed with the departments
+    zones, matrices = [], []
+    for meb_par, (filtre, with_national) in MEB_LEVELS.items():
+        selected = (filtres == filtre) & ~is_national
+        zones.append(pd.DataFrame({'Cycle': cycles[selected], 'meb_par': meb_par, 'zone': disags[selected]}))
+        matrices.append(prices[selected])
+        if with_national:
+            zones.append(pd.DataFrame({'Cycle': national.index, 'meb_par': meb_par, 'zone': NATIONAL}))
+            matrices.append(national.to_numpy(dtype=float))
+    zones = pd.concat(zones, ignore_index=True)
+    prices = np.vstack(matrices)
+
+    for column, price in FIXED_PRICES.items():
+        prices[:, articles.index(column)] = price
+    for column, _ in FLAT_AMOUNTS.values():
+        prices[:, articles.index(column)] = 1.0
+    return zones, prices
+
+
+def compute_meb_costs(df_prices, df_produits):
+    """
+    Compute the MEB of every zone, cycle and crisis type from the median prices.
+
+    The price matrix (zones x articles) is multiplied once by the quantity matrix
+    (articles x outputs), which gives every article cost, sector basket and
+    MEB_total. An output is missing when one of its articles has no price, even
+    nationally.
+
+    Parameters:
+    - df_prices (pd.DataFrame): The 'Prix median' rows in HTG (e.g. the filtered prix median view).
+    - df_produits (pd.DataFrame): The product definitions (see meb.create_meb_produits_data).
+
+    Returns:
+    - df_meb_long (pd.DataFrame): The costs in HTG in the long format of meb.build_meb_data,
+      with the 'zone', 'Type_meb', 'meb_par', 'Cycle', 'Product', 'Value', 'sector',
+      'is_basket' and 'is_total' columns.
+    """
+    articles, outputs, quantities = build_quantity_matrix(df_produits)
+    zones, prices = build_price_matrix(df_prices, articles)
+
+    missing = np.isnan(prices)
+    costs = np.where(missing, 0.0, prices) @ quantities
+    # NaN prices would spread to the outputs without the article, whose quantity is 0
+    costs[(missing.astype(float) @ (quantities != 0)) > 0] = np.nan
+
+    n_zones, n_outputs = costs.shape
+    df_meb_long = pd.DataFrame({
+        'zone': np.repeat(zones['zone'].to_numpy(), n_outputs),
+        'Type_meb': np.tile(outputs['Type_meb'].to_numpy(), n_zones),
+        'meb_par': np.repeat(zones['meb_par'].to_numpy(), n_outputs),
+        'Cycle': np.repeat(zones['Cycle'].to_numpy(), n_outputs),
+        'Product': np.tile(outputs['Product'].to_numpy(), n_zones),
+        'Value': costs.ravel(),
+        'sector': np.tile(outputs['sector'].to_numpy(), n_zones),
+        'is_basket': np.tile(outputs['is_basket'].to_numpy(), n_zones),
+        'is_total': np.tile(outputs['is_total'].to_numpy(), n_zones),
+    })
+    # Kept with the costs for the what-if scenarios (see price_matrix)
+    derived(df_meb_long, 'meb_price_matrix', lambda _: (zones, articles, prices))
+    return df_meb_long
+
+
+def price_matrix(df_meb_long):
+    """
+    Return the prices the costs of df_meb_long were computed from (see build_price_matrix).
+
+    Returns:
+    - zones (pd.DataFrame), articles (list), prices (np.ndarray)
+    """
+    def missing(_):
+        raise ValueError("The MEB costs were not computed by compute_meb_costs")
+    return derived(df_meb_long, 'meb_price_matrix', missing)
+
+
+@dataclass
+class ScenarioCosts:
+    """
+    Costs of the baskets of one crisis type in every zone and cycle, for edited quantities.
+
+    Changing the quantity of an article only adds the change of its cost to its
+    sector basket and to the total of each zone, instead of computing the
+    baskets again.
+
+    Attributes:
+    - zones (pd.DataFrame): 'Cycle', 'meb_par' and 'zone' of each row.
+    - articles (list): MEB column of each article (see build_quantity_matrix).
+    - baskets (list): Name of each cost column: the sectors, then 'Total'.
+    - prices (np.ndarray): Float matrix (zones x articles), 0 where the price is missing.
+    - missing (np.ndarray): Boolean matrix (zones x articles) of the missing prices.
+    - membership (np.ndarray): Float matrix (articles x baskets), 1 where an article is part of a basket.
+    - quantities (np.ndarray): Monthly quantity of each article (0 for dropped articles).
+    - costs (np.ndarray): Float matrix (zones x baskets) of the costs of the known prices.
+    - missing_counts (np.ndarray): Integer matrix (zones x baskets) of the articles without price.
+    """
+    zones: pd.DataFrame
+    articles: list
+    baskets: list
+    prices: np.ndarray
+    missing: np.ndarray
+    membership: np.ndarray
+    quantities: np.ndarray
+    costs: np.ndarray
+    missing_counts: np.ndarray
+
+    @classmethod
+    def from_costs(cls, df_meb_long, df_produits, type_meb):
+        """
+        Compute the baskets of a crisis type with the quantities of the product definitions.
+
+        Parameters:
+        - df_meb_long (pd.DataFrame): The costs returned by compute_meb_costs.
+        - df_produits (pd.DataFrame): The product definitions (see meb.create_meb_produits_data).
+        - type_meb (str): The crisis type, as in the 'Type_meb' column (e.g. 'MEB crise prolongée').
+
+        Returns:
+        - scenario (ScenarioCosts)
+        """
+        zones, articles, prices = price_matrix(df_meb_long)
+        rows = df_produits[df_produits['Crisis Type'].str.strip().map(TYPE_MEB) == type_meb]
+        columns = article_columns(rows).to_numpy()
+        sectors = rows['Sector'].str.strip().to_numpy()
+        baskets = sorted(set(sectors)) + ['Total']
+
+        position = [articles.index(column) for column in columns]
+        membership = np.zeros((len(articles), len(baskets)))
+        membership[position, [baskets.index(sector) for sector in sectors]] = 1
+        membership[position, -1] = 1
+        quantities = np.zeros(len(articles))
+        quantities[position] = monthly_quantities(rows).to_numpy()
+
+        missing = np.isnan(prices)
+        prices = np.where(missing, 0.0, prices)
+        costs = prices @ (quantities[:, None] * membership)
+        missing_counts = missing.astype(int) @ ((quantities > 0)[:, None] * membership).astype(int)
+        return cls(zones, articles, baskets, prices, missing, membership, quantities, costs, missing_counts)
+
+    def copy(self):
+        """Return a scenario that can be edited independently (the prices are shared)."""
+        return ScenarioCosts(self.zones, self.articles, self.baskets, self.prices, self.missing,
+                             self.membership, self.quantities.copy(), self.costs.copy(),
+                             self.missing_counts.copy())
+
+    def set_quantity(self, article, quantity):
+        """
+        Change the monthly quantity of an article, 0 dropping it from its basket.
+
+        Parameters:
+        - article (str): MEB column of the article (e.g. 'MEB_soap').
+        - quantity (float): The new monthly quantity.
+        """
+        j = self.articles.index(article)
+        change = self.membership[j]
+        self.costs += np.outer(self.prices[:, j], change * (quantity - self.quantities[j]))
+        bought = int(quantity > 0) - int(self.quantities[j] > 0)
+        if bought:
+            self.missing_counts += np.outer(self.missing[:, j], change * bought).astype(int)
+        self.quantities[j] = quantity
+
+    @property
+    def values(self):
+        """Costs of every zone (rows) and basket (columns), NaN when an article has no price."""
+        return np.where(self.missing_counts > 0, np.nan, self.costs)
+
+
+def compare_with_workbooks(DATA_DIR, tolerance=0.05):
+    """
+    Compare the computed costs with those of the '_MEB_analyse.xlsx' workbooks of DATA_DIR.
+
+    Returns:
+    - differences (pd.DataFrame): The costs (and sector baskets) that differ by more than
+      `tolerance` HTG, with the 'Value_workbook' and 'Value_engine' columns. Workbooks
+      leave articles without a local price out of the baskets, while the engine uses the
+      national median.
+    """
+    from .meb import build_meb_data, create_meb_produits_data
+    from .prix_median import load_prix_median_data
+
+    _, df_prices = load_prix_median_data(DATA_DIR)
+    engine = compute_meb_costs(df_prices, create_meb_produits_data())
+    workbook = build_meb_data(DATA_DIR)
+    workbook['zone'] = workbook['zone'].replace({'Ouest(zmpap)': 'Ouest (ZMPAP)'})
+
+    keys = ['Cycle', 'Type_meb', 'meb_par', 'zone', 'Product']
+    merged = workbook[keys + ['Value']].merge(engine[keys + ['Value']], on=keys, suffixes=('_workbook', '_engine'))
+    differ = ((merged['Value_workbook'] - merged['Value_engine']).abs() > tolerance) | \
+        (merged['Value_workbook'].isna() != merged['Value_engine'].isna())
+    return merged[differ].reset_index(drop=True)
+
+
+def benchmark(DATA_DIR, repeat=5):
+    """
+    Time compute_meb_costs and the edition of a quantity on the prices of DATA_DIR.
+
+    Returns:
+    - timings (dict): {operation: best time in milliseconds}.
+    """
+    from .meb import create_meb_produits_data
+    from .prix_median import load_prix_median_data
+
+    _, df_prices = load_prix_median_data(DATA_DIR)
+    df_produits = create_meb_produits_data()
+    df_meb_long = compute_meb_costs(df_prices, df_produits)
+    scenario = ScenarioCosts.from_costs(df_meb_long, df_produits, TYPE_MEB['MEB Crise prolongée'])
+
+    operations = {
+        'compute_meb_costs': lambda: compute_meb_costs(df_prices, df_produits),
+        'ScenarioCosts.set_quantity': lambda: scenario.set_quantity('MEB_soap', scenario.quantities[
+            scenario.articles.index('MEB_soap')] + 1),
+    }
+    timings = {}
+    for name, operation in operations.items():
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            operation()
+            best = min(best, time.perf_counter() - start)
+        timings[name] = best * 1000
+    return timings
+
+
+if __name__ == "__main__":
+    import os
+    DATA_DIR = os.path.join(os.path.dirname(__file__), 'data')
+    for name, ms in benchmark(DATA_DIR).items():
+        print(f"{name}: {ms:.3f} ms for all zones and cycles")
+    differences = compare_with_workbooks(DATA_DIR)
+    print(f"{len(differences)} costs differ from the MEB workbooks")
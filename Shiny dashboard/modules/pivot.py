@@ -0,0 +1,67 @@
+# modules/pivot.py
+
+from dataclasses import dataclass
+from functools import cached_property
+
+import numpy as np
+import pandas as pd
+
+
+@dataclass
+class PivotResult:
+    """
+    A pivot table kept as numbers, with its display strings computed on first use.
+
+    Attributes:
+    - values (np.ndarray): 2-D float matrix (rows x columns); missing cells are NaN.
+    - row_labels (list): Label of each row (e.g. product or sector names).
+    - columns (list): Name of each column (e.g. geographic units).
+    - label (str): Name of the row labels (e.g. 'Produit', 'Secteur').
+    - decimals (int): Number of decimals of the display strings.
+    """
+    values: np.ndarray
+    row_labels: list
+    columns: list
+    label: str
+    decimals: int = 0
+
+    @classmethod
+    def from_pivot(cls, pivot, label, decimals=0):
+        """
+        Build a result from a pivot DataFrame whose index holds the row labels.
+
+        Parameters:
+        - pivot (pd.DataFrame): Numeric pivot, e.g. an entry of the prix or MEB cube.
+        - label (str): Name of the row labels.
+        - decimals (int): Number of decimals of the display strings.
+
+        Returns:
+        - result (PivotResult)
+        """
+        return cls(pivot.to_numpy(dtype=float), pivot.index.tolist(), list(pivot.columns), label, decimals)
+
+    @property
+    def empty(self):
+        """Whether the pivot has no row."""
+        return len(self.row_labels) == 0
+
+    @cached_property
+    def formatted(self):
+        """Values rounded and shown with thousands separators (e.g. '1,250'), None for missing cells."""
+        spec = f",.{self.decimals}f"
+        return np.array([[None if v != v else format(v, spec) for v in row] for row in self.values.tolist()],
+                        dtype=object).reshape(self.values.shape)
+
+    def to_frame(self, formatted=False):
+        """
+        Return the pivot as a DataFrame with the row labels as its first column.
+
+        Parameters:
+        - formatted (bool): Whether to give the display strings instead of the numbers.
+
+        Returns:
+        - df (pd.DataFrame)
+        """
+        df = pd.DataFrame(self.formatted if formatted else self.values, columns=self.columns)
+        df.insert(0, self.label, self.row_labels)
+        return df
@@ -1,72 +1,129 @@
 # modules/prix_median.py
 
-import os
+import numpy as np
 import pandas as pd
 import logging
 from shiny import App, ui, render, reactive
 from shiny.ui import tags, modal, modal_show
 
-def load_prix_median_data(DATA_DIR):
+from .data_registry import get_view, get_icsm_base, derive_view, derived, map_categories, live_view
+from .comparison import PREVIOUS_CYCLE, baseline_cycle, comparison_choices, percent_change
+from .html_table import heatmap_table_html, change_table_html
+from .render_cache import cached_render
+from .pivot import PivotResult
+from .currency import (BASE_CURRENCY, CURRENCIES, CURRENCY_DECIMALS, load_exchange_rates, attach_exchange_rates,
+                       exchange_rates, conversion_rate, convert_pivot, relabel_currency, currency_title)
+
+def build_prix_median_view(base):
     """
-    Load and prepare data for the "Prix des Produits" tab panel.
-    
-    This function now loads all Excel files ending with '_ICSM_analyse.xlsx'
-    from DATA_DIR. For each file, it adds a column 'Cycle' (e.g. 'cycle_1') based
-    on the file name, then merges them into a single DataFrame.
+    Build the "Prix des Produits" view over the shared ICSM base frame.
 
     Parameters:
-    - DATA_DIR (str): The directory where the Excel data files are located.
-    
+    - base (pd.DataFrame): The normalised ICSM base frame (see data_registry.get_icsm_base).
+
     Returns:
-    - df (pd.DataFrame): The original DataFrame with additional columns.
+    - df (pd.DataFrame): The base frame with the additional 'Produit' and 'currency' columns.
     - df_filtered (pd.DataFrame): The filtered DataFrame for 'Prix median' and 'HTG' currency.
     """
-    # Loop through all Excel files ending with '_ICSM_analyse.xlsx'
-    excel_files = [f for f in os.listdir(DATA_DIR) if f.endswith('_ICSM_analyse.xlsx')]
-    if not excel_files:
-        raise FileNotFoundError("No Excel files ending with '_ICSM_analyse.xlsx' found in the specified directory.")
-    
-    list_dfs = []
-    for file in excel_files:
-        file_path = os.path.join(DATA_DIR, file)
-        try:
-            df_temp = pd.read_excel(file_path)
-        except Exception as e:
-            raise ValueError(f"Error reading the Excel file {file}: {e}")
-        # Extract the cycle name from the file name (e.g. 'cycle_1' from 'cycle_1_ICSM_analyse.xlsx')
-        cycle_name = file.split('_ICSM_analyse.xlsx')[0]
-        df_temp['Cycle'] = cycle_name
-        list_dfs.append(df_temp)
-    df = pd.concat(list_dfs, ignore_index=True)
-    
     # Ensure required columns exist
     required_columns = ['question_variable_label', 'Filtre', 'Sujet', 'Sector']
     for col in required_columns:
-        if col not in df.columns:
+        if col not in base.columns:
             raise KeyError(f"Required column '{col}' is missing from the data.")
-    
+
+    df = derive_view(base)
+
     # Create 'Produit' column
     df['Produit'] = df['question_variable_label']
-    
+
     # Create 'currency' column
-    df['currency'] = df['question_variable_label'].apply(
+    df['currency'] = map_categories(
+        df['question_variable_label'],
         lambda x: 'USD' if 'usd' in str(x).lower() else 'HTG'
     )
-    
-    # Define the mapping for 'Filtre' column and adjust 'Disag'
-    df['Filtre'] = df['Filtre'].replace({"Toute l'evaluation": 'Tout le pays'}) 
-    df['Disag'] = df['Disag'].replace({"Toute l'evaluation": 'Tout le pays'})    
-    
+
     # Filter the DataFrame for 'Prix median'
     df_filtered = df[df['Sujet'] == 'Prix median']
-    
+
     # Further filter for 'HTG' currency
     df_filtered = df_filtered[df_filtered['currency'] == 'HTG']
-    
+
     return df, df_filtered
 
 
-def get_prix_median_choices(df_filtered):
+def _prix_median_view(DATA_DIR):
+    df, df_filtered = build_prix_median_view(get_icsm_base(DATA_DIR))
+    # Prices are stored in HTG and converted when shown
+    attach_exchange_rates(df_filtered, load_exchange_rates(DATA_DIR))
+    # Materialise the pivot cube at load time rather than on the first render
+    prix_cube(df_filtered)
+    return df, df_filtered
+
+
+def median_pivot(rows):
+    """
+    Return the median 'Value' of each 'Produit' (rows) and 'Disag' level (columns).
+
+    Parameters:
+    - rows (pd.DataFrame): The prices of a single cycle, sector and geographic level.
+
+    Returns:
+    - pd.DataFrame: Float matrix indexed by 'Produit', one column per 'Disag' level.
+    """
+    return rows.pivot_table(
+        index='Produit',
+        columns='Disag',
+        values='Value',
+        aggfunc='median',
+        observed=True
+    )
+
+
+def build_prix_cube(df_filtered):
+    """
+    Precompute the Produit × Disag median matrix of every (Cycle, Sector, Filtre) combination.
+
+    Parameters:
+    - df_filtered (pd.DataFrame): The DataFrame filtered for 'Prix median' and 'HTG' currency.
+
+    Returns:
+    - cube (dict): {(cycle, sector, filtre): pd.DataFrame} as returned by median_pivot.
+    """
+    return {
+        key: median_pivot(rows)
+        for key, rows in df_filtered.groupby(['Cycle', 'Sector', 'Filtre'], observed=True)
+    }
+
+
+def prix_cube(df_filtered):
+    """
+    Return the pivot cube of df_filtered (see build_prix_cube), computed once per DataFrame.
+
+    Lookups are keyed by ('cycle_X', sector, geographic level); combinations without
+    any price are missing from the cube.
+    """
+    return derived(df_filtered, 'prix_cube', build_prix_cube)
+
+
+def load_prix_median_data(DATA_DIR):
+    """
+    Load and prepare data for the "Prix des Produits" tab panel.
+    
+    The '_ICSM_analyse.xlsx' workbooks of DATA_DIR are read and normalised once by
+    the data registry, which is shared with the "Indicateurs non tarifaires" tab.
+    Each workbook carries a 'Cycle' column (e.g. 'cycle_1') based on its file name.
+
+    Parameters:
+    - DATA_DIR (str): The directory where the Excel data files are located.
+    
+    Returns:
+    - df (pd.DataFrame): The original DataFrame with additional columns.
+    - df_filtered (pd.DataFrame): The filtered DataFrame for 'Prix median' and 'HTG' currency.
+    """
+    return get_view(DATA_DIR, 'prix_median', _prix_median_view)
+
+
+def build_prix_median_choices(df_filtered):
     """
     Get unique choices for dropdowns in the "Prix des Produits" tab panel.
     
@@ -80,64 +137,77 @@ def get_prix_median_choices(df_filtered):
     return secteur_choices_prix, region_choices, cycle_choices
 
 
+def get_prix_median_choices(df_filtered):
+    """Return the choices of the dropdowns (see build_prix_median_choices), computed once per DataFrame."""
+    return derived(df_filtered, 'prix_choices', build_prix_median_choices)
+
+
+def prix_result(pivot, currency=BASE_CURRENCY):
+    """Return a cube pivot in `currency` as a PivotResult with 'Tout le pays' as the last column."""
+    # Rearrange columns to move 'Tout le pays' to the last
+    if "Tout le pays" in pivot.columns:
+        cols = [col for col in pivot.columns if col != "Tout le pays"]
+        cols.append("Tout le pays")
+        pivot = pivot[cols]
+    return PivotResult.from_pivot(pivot, 'Produit', CURRENCY_DECIMALS.get(currency, 2))
+
+
+def converted_prices(pivot, rates, cycle, currency):
+    """Convert a cube pivot to `currency`, naming the currency in the product names (see currency.convert_pivot)."""
+    pivot = convert_pivot(pivot, rates, cycle, currency)
+    if pivot is None or currency == BASE_CURRENCY:
+        return pivot
+    return pivot.rename(index=lambda label: relabel_currency(label, currency))
+
+
 def create_prix_median_table(df, input):
     """
-    Create a pivot table for the "Prix des Produits" tab panel based on user inputs.
-    Formats numbers with commas and rearranges columns.
+    Create the pivot table (products x levels) for the "Prix des Produits" tab panel based on user inputs.
+    The pivot comes from the precomputed cube (see prix_cube), so no filtering
+    or aggregation happens here. 'Tout le pays' is the last column.
 
     Parameters:
     - df (pd.DataFrame): The filtered DataFrame (already filtered for 'Sujet' and 'currency').
     - input: Shiny input object.
 
     Returns:
-    - pivot_df (pd.DataFrame): The formatted pivot table.
+    - result (PivotResult): Median prices by 'Produit' in the selected currency, with
+      their display strings (e.g. '1,250') in result.formatted. Empty if there is
+      no data or no exchange rate.
     """
     # Convert the slider value to the corresponding cycle string.
     current_cycle = f"cycle_{input.cycle_select()}"
-    
-    # Filter data based on user inputs, including the new Cycle filter
-    filtered_df = df[
-        (df['Sector'] == input.secteur_select_prix()) &
-        (df['Filtre'] == input.region_select()) &
-        (df['Cycle'] == current_cycle)
-    ]
-
-    # Create pivot table
-    pivot_df = filtered_df.pivot_table(
-        index='Produit',
-        columns='Disag',
-        values='Value',
-        aggfunc='median'
-    ).reset_index()
 
-    # Format numerical values with commas
-    numeric_cols = pivot_df.select_dtypes(include=['float', 'int']).columns
-    pivot_df[numeric_cols] = pivot_df[numeric_cols].applymap(lambda x: f"{x:,.0f}" if pd.notnull(x) else x)
+    # Look up the precomputed pivot of the selected cycle, sector and level
+    pivot = prix_cube(df).get((current_cycle, input.secteur_select_prix(), input.region_select()))
+    currency = input.currency_select_prix()
+    rates = exchange_rates(df)
+    if pivot is None or np.isnan(conversion_rate(rates, current_cycle, currency)):
+        return PivotResult.from_pivot(pd.DataFrame(), 'Produit')
 
-    # Rearrange columns to move 'Tout le pays' to the last
-    if "Tout le pays" in pivot_df.columns:
-        cols = list(pivot_df.columns)
-        cols.remove("Tout le pays")
-        cols.append("Tout le pays")
-        pivot_df = pivot_df[cols]
+    # One result per cube entry and currency, so that its display strings are formatted once
+    return derived(pivot, f'prix_result_{currency}',
+                   lambda p: prix_result(converted_prices(p, rates, current_cycle, currency), currency))
 
-    return pivot_df
 
-
-def create_prix_difference_table(df, input):
+def create_prix_difference_table(df, input, baseline=None):
     """
-    Create a pivot table of percent differences between consecutive cycles.
-    
-    For the selected cycle (e.g. cycle_2) the function finds the corresponding previous cycle (cycle_1)
-    and computes, for each product and for each 'Disag' level, the percentage difference as:
-        ((value_current - value_previous) / value_previous) * 100.
-    
-    If the selected cycle is the first cycle (i.e. cycle_1) or if data for either cycle is missing,
-    an empty DataFrame (or None) is returned.
+    Create a pivot table of percent differences between two cycles.
+
+    For the selected cycle (e.g. cycle_3) the function compares with the baseline
+    cycle (by default the previous one, cycle_2) and computes, for each product
+    and for each 'Disag' level, the percentage difference as:
+        ((value_current - value_baseline) / value_baseline) * 100.
+
+    If there is no cycle to compare with (the selected cycle is the first one, or is
+    the baseline itself), None is returned. If data for either cycle is missing,
+    an empty DataFrame is returned.
 
     Parameters:
     - df (pd.DataFrame): The full DataFrame with data for all cycles.
     - input: Shiny input object.
+    - baseline (str): The cycle to compare with (e.g. 'cycle_1'), or None / 'previous'
+      for the cycle before the selected one.
 
     Returns:
     - diff_table (pd.DataFrame): Pivot table with percentage differences.
@@ -151,73 +221,71 @@ def create_prix_difference_table(df, input):
     except Exception as e:
         logging.error(f"Error converting cycle selection to integer: {e}")
         return pd.DataFrame()
-    
-    if cycle_num <= 1:
-        # No previous cycle to compare with.
-        return None
 
     current_cycle = f"cycle_{cycle_num}"
-    previous_cycle = f"cycle_{cycle_num - 1}"
-    
-    # Filter for the selected sector, region, and both cycles
-    df_current = df[(df['Sector'] == secteur) &
-                    (df['Filtre'] == region) &
-                    (df['Cycle'] == current_cycle)]
-    df_previous = df[(df['Sector'] == secteur) &
-                     (df['Filtre'] == region) &
-                     (df['Cycle'] == previous_cycle)]
-    
-    if df_current.empty or df_previous.empty:
+    compared_cycle = baseline_cycle(current_cycle, baseline)
+    if compared_cycle is None:
+        # No other cycle to compare with.
+        return None
+
+    # Look up the pivot tables of both cycles
+    cube = prix_cube(df)
+    pivot_current = cube.get((current_cycle, secteur, region))
+    pivot_baseline = cube.get((compared_cycle, secteur, region))
+
+    if pivot_current is None or pivot_baseline is None:
         return pd.DataFrame()
-    
-    # Create pivot tables for current and previous cycles
-    pivot_current = df_current.pivot_table(
-        index='Produit',
-        columns='Disag',
-        values='Value',
-        aggfunc='median'
-    ).reset_index()
-    pivot_previous = df_previous.pivot_table(
-        index='Produit',
-        columns='Disag',
-        values='Value',
-        aggfunc='median'
-    ).reset_index()
-    
-    # Merge the two pivot tables on 'Produit'
-    merged = pd.merge(pivot_current, pivot_previous, on='Produit', how='outer', suffixes=('_curr', '_prev'))
-    
-    # For each 'Disag' column present in both, compute the percent difference.
-    for col in pivot_current.columns:
-        if col == 'Produit':
-            continue
-        curr_col = f"{col}_curr"
-        prev_col = f"{col}_prev"
-        if curr_col in merged.columns and prev_col in merged.columns:
-            merged[f"{col}_diff"] = merged.apply(
-                lambda row: ((row[curr_col] - row[prev_col]) / row[prev_col] * 100)
-                            if pd.notna(row[curr_col]) and pd.notna(row[prev_col]) and row[prev_col] != 0
-                            else None,
-                axis=1
-            )
-    
-    # Build the difference table: keep 'Produit' and for each 'Disag' that we could compute, take its _diff column.
-    diff_cols = ['Produit']
-    for col in pivot_current.columns:
-        if col != 'Produit' and f"{col}_diff" in merged.columns:
-            diff_cols.append(f"{col}_diff")
-    
-    diff_table = merged[diff_cols].copy()
-    # Rename the difference columns to remove the suffix
-    new_columns = {}
-    for col in diff_table.columns:
-        if col.endswith("_diff"):
-            new_columns[col] = col.replace("_diff", "")
-        else:
-            new_columns[col] = col
-    diff_table.rename(columns=new_columns, inplace=True)
-    
-    return diff_table
+
+    # Each cycle is converted at its own rate
+    currency = input.currency_select_prix()
+    rates = exchange_rates(df)
+    pivot_current = converted_prices(pivot_current, rates, current_cycle, currency)
+    pivot_baseline = converted_prices(pivot_baseline, rates, compared_cycle, currency)
+    if pivot_current is None or pivot_baseline is None:
+        return pd.DataFrame()
+
+    return percent_change(pivot_current, pivot_baseline, 'Produit')
+
+
+def prix_table_html(df, input):
+    """
+    Render the table of the "Prix des Produits" tab for the selections of `input`:
+    the median prices, or their evolution (%) when the switch is on.
+
+    Parameters:
+    - df (pd.DataFrame): The filtered DataFrame (see load_prix_median_data).
+    - input: Shiny input object, or an object answering the same calls (see export.static_input).
+
+    Returns:
+    - ui.HTML: The table, or a message when there is nothing to show.
+    """
+    # Check the switch: if toggled, show the differences table; otherwise, show the price values.
+    if input.toggle_diff():
+        diff_df = create_prix_difference_table(df, input, input.compare_select_prix())
+        if diff_df is None:
+            # This happens when the selected cycle is the first one, or is the baseline itself
+            return ui.HTML("<p>Aucune donnée disponible pour calculer la différence pour le cycle sélectionné.</p>")
+        if diff_df.empty:
+            logging.warning("Differences table is empty. Check the input selections.")
+            return ui.HTML("<p>Aucune donnée disponible pour les sélections actuelles.</p>")
+
+        diff_columns = [col for col in diff_df.columns if col != 'Produit']
+        return ui.HTML(change_table_html(diff_df[diff_columns].to_numpy(dtype=float),
+                                         diff_df['Produit'].tolist(), diff_columns, 'Produit'))
+    else:
+        try:
+            # Look up the pivot table of price values
+            result = create_prix_median_table(df, input)
+            if result.empty:
+                logging.warning("Pivot table is empty. Check the input selections.")
+                return ui.HTML("<p>Aucune donnée disponible pour les sélections actuelles.</p>")
+            table_html = heatmap_table_html(result.values, result.row_labels, result.columns,
+                                            'prix-table', result.label, highlight_column="Tout le pays",
+                                            formatted=result.formatted, decimals=result.decimals)
+        except Exception as e:
+            logging.error(f"Error creating pivot table: {e}")
+            return ui.HTML("<p>Une erreur s'est produite lors de la création du tableau.</p>")
+        return ui.HTML(table_html)
 
 
 def prix_median_ui(cycle_choices, secteur_choices_prix, region_choices):
@@ -275,6 +343,30 @@ def prix_median_ui(cycle_choices, secteur_choices_prix, region_choices):
                     ),
                     class_="custom-select"
                 ),
+                ui.div(
+                    tags.label("Choisir la Devise", class_="custom-select-label"),
+                    ui.input_select(
+                        "currency_select_prix",
+                        None,
+                        choices=list(CURRENCIES),
+                        selected=BASE_CURRENCY,
+                    ),
+                    class_="custom-select"
+                ),
+                # Baseline of the price evolution, shown with the evolution switch
+                ui.panel_conditional(
+                    "input.toggle_diff",
+                    ui.div(
+                        tags.label("Comparer avec", class_="custom-select-label"),
+                        ui.input_select(
+                            "compare_select_prix",
+                            None,
+                            choices=comparison_choices(cycle_choices),
+                            selected=PREVIOUS_CYCLE,
+                        ),
+                        class_="custom-select"
+                    ),
+                ),
             ),
             # Main panel content:
             ui.div(
@@ -295,7 +387,7 @@ def prix_median_ui(cycle_choices, secteur_choices_prix, region_choices):
                     </p>
                     """
                 ),
-                ui.h2("Prix médian des produits en gourdes haïtiennes (HTG)"),
+                ui.h2(ui.output_text("prix_title", inline=True)),
                 ui.output_ui("prix_table")
             )
         ),
@@ -312,121 +404,42 @@ def prix_median_server(input, output, session, df):
     - session: Shiny session object.
     - df (pd.DataFrame): The filtered DataFrame loaded from data.
     """
+    # Latest version of df, updated when a new cycle is loaded without restarting the server
+    data = live_view(df)
+    shown = {'df': df}
+
+    @reactive.Effect
+    def update_choices_after_reload():
+        """Push the slider range and choices of reloaded data to this session."""
+        df_now = data()
+        if df_now is shown['df']:
+            return
+        shown['df'] = df_now
+        secteur_choices_prix, region_choices, cycle_choices = get_prix_median_choices(df_now)
+        with reactive.isolate():
+            secteur = input.secteur_select_prix()
+            region = input.region_select()
+            baseline = input.compare_select_prix()
+        ui.update_slider("cycle_select", max=len(cycle_choices))
+        compare_choices = comparison_choices(cycle_choices)
+        ui.update_select("compare_select_prix", choices=compare_choices,
+                         selected=baseline if baseline in compare_choices else PREVIOUS_CYCLE)
+        ui.update_select("secteur_select_prix", choices=secteur_choices_prix,
+                         selected=secteur if secteur in secteur_choices_prix else None)
+        ui.update_select("region_select", choices=region_choices,
+                         selected=region if region in region_choices else None)
+
+    @output
+    @render.text
+    def prix_title():
+        return f"Prix médian des produits en {currency_title(input.currency_select_prix())}"
 
     @output
     @render.ui
     def prix_table():
-        # Check the switch: if toggled, show the differences table; otherwise, show the price values.
+        # The same inputs give the same table in every session: render it once per process
+        inputs = (input.cycle_select(), input.secteur_select_prix(), input.region_select(),
+                  input.currency_select_prix(), bool(input.toggle_diff()))
         if input.toggle_diff():
-            diff_df = create_prix_difference_table(df, input)
-            if diff_df is None:
-                # This happens when the selected cycle is the first one
-                return ui.HTML("<p>Aucune donnée disponible pour calculer la différence pour le cycle sélectionné.</p>")
-            if diff_df.empty:
-                logging.warning("Differences table is empty. Check the input selections.")
-                return ui.HTML("<p>Aucune donnée disponible pour les sélections actuelles.</p>")
-            
-            # Build HTML table for differences
-            def apply_diff_format(row):
-                # Format each row: first column is Produit; other columns are differences.
-                styled_row = []
-                for col in diff_df.columns:
-                    if col == 'Produit':
-                        styled_row.append(f"<td><strong>{row[col]}</strong></td>")
-                    else:
-                        cell_value = row[col]
-                        if cell_value is None or pd.isna(cell_value):
-                            styled_row.append("<td></td>")
-                        else:
-                            if cell_value > 0:
-                                # Positive difference: show ▲ +x.x% with red color (#CD2030)
-                                formatted = f"▲ +{cell_value:.1f}%"
-                                styled_row.append(f"<td style='color: #CD2030;'><strong>{formatted}</strong></td>")
-                            elif cell_value < 0:
-                                # Negative difference: show ▼-x.x% with green color (#086D38)
-                                formatted = f"▼{cell_value:.1f}%"
-                                styled_row.append(f"<td style='color: #086D38;'><strong>{formatted}</strong></td>")
-                            else:
-                                # Exactly zero difference => show "="
-                                formatted = f"= {cell_value:.1f}%"
-                                styled_row.append(f"<td><strong>{formatted}</strong></td>")
-                return "<tr>" + "".join(styled_row) + "</tr>"
-            
-            table_html = "<table class='difference-table'><thead><tr>"
-            for col in diff_df.columns:
-                table_html += f"<th>{col}</th>"
-            table_html += "</tr></thead><tbody>"
-            for _, row in diff_df.iterrows():
-                table_html += apply_diff_format(row)
-            table_html += "</tbody></table>"
-            
-            return ui.HTML(table_html)
-        else:
-            try:
-                # Create the pivot table for price values
-                pivot_df = create_prix_median_table(df, input)
-                if pivot_df.empty:
-                    logging.warning("Pivot table is empty. Check the input selections.")
-                    return ui.HTML("<p>Aucune donnée disponible pour les sélections actuelles.</p>")
-            except Exception as e:
-                logging.error(f"Error creating pivot table: {e}")
-                return ui.HTML("<p>Une erreur s'est produite lors de la création du tableau.</p>")
-            
-            evaluation_col = "Tout le pays"
-            def apply_conditional_colors(row):
-                # Exclude the 'Produit' and evaluation column from quantile calculations
-                numeric_cols = [col for col in row.index if col not in ['Produit', evaluation_col]]
-                try:
-                    values = pd.to_numeric(row[numeric_cols].replace(',', '', regex=True), errors='coerce')
-                except AttributeError:
-                    values = pd.to_numeric(row[numeric_cols], errors='coerce')
-                quantiles = values.quantile([0.25, 0.5, 0.75]).to_dict()
-                
-                styled_row = []
-                for col in pivot_df.columns:
-                    if col == 'Produit':
-                        styled_row.append(f"<td><strong>{row[col]}</strong></td>")
-                    elif col == evaluation_col:
-                        styled_row.append(f"<td class='highlighted'><strong>{row[col]}</strong></td>")
-                    elif col in numeric_cols:
-                        cell_value = row[col]
-                        if isinstance(cell_value, str):
-                            try:
-                                val = pd.to_numeric(cell_value.replace(',', ''), errors='coerce')
-                            except Exception as e:
-                                logging.error(f"Error converting cell value '{cell_value}' in column '{col}': {e}")
-                                val = None
-                        else:
-                            try:
-                                val = pd.to_numeric(cell_value, errors='coerce')
-                            except Exception as e:
-                                logging.error(f"Error converting cell value '{cell_value}' in column '{col}': {e}")
-                                val = None
-                        if pd.isna(val):
-                            styled_row.append(f"<td></td>")
-                        else:
-                            color = "#FEEEED"
-                            if val > quantiles.get(0.75, 0):
-                                color = "#EE5859"
-                            elif val > quantiles.get(0.5, 0):
-                                color = "#F27D7C"
-                            elif val > quantiles.get(0.25, 0):
-                                color = "#F3BEBD"
-                            styled_row.append(f"<td style='background-color: {color};'>{row[col]}</td>")
-                    else:
-                        styled_row.append(f"<td>{row[col]}</td>")
-                return "<tr>" + "".join(styled_row) + "</tr>"
-            
-            table_html = "<table class='prix-table'><thead><tr>"
-            for col in pivot_df.columns:
-                if col == evaluation_col:
-                    table_html += f"<th class='highlighted-header'>{col}</th>"
-                else:
-                    table_html += f"<th>{col}</th>"
-            table_html += "</tr></thead><tbody>"
-            
-            for _, row in pivot_df.iterrows():
-                table_html += apply_conditional_colors(row)
-            
-            table_html += "</tbody></table>"
-            return ui.HTML(table_html)
+            inputs += (baseline_cycle(f"cycle_{input.cycle_select()}", input.compare_select_prix()),)
+        return ui.HTML(cached_render('prix_table', data(), inputs, lambda: str(prix_table_html(data(), input))))
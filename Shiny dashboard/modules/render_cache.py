@@ -0,0 +1,104 @@
+# modules/render_cache.py
+
+import logging
+import threading
+from collections import OrderedDict
+
+from .data_registry import published_version
+
+# Total size of the cached payloads (characters of HTML or figure JSON) before the
+# least recently used ones are evicted
+RENDER_CACHE_MAX_SIZE = 64_000_000
+
+# Payloads larger than this share of the cache are never stored
+RENDER_CACHE_MAX_ENTRY_SHARE = 0.25
+
+# (output name, data version, normalised inputs) -> payload, from the least to the most recently used
+_cache = OrderedDict()
+_lock = threading.RLock()
+_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'size': 0, 'version': None}
+
+
+def _evict(key):
+    payload = _cache.pop(key)
+    _stats['size'] -= len(payload)
+
+
+def _is_stale(version):
+    """
+    Return whether data of `version` was replaced by reloaded data.
+
+    The first render from newer data drops the payloads of the replaced data.
+    """
+    if version is None:
+        return False
+    latest = _stats['version']
+    if latest is not None and version <= latest:
+        return version < latest
+    stale = [key for key in _cache if key[1] is not None]
+    if stale:
+        logging.info(f"Render cache: dropping {len(stale)} entries rendered from replaced data")
+    for key in stale:
+        _evict(key)
+    _stats['version'] = version
+    return False
+
+
+def cached_render(name, data, inputs, render):
+    """
+    Return the payload rendered by `render()` for an output and its inputs, shared by all sessions.
+
+    Every session reads the same data, so an output shown with the same inputs
+    always renders to the same payload: it is computed once per process and
+    data version, and the other sessions get the cached copy. Payloads of
+    replaced data are dropped when the first session renders from reloaded
+    data, and the least recently used payloads are evicted beyond
+    RENDER_CACHE_MAX_SIZE.
+
+    Parameters:
+    - name (str): Name of the output (e.g. 'prix_table').
+    - data: The view the payload is rendered from (as returned by the session's live_view).
+    - inputs (tuple): Hashable, normalised values of every input the payload depends on.
+    - render (callable): Function returning the payload as a string (HTML, figure JSON...).
+
+    Returns:
+    - payload (str): The rendered payload.
+    """
+    version = published_version(data)
+    key = (name, version, inputs)
+    with _lock:
+        stale = _is_stale(version)
+        payload = None if stale else _cache.get(key)
+        if payload is not None:
+            _cache.move_to_end(key)
+            _stats['hits'] += 1
+            return payload
+        _stats['misses'] += 1
+
+    # Rendered outside the lock, so that other outputs are not blocked meanwhile
+    payload = render()
+
+    with _lock:
+        if stale or _is_stale(version) or len(payload) > RENDER_CACHE_MAX_ENTRY_SHARE * RENDER_CACHE_MAX_SIZE:
+            # A session still showing replaced data, or a payload too large to keep
+            return payload
+        if key in _cache:
+            _evict(key)
+        _cache[key] = payload
+        _stats['size'] += len(payload)
+        while _stats['size'] > RENDER_CACHE_MAX_SIZE:
+            _evict(next(iter(_cache)))
+            _stats['evictions'] += 1
+    return payload
+
+
+def render_cache_stats():
+    """Return the hits, misses, evictions, number of entries and size of the render cache."""
+    with _lock:
+        return {
+            'hits': _stats['hits'],
+            'misses': _stats['misses'],
+            'evictions': _stats['evictions'],
+            'entries': len(_cache),
+            'size': _stats['size'],
+        }
@@ -0,0 +1,338 @@
+# modules/tiles.py
+
+import os
+import math
+import hashlib
+import logging
+import threading
+from functools import lru_cache
+
+from .boundaries import SHAPEFILE_DIR, SHAPEFILES, read_boundaries
+from .ingest import CACHE_DIR_NAME
+
+# URL of the tile server, mounted next to the Shiny app by with_tile_server
+TILES_URL = 'tiles'
+
+# URL of the readiness check, served next to the Shiny app by with_tile_server
+HEALTH_URL = 'healthz'
+
+# Admin level -> first zoom it is drawn at. The communal sections (adm3) are only
+# drawn from zoom 10, where they are a few pixels wide.
+TILE_LEVELS = {
+    'adm0': 6,
+    'adm1': 6,
+    'adm2': 8,
+    'adm3': 10,
+}
+
+# Tiles are generated up to this zoom; Leaflet scales them up beyond it
+TILE_MAX_ZOOM = 14
+
+# Tiles of zooms up to this one are generated by `python -m modules.tiles`; the others on first request
+TILE_PREGENERATED_MAX_ZOOM = 12
+
+# Coordinates in a tile go from 0 to TILE_EXTENT; lines are clipped TILE_BUFFER units beyond its edges
+TILE_EXTENT = 4096
+TILE_BUFFER = 64
+
+# Bump when the content of the tiles changes, so that the tiles cached on disk are not reused
+TILES_VERSION = 1
+
+# Extent of Haiti (west, south, east, north), in degrees
+HAITI_BOUNDS = (-74.5, 18.0, -71.6, 20.1)
+
+# Half the side of the Web Mercator square, in metres
+MERCATOR_HALF_SIDE = math.pi * 6378137
+
+_state = {'mounted': False}
+
+
+def _to_mercator(coordinates):
+    """Project (longitude, latitude) coordinates in degrees to Web Mercator metres."""
+    import numpy as np
+
+    x = np.radians(coordinates[:, 0]) * 6378137
+    y = np.log(np.tan(np.pi / 4 + np.radians(coordinates[:, 1]) / 2)) * 6378137
+    return np.column_stack([x, y])
+
+
+@lru_cache(maxsize=None)
+def mercator_lines(level, shapefile_dir=SHAPEFILE_DIR):
+    """
+    Return the outlines of the units of an admin level in Web Mercator, not simplified.
+
+    Borders shared by two units are kept once (see boundaries.boundary_lines).
+    """
+    from shapely import line_merge, transform, unary_union
+
+    gdf = read_boundaries(level, shapefile_dir)
+    lines = line_merge(unary_union(gdf.geometry.boundary.to_numpy()))
+    return transform(lines, _to_mercator)
+
+
+@lru_cache(maxsize=None)
+def _zoom_index(level, z):
+    """
+    Return the outlines of a level simplified for zoom `z`, split in parts, and an STRtree of the parts.
+
+    The tolerance is half a screen pixel at that zoom, so that the tiles only
+    carry the detail that can be seen.
+    """
+    from shapely import STRtree, get_parts
+
+    tolerance = 2 * MERCATOR_HALF_SIDE / (256 * 2 ** z) / 2
+    parts = get_parts(mercator_lines(level).simplify(tolerance, preserve_topology=True))
+    return parts, STRtree(parts)
+
+
+def tile_bounds(z, x, y):
+    """Return the bounds (min x, min y, max x, max y) of a tile in Web Mercator metres."""
+    size = 2 * MERCATOR_HALF_SIDE / 2 ** z
+    min_x = -MERCATOR_HALF_SIDE + x * size
+    max_y = MERCATOR_HALF_SIDE - y * size
+    return min_x, max_y - size, min_x + size, max_y
+
+
+def tile_range(z, bounds=HAITI_BOUNDS):
+    """Return the tile columns and rows of zoom `z` covering `bounds` (west, south, east, north)."""
+    n = 2 ** z
+
+    def column(lon):
+        return min(n - 1, int((lon + 180) / 360 * n))
+
+    def row(lat):
+        lat = math.radians(lat)
+        return min(n - 1, int((1 - math.log(math.tan(lat) + 1 / math.cos(lat)) / math.pi) / 2 * n))
+
+    west, south, east, north = bounds
+    return range(column(west), column(east) + 1), range(row(north), row(south) + 1)
+
+
+# --- Mapbox Vector Tile encoding (protocol buffers, spec version 2) ---
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _field(number, payload):
+    """A length-delimited field (wire type 2)."""
+    return _varint(number << 3 | 2) + _varint(len(payload)) + payload
+
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 31)
+
+
+def _line_commands(lines):
+    """
+    Encode lines of tile coordinates as the geometry commands of one LINESTRING feature.
+
+    Parameters:
+    - lines (list): Arrays of integer (x, y) points, one per line.
+
+    Returns:
+    - commands (list): The unsigned integers of the geometry.
+    """
+    commands = []
+    cursor_x, cursor_y = 0, 0
+    for points in lines:
+        # Consecutive points rounded to the same position are dropped
+        points = [p for i, p in enumerate(points) if i == 0 or p != points[i - 1]]
+        if len(points) < 2:
+            continue
+        for i, (x, y) in enumerate(points):
+            if i == 0:
+                commands.append(1 | 1 << 3)  # MoveTo, 1 point
+            elif i == 1:
+                commands.append(2 | (len(points) - 1) << 3)  # LineTo, the other points
+            commands += [_zigzag(x - cursor_x), _zigzag(y - cursor_y)]
+            cursor_x, cursor_y = x, y
+    return commands
+
+
+def encode_tile_layer(name, lines):
+    """
+    Encode a vector tile with one layer, whose only feature is the given lines.
+
+    Parameters:
+    - name (str): Name of the layer (e.g. 'adm2').
+    - lines (list): Arrays of integer (x, y) tile coordinates, one per line.
+
+    Returns:
+    - tile (bytes): The tile, empty if no line is left.
+    """
+    commands = _line_commands(lines)
+    if not commands:
+        return b''
+    geometry = b''.join(_varint(c) for c in commands)
+    feature = _varint(3 << 3) + _varint(2) + _field(4, geometry)  # type: LINESTRING
+    layer = (_varint(15 << 3) + _varint(2)                        # version
+             + _field(1, name.encode('utf-8'))
+             + _field(2, feature)
+             + _varint(5 << 3) + _varint(TILE_EXTENT))
+    return _field(3, layer)
+
+
+def render_tile(level, z, x, y):
+    """
+    Build the vector tile of the outlines of an admin level.
+
+    Returns:
+    - tile (bytes): The Mapbox Vector Tile, empty outside Haiti or below the first zoom of the level.
+    """
+    import numpy as np
+    from shapely import box, clip_by_rect, get_coordinates, get_parts
+
+    if z < TILE_LEVELS[level]:
+        return b''
+    min_x, min_y, max_x, max_y = tile_bounds(z, x, y)
+    size = max_x - min_x
+    buffer = size * TILE_BUFFER / TILE_EXTENT
+
+    clip = (min_x - buffer, min_y - buffer, max_x + buffer, max_y + buffer)
+
+    # Only the parts of the outlines near the tile are clipped
+    parts, tree = _zoom_index(level, z)
+    lines = []
+    for line in parts[tree.query(box(*clip))]:
+        for part in get_parts(clip_by_rect(line, *clip)):
+            if part.is_empty:
+                continue
+            coordinates = get_coordinates(part)
+            # Tile coordinates: from the top-left corner, y downwards
+            points = np.rint(np.column_stack([
+                (coordinates[:, 0] - min_x) / size * TILE_EXTENT,
+                (max_y - coordinates[:, 1]) / size * TILE_EXTENT,
+            ])).astype(int)
+            lines.append([tuple(p) for p in points.tolist()])
+    return encode_tile_layer(level, lines)
+
+
+# --- On-disk cache and tile server ---
+
+@lru_cache(maxsize=None)
+def tile_cache_dir(shapefile_dir=SHAPEFILE_DIR):
+    """
+    Return the folder of the cached tiles, named after the content of the shapefiles.
+
+    The tiles live in a '.cache' directory next to the shapefiles, e.g.
+    'Shapefiles/hti_adm_cnigs_20181129/.cache/tiles-1a2b3c4d-v1'.
+    """
+    digest = hashlib.sha1()
+    for level in TILE_LEVELS:
+        with open(os.path.join(shapefile_dir, SHAPEFILES[level]), 'rb') as f:
+            digest.update(f.read())
+    return os.path.join(shapefile_dir, CACHE_DIR_NAME, f"tiles-{digest.hexdigest()[:8]}-v{TILES_VERSION}")
+
+
+def get_tile(level, z, x, y):
+    """
+    Return a vector tile, from the on-disk cache or rendered and cached.
+
+    Returns:
+    - tile (bytes): The tile (see render_tile).
+    """
+    path = os.path.join(tile_cache_dir(), level, str(z), str(x), f"{y}.pbf")
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    tile = render_tile(level, z, x, y)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Written under another name and renamed, so that no request reads half a tile
+    temporary = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    with open(temporary, 'wb') as f:
+        f.write(tile)
+    os.replace(temporary, path)
+    return tile
+
+
+def pregenerate_tiles(max_zoom=TILE_PREGENERATED_MAX_ZOOM):
+    """
+    Render and cache the tiles covering Haiti of every level, up to `max_zoom`.
+
+    Returns:
+    - count (int): The number of tiles with outlines.
+    """
+    count = 0
+    for level, min_zoom in TILE_LEVELS.items():
+        for z in range(min_zoom, max_zoom + 1):
+            columns, rows = tile_range(z)
+            count += sum(len(get_tile(level, z, x, y)) > 0 for x in columns for y in rows)
+        logging.info(f"Tiles {level}: zooms {min_zoom}-{max_zoom} cached in {tile_cache_dir()}")
+    return count
+
+
+def tiles_app():
+    """
+    Return the ASGI app serving the vector tiles at /<level>/<z>/<x>/<y>.pbf.
+
+    Returns:
+    - app (starlette.applications.Starlette)
+    """
+    from starlette.applications import Starlette
+    from starlette.responses import Response
+    from starlette.routing import Route
+
+    def tile(request):
+        level = request.path_params['level']
+        z, x, y = (request.path_params[k] for k in ('z', 'x', 'y'))
+        if level not in TILE_LEVELS or z > TILE_MAX_ZOOM or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+            return Response(status_code=404)
+        # Cached by the browser for a day: the tiles only change with the shapefiles
+        return Response(get_tile(level, z, x, y), media_type='application/vnd.mapbox-vector-tile',
+                        headers={'Cache-Control': 'public, max-age=86400'})
+
+    return Starlette(routes=[Route('/{level}/{z:int}/{x:int}/{y:int}.pbf', tile)])
+
+
+def with_tile_server(app):
+    """
+    Serve the vector tiles next to a Shiny app, at /tiles, and make its map use them.
+
+    Usage, in main.py: `app = with_tile_server(App(app_ui, server, static_assets=...))`.
+    Without it, the map draws the outlines from the static GeoJSON files of boundaries.py.
+    A readiness check is served at /healthz as well: 200 once the map data is
+    loaded, 503 until then or if it could not be loaded.
+
+    Parameters:
+    - app (shiny.App): The Shiny app, mounted at the root.
+
+    Returns:
+    - app (starlette.applications.Starlette)
+    """
+    from starlette.applications import Starlette
+    from starlette.responses import PlainTextResponse
+    from starlette.routing import Mount, Route
+
+    def health(request):
+        # Imported here: the map module imports this one
+        from .map import map_data_ready
+        if map_data_ready():
+            return PlainTextResponse('ok')
+        return PlainTextResponse('map data not loaded', status_code=503)
+
+    _state['mounted'] = True
+    return Starlette(routes=[
+        Route(f"/{HEALTH_URL}", health),
+        Mount(f"/{TILES_URL}", app=tiles_app()),
+        Mount('/', app=app),
+    ])
+
+
+def tile_server_mounted():
+    """Return whether the vector tiles are served next to the app (see with_tile_server)."""
+    return _state['mounted']
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(f"{pregenerate_tiles()} tiles cached in {tile_cache_dir()}")
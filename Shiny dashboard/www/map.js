@@ -0,0 +1,240 @@
+// www/map.js
+//
+// Leaflet map of the "Carte du Score de MFS" tab. The map, its base layers and
+// boundaries (vector tiles, or GeoJSON files without the tile server of
+// modules/tiles.py) are created once per page, from the 'mfs_map_init' message. The
+// 'mfs_map_features' message sends the markets of a cycle with every indicator,
+// and the 'mfs_map_indicator' message selects the indicator shown: both only
+// restyle the markers of the markets. The 'mfs_map_areas' message shades the
+// admin units of a level by the scores of their markets, instead of the markers.
+// The handlers are also exposed as window.mfsMap, for the static export of
+// modules/export.py.
+
+(function () {
+    var state = {
+        map: null, cluster: null, legend: null, markers: {}, features: null, indicator: null,
+        areaUrls: {}, areaLayers: {}, areas: null
+    };
+
+    function popupValue(value, decimals) {
+        return typeof value === 'number' ? value.toFixed(decimals) : value;
+    }
+
+    function popupContent(name, current, previous) {
+        // Built from text nodes, so that market names are never read as HTML
+        var table = document.createElement('table');
+        table.style.width = '220px';
+        [[name, true], [current, false], [previous, false]].forEach(function (cell) {
+            var td = table.insertRow().insertCell();
+            if (cell[1]) {
+                td.colSpan = 2;
+                td.appendChild(document.createElement('b')).textContent = cell[0];
+            } else {
+                td.textContent = cell[0];
+                table.rows[table.rows.length - 1].insertCell();
+            }
+        });
+        return table;
+    }
+
+    function initMap(message) {
+        if (state.map !== null) {
+            return;
+        }
+        var map = L.map(message.id, { center: message.center, zoom: message.zoom });
+        var base = L.tileLayer(message.tiles.url, {
+            attribution: message.tiles.attribution,
+            subdomains: 'abcd',
+            maxZoom: 20
+        }).addTo(map);
+
+        var overlays = {};
+        message.boundaries.forEach(function (boundary) {
+            var layer;
+            if (boundary.tiles !== undefined) {
+                // Vector tiles: only the outlines of the visible tiles, from the first zoom of the level
+                var styles = {};
+                styles[boundary.level] = boundary.style;
+                layer = L.vectorGrid.protobuf(boundary.tiles, {
+                    vectorTileLayerStyles: styles,
+                    minZoom: boundary.minZoom,
+                    maxNativeZoom: boundary.maxNativeZoom,
+                    interactive: false
+                });
+            } else {
+                layer = L.geoJson(null, { style: boundary.style, interactive: false });
+                fetch(boundary.url)
+                    .then(function (response) { return response.json(); })
+                    .then(function (data) { layer.addData(data); });
+            }
+            overlays[boundary.name] = layer.addTo(map);
+        });
+
+        state.cluster = L.markerClusterGroup().addTo(map);
+        overlays[message.markers_name] = state.cluster;
+        L.control.layers({ [message.tiles.name]: base }, overlays).addTo(map);
+
+        state.legend = L.control({ position: 'bottomright' });
+        state.legend.onAdd = function () {
+            return L.DomUtil.create('div', 'map-legend-control');
+        };
+        state.legend.addTo(map);
+        state.areaUrls = message.areas;
+        state.map = map;
+        refresh();
+    }
+
+    function updateMarkers() {
+        if (state.features === null) {
+            return;
+        }
+        var key = state.indicator;
+        var indicator = state.features.indicators[key];
+        var seen = {};
+        var added = [];
+        state.features.features.forEach(function (feature) {
+            var p = feature.properties;
+            if (p[key] === null) {
+                return;
+            }
+            var name = p.marketplace;
+            var latlng = [feature.geometry.coordinates[1], feature.geometry.coordinates[0]];
+            var icon = L.AwesomeMarkers.icon({ icon: indicator.icon, prefix: 'fa', markerColor: p[key + '_color'] });
+            var popup = popupContent(
+                name,
+                'Cycle actuel: ' + popupValue(p[key], indicator.decimals),
+                p[key + '_prev'] === null ? '(Pas de cycle précédent)'
+                    : 'Cycle précédent: ' + popupValue(p[key + '_prev'], indicator.decimals)
+            );
+            var marker = state.markers[name];
+            if (marker === undefined) {
+                marker = L.marker(latlng, { icon: icon });
+                marker.bindPopup(popup, { maxWidth: 250 });
+                state.markers[name] = marker;
+                added.push(marker);
+            } else {
+                marker.setLatLng(latlng);
+                marker.setIcon(icon);
+                marker.setPopupContent(popup);
+            }
+            seen[name] = true;
+        });
+
+        var removed = [];
+        Object.keys(state.markers).forEach(function (name) {
+            if (!seen[name]) {
+                removed.push(state.markers[name]);
+                delete state.markers[name];
+            }
+        });
+        state.cluster.removeLayers(removed);
+        state.cluster.addLayers(added);
+        state.cluster.refreshClusters();
+
+        state.legend.getContainer().innerHTML = indicator.legend;
+    }
+
+    function areaStyle(feature) {
+        var area = state.areas.areas[feature.properties.pcode];
+        var key = state.indicator;
+        if (area === undefined || area[key] === null) {
+            return { fillOpacity: 0, weight: 0 };
+        }
+        return { fillColor: area[key + '_color'], fillOpacity: 0.7, color: 'white', weight: 0.5 };
+    }
+
+    function areaTooltip(layer) {
+        var pcode = layer.feature.properties.pcode;
+        var area = state.areas === null ? undefined : state.areas.areas[pcode];
+        var key = state.indicator;
+        var tooltip = document.createElement('div');
+        tooltip.appendChild(document.createElement('b')).textContent = layer.feature.properties.name;
+        var text = document.createElement('div');
+        if (area === undefined || area[key] === null) {
+            text.textContent = 'Aucun marché évalué';
+        } else {
+            var label = state.features === null ? key : state.features.indicators[key].label;
+            text.textContent = label + ': ' + popupValue(area[key], state.areas.indicators[key].decimals)
+                + ' (' + area.markets + (area.markets > 1 ? ' marchés)' : ' marché)');
+        }
+        tooltip.appendChild(text);
+        return tooltip;
+    }
+
+    function areaLayer(level) {
+        // Created, and its polygons fetched, the first time the level is shown
+        if (state.areaLayers[level] === undefined) {
+            var layer = L.geoJson(null, { style: areaStyle });
+            layer.bindTooltip(areaTooltip, { sticky: true });
+            fetch(state.areaUrls[level])
+                .then(function (response) { return response.json(); })
+                .then(function (data) {
+                    layer.addData(data);
+                    refresh();
+                });
+            state.areaLayers[level] = layer;
+        }
+        return state.areaLayers[level];
+    }
+
+    function refresh() {
+        if (state.map === null || state.indicator === null) {
+            return;
+        }
+        var level = state.areas === null ? null : state.areas.level;
+        Object.keys(state.areaLayers).forEach(function (name) {
+            if (name !== level && state.map.hasLayer(state.areaLayers[name])) {
+                state.map.removeLayer(state.areaLayers[name]);
+            }
+        });
+        if (level === null) {
+            if (!state.map.hasLayer(state.cluster)) {
+                state.map.addLayer(state.cluster);
+            }
+            updateMarkers();
+            return;
+        }
+        if (state.map.hasLayer(state.cluster)) {
+            state.map.removeLayer(state.cluster);
+        }
+        var layer = areaLayer(level);
+        if (!state.map.hasLayer(layer)) {
+            layer.addTo(state.map);
+        }
+        layer.setStyle(areaStyle);
+        state.legend.getContainer().innerHTML = state.areas.indicators[state.indicator].legend;
+    }
+
+    // Leaflet cannot measure a map created in a hidden tab
+    document.addEventListener('shown.bs.tab', function () {
+        if (state.map !== null) {
+            state.map.invalidateSize();
+        }
+    });
+
+    // The handlers of the messages, also called by the static export (see www/router.js)
+    window.mfsMap = {
+        init: initMap,
+        features: function (message) {
+            state.features = JSON.parse(message.payload);
+            refresh();
+        },
+        indicator: function (message) {
+            state.indicator = message.indicator;
+            refresh();
+        },
+        areas: function (message) {
+            state.areas = message.payload === null ? null : JSON.parse(message.payload);
+            refresh();
+        }
+    };
+
+    if (window.jQuery !== undefined) {
+        $(document).on('shiny:connected', function () {
+            Shiny.addCustomMessageHandler('mfs_map_init', window.mfsMap.init);
+            Shiny.addCustomMessageHandler('mfs_map_features', window.mfsMap.features);
+            Shiny.addCustomMessageHandler('mfs_map_indicator', window.mfsMap.indicator);
+            Shiny.addCustomMessageHandler('mfs_map_areas', window.mfsMap.areas);
+        });
+    }
+})();
@@ -0,0 +1,34 @@
+// www/plots.js
+//
+// Plots of the "Indicateurs non tarifaires" tab, drawn by Plotly.js. The
+// 'indicateurs_plot' message sends the JSON spec (data and layout) of the figure
+// of an output, built and cached by the server; the template shared by every
+// figure comes with the first message of the session only.
+
+(function () {
+    var template = null;
+
+    function drawPlot(message) {
+        var el = document.getElementById(message.id);
+        if (el === null) {
+            return;
+        }
+        if (message.template !== undefined) {
+            template = message.template;
+        }
+        var spec = JSON.parse(message.payload);
+        var layout = Object.assign({}, spec.layout || {}, { template: template });
+        Plotly.react(el, spec.data || [], layout, { responsive: true });
+    }
+
+    // Plotly cannot measure a plot drawn in a hidden tab
+    document.addEventListener('shown.bs.tab', function () {
+        document.querySelectorAll('.indicateurs-plot.js-plotly-plot').forEach(function (el) {
+            Plotly.Plots.resize(el);
+        });
+    });
+
+    $(document).on('shiny:connected', function () {
+        Shiny.addCustomMessageHandler('indicateurs_plot', drawPlot);
+    });
+})();
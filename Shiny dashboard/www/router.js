@@ -0,0 +1,165 @@
+// www/router.js
+//
+// Router of the static export of the dashboard (modules/export.py), which the
+// Shiny app does not load. views.json lists the dropdowns of each tab and the
+// file of each combination of their values: the router builds the dropdowns,
+// keeps the selection in the URL (e.g. '#prix/2/ABNA/...') and shows the file
+// of the selected view. The map is drawn by www/map.js, from the same messages
+// as in the app.
+
+(function () {
+    var site = null;
+    var files = {};
+    var mapCreated = false;
+
+    function load(path) {
+        // Each file is fetched once
+        if (files[path] === undefined) {
+            files[path] = fetch(path).then(function (response) { return response.text(); });
+        }
+        return files[path];
+    }
+
+    function section(tab) {
+        return document.getElementById('tab-' + tab);
+    }
+
+    function select(tab, id) {
+        return section(tab).querySelector('select[name="' + id + '"]');
+    }
+
+    function values(tab) {
+        // {input id: value}, empty for a dropdown whose switch is off (see export.view_keys)
+        var current = {};
+        site[tab].controls.forEach(function (control) {
+            current[control.id] = select(tab, control.id).value;
+        });
+        site[tab].controls.forEach(function (control) {
+            if (control.when !== null && current[control.when] !== '1') {
+                current[control.id] = '';
+            }
+        });
+        return current;
+    }
+
+    function viewKey(tab, current) {
+        return site[tab].controls.map(function (control) { return current[control.id]; }).join('|');
+    }
+
+    function buildControls(tab) {
+        var sidebar = section(tab).querySelector('.static-sidebar');
+        site[tab].controls.forEach(function (control) {
+            var div = sidebar.appendChild(document.createElement('div'));
+            div.className = 'custom-select';
+            div.dataset.control = control.id;
+            var label = div.appendChild(document.createElement('label'));
+            label.className = 'custom-select-label';
+            label.textContent = control.label;
+            var dropdown = div.appendChild(document.createElement('select'));
+            dropdown.name = control.id;
+            Object.keys(control.choices).forEach(function (value) {
+                var option = dropdown.appendChild(document.createElement('option'));
+                option.value = value;
+                option.textContent = control.choices[value];
+            });
+            if (control.selected !== null) {
+                dropdown.value = control.selected;
+            }
+            dropdown.addEventListener('change', function () { navigate(tab); });
+        });
+    }
+
+    function showControls(tab) {
+        // The dropdowns of a switch are only shown when it is on
+        site[tab].controls.forEach(function (control) {
+            if (control.when !== null) {
+                var on = select(tab, control.when).value === '1';
+                section(tab).querySelector('[data-control="' + control.id + '"]').style.display = on ? '' : 'none';
+            }
+        });
+    }
+
+    function renderMap(current) {
+        var map = site.map;
+        if (!mapCreated) {
+            window.mfsMap.init(map.init);
+            mapCreated = true;
+        }
+        var features = map.features[current.cycle_select_map];
+        var areas = map.areas[current.cycle_select_map + '|' + current.map_mode];
+        window.mfsMap.indicator({ indicator: current.indicator_select });
+        if (features !== undefined) {
+            load(features).then(function (payload) { window.mfsMap.features({ payload: payload }); });
+        }
+        if (areas === undefined) {
+            window.mfsMap.areas({ payload: null });
+        } else {
+            load(areas).then(function (payload) {
+                // Only if the admin units are still selected
+                if (values('map').map_mode === current.map_mode) {
+                    window.mfsMap.areas({ payload: payload });
+                }
+            });
+        }
+    }
+
+    function render(tab) {
+        showControls(tab);
+        var current = values(tab);
+        if (tab === 'map') {
+            renderMap(current);
+            return;
+        }
+        var content = section(tab).querySelector('.static-content');
+        var path = site[tab].views[viewKey(tab, current)];
+        if (path === undefined) {
+            content.innerHTML = '<p>Aucune donnée disponible pour les sélections actuelles.</p>';
+            return;
+        }
+        load(path).then(function (html) {
+            // Only the latest selection is shown
+            if (viewKey(tab, values(tab)) === viewKey(tab, current)) {
+                content.innerHTML = html;
+            }
+        });
+    }
+
+    function navigate(tab) {
+        var parts = site[tab].controls.map(function (control) {
+            return encodeURIComponent(select(tab, control.id).value);
+        });
+        location.hash = [tab].concat(parts).join('/');
+    }
+
+    function route() {
+        var parts = location.hash.replace(/^#/, '').split('/');
+        var tab = site[parts[0]] !== undefined ? parts[0] : 'prix';
+        site[tab].controls.forEach(function (control, i) {
+            var value = parts[i + 1] === undefined ? undefined : decodeURIComponent(parts[i + 1]);
+            if (value !== undefined && control.choices[value] !== undefined) {
+                select(tab, control.id).value = value;
+            }
+        });
+
+        Object.keys(site).forEach(function (name) {
+            section(name).classList.toggle('active', name === tab);
+        });
+        document.querySelectorAll('.static-nav a').forEach(function (link) {
+            link.classList.toggle('active', link.dataset.tab === tab);
+        });
+        render(tab);
+        // As when a tab of the app is shown, so that the map measures its container
+        document.dispatchEvent(new Event('shown.bs.tab'));
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        fetch('views.json')
+            .then(function (response) { return response.json(); })
+            .then(function (data) {
+                site = data;
+                Object.keys(site).forEach(buildControls);
+                window.addEventListener('hashchange', route);
+                route();
+            });
+    });
+})();